@@ -2,7 +2,8 @@
 The repo package handles finding, loading and searching starbash repositories.
 """
 
+from .cache import ConfigCache
 from .manager import RepoManager
 from .repo import Repo, repo_suffix, REPO_REF
 
-__all__ = ["RepoManager", "Repo", "repo_suffix", "REPO_REF"]
+__all__ = ["ConfigCache", "RepoManager", "Repo", "repo_suffix", "REPO_REF"]
@@ -0,0 +1,105 @@
+"""
+An on-disk cache of parsed repo configs, so unchanged starbash.toml files needn't be
+parsed by tomlkit (which is slow) every time starbash starts.
+"""
+
+from __future__ import annotations
+import logging
+import os
+import pickle
+import tempfile
+from pathlib import Path
+from typing import Any
+
+# Bump this whenever the format of the cached data changes
+CACHE_VERSION = 1
+
+# (mtime in ns, size) of a config file, cached configs are only used if it still matches
+FileSignature = tuple[int, int]
+
+
+class ConfigTable(dict):
+    """A table from a cached config.
+
+    Unlike a plain dict it can have attributes, so RepoManager can record which repo
+    it came from (like it does for tomlkit tables).
+    """
+
+
+def to_tables(value: Any) -> Any:
+    """Convert the dicts in a (cached) plain python config into ConfigTables."""
+    if isinstance(value, dict):
+        return ConfigTable((k, to_tables(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return [to_tables(v) for v in value]
+    return value
+
+
+def file_signature(path: Path) -> FileSignature | None:
+    """Return the signature of a config file, or None if it doesn't exist."""
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+class ConfigCache:
+    """
+    Parsed repo configs (as plain python values) keyed by repo URL, each stored with
+    the signature of the file it was parsed from.
+
+    The whole cache is a single pickle file, read once when first needed and rewritten
+    (atomically) whenever a config had to be parsed.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._entries: dict[str, tuple[FileSignature, dict[str, Any]]] | None = None
+
+    def _load(self) -> dict[str, tuple[FileSignature, dict[str, Any]]]:
+        if self._entries is None:
+            self._entries = {}
+            try:
+                with open(self.path, "rb") as f:
+                    version, entries = pickle.load(f)
+                if version == CACHE_VERSION:
+                    self._entries = entries
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                # A corrupt (or incompatible) cache is simply rebuilt
+                logging.debug(f"Ignoring repo config cache {self.path}: {e}")
+        return self._entries
+
+    def get(self, url: str, signature: FileSignature) -> dict[str, Any] | None:
+        """
+        Returns the cached config of a repo (as ConfigTables), or None if there isn't
+        one for this version of its config file.
+        """
+        entry = self._load().get(url)
+        if entry is None or entry[0] != signature:
+            return None
+        return to_tables(entry[1])
+
+    def put(self, url: str, signature: FileSignature, config: dict[str, Any]) -> None:
+        """
+        Stores the config of a repo (plain python values, i.e. TOMLDocument.unwrap()).
+        """
+        entries = self._load()
+        entries[url] = (signature, config)
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(
+                dir=self.path.parent, prefix=f".{self.path.name}.", suffix=".tmp"
+            )
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    pickle.dump((CACHE_VERSION, entries), f)
+                os.replace(temp_path, self.path)
+            except BaseException:
+                os.unlink(temp_path)
+                raise
+        except OSError as e:
+            # The cache is only an optimization
+            logging.debug(f"Failed to write repo config cache {self.path}: {e}")
@@ -12,6 +12,7 @@ import tomlkit
 from tomlkit.toml_file import TOMLFile
 from tomlkit.items import AoT
 from multidict import MultiDict
+from repo.cache import ConfigCache
 from repo.repo import Repo
 
 
@@ -24,18 +25,25 @@ class RepoManager:
     files (like appdefaults.sb.toml).
     """
 
-    def __init__(self):
+    def __init__(self, cache_path: Path | None = None):
         """
         Initializes the RepoManager by loading the application default repos.
+
+        Args:
+            cache_path: If set, parsed repo configs are cached in this file (see
+                ConfigCache), so unchanged configs needn't be parsed again.
         """
         self.repos = []
+        self.config_cache = ConfigCache(cache_path) if cache_path else None
 
         # We expose the app default preferences as a special root repo with a private URL
         # root_repo = Repo(self, "pkg://starbash-defaults", config=app_defaults)
         # self.repos.append(root_repo)
 
-        # Most users will just want to read from merged
-        self.merged = MultiDict()
+        # The merged views of the repo configs, built on first use (see _build_merged)
+        self._merged: MultiDict | None = None
+        # dotted key -> every value it has, in the order the repos were added
+        self._flattened: dict[str, list[Any]] | None = None
 
     @property
     def regular_repos(self) -> list[Repo]:
@@ -50,15 +58,29 @@ class RepoManager:
         logging.debug(f"Adding repo: {url}")
         r = Repo(self, url)
         self.repos.append(r)
-
-        # FIXME, generate the merged dict lazily
-        self._add_merged(r)
+        self.invalidate()
 
         # if this new repo has sub-repos, add them too
         r.add_by_repo_refs()
 
         return r
 
+    @property
+    def merged(self) -> MultiDict:
+        """The top-level keys and values of all the repos (most users read this)."""
+        if self._merged is None:
+            self._build_merged()
+        assert self._merged is not None
+        return self._merged
+
+    def invalidate(self) -> None:
+        """Forget the merged config, it is rebuilt when next needed.
+
+        Called when a repo is added or changes its config (see Repo.set).
+        """
+        self._merged = None
+        self._flattened = None
+
     def get(self, key: str, default=None):
         """
         Searches for a key across all repositories and returns the first value found.
@@ -72,13 +94,25 @@ class RepoManager:
         Returns:
             The found value or the default.
         """
-        # Iterate in reverse to give precedence to later-loaded repos
-        for repo in reversed(self.repos):
-            value = repo.get(key)
-            if value is not None:
-                return value
+        values = self._flattened_config().get(key)
+        return values[-1] if values else default
 
-        return default
+    def get_all(self, key: str) -> list[Any]:
+        """
+        Returns the values of a key in every repository, in the order the repos were
+        loaded (i.e. all of the [[stages]] tables, wherever they were defined).
+
+        Args:
+            key: The dot-separated key to search for (e.g., "stages").
+        """
+        return list(self._flattened_config().get(key, []))
+
+    def _flattened_config(self) -> dict[str, list[Any]]:
+        """The dotted key -> values lookup table (built on first use)."""
+        if self._flattened is None:
+            self._build_merged()
+        assert self._flattened is not None
+        return self._flattened
 
     def dump(self):
         """
@@ -94,16 +128,36 @@ class RepoManager:
             # For a debug dump, a simple string representation is usually sufficient.
             logging.info(f"  %s: %s", key, value)
 
+    def _build_merged(self) -> None:
+        """Build merged and the flattened lookup table from all of the repo configs."""
+        self._merged = MultiDict()
+        self._flattened = {}
+        for repo in self.repos:
+            self._add_merged(repo)
+            self._add_flattened(repo.data, "")
+
+    def _add_flattened(self, table: dict, prefix: str) -> None:
+        """Add the values of a (nested) table to the flattened lookup table."""
+        assert self._flattened is not None
+        for key, value in table.items():
+            dotted = prefix + key
+            self._flattened.setdefault(dotted, []).append(value)
+            if isinstance(value, dict):
+                self._add_flattened(value, dotted + ".")
+
     def _add_merged(self, repo: Repo) -> None:
-        for key, value in repo.config.items():
-            # if the toml object is an AoT type, monkey patch each element in the array instead
-            if isinstance(value, AoT):
+        assert self._merged is not None
+        for key, value in repo.data.items():
+            # if the toml object is an AoT type (a list of tables once cached), monkey
+            # patch each element in the array instead
+            if isinstance(value, (AoT, list)):
                 for v in value:
-                    setattr(v, "source", repo)
-                else:
-                    # We monkey patch source into any object that came from a repo, so that users can
-                    # find the source repo (for attribution, URL relative resolution, whatever...)
-                    setattr(value, "source", repo)
+                    if isinstance(v, dict):
+                        setattr(v, "source", repo)
+            elif isinstance(value, dict):
+                # We monkey patch source into any object that came from a repo, so that users can
+                # find the source repo (for attribution, URL relative resolution, whatever...)
+                setattr(value, "source", repo)
 
             self.merged.add(key, value)
 
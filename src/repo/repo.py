@@ -1,14 +1,17 @@
 from __future__ import annotations
 import logging
+import os
+import tempfile
 from pathlib import Path
 from importlib import resources
 from typing import Any, TYPE_CHECKING
 
 import tomlkit
-from tomlkit.toml_file import TOMLFile
 from tomlkit.items import AoT
 from multidict import MultiDict
 
+from repo.cache import file_signature
+
 if TYPE_CHECKING:
     from repo.manager import RepoManager
 
@@ -30,7 +33,30 @@ class Repo:
         """
         self.manager = manager
         self.url = url
-        self.config = self._load_config()
+        self._config: tomlkit.TOMLDocument | None = None  # see config
+        self._data: dict[str, Any] = self._load_data()
+
+    @property
+    def config(self) -> tomlkit.TOMLDocument:
+        """
+        The repository's config as a tomlkit document, for changing (and writing back).
+
+        If the config was loaded from the cache, the file is only parsed now.
+        """
+        if self._config is None:
+            self._config = self._load_config()
+            self._data = self._config
+        return self._config
+
+    @property
+    def data(self) -> dict[str, Any]:
+        """
+        The repository's config for reading (don't change it, use set() instead).
+
+        This is the cached copy of the config if the file hasn't changed since it was
+        last parsed, otherwise the tomlkit document.
+        """
+        return self._data
 
     def __str__(self) -> str:
         """Return a concise one-line description of this repo.
@@ -80,6 +106,20 @@ class Repo:
         # Also add the repo to the manager
         return self.add_from_ref(ref)
 
+    def remove_repo_ref(self, url: str) -> bool:
+        """
+        Removes a repo-ref (given as its dir or file:// URL) from this repository's
+        configuration.  Returns False if there was no such repo-ref."""
+        aot = self.config.get(REPO_REF, None)
+        for ref in list(aot or []):
+            ref_dir = ref.get("dir", "")
+            # Match by converting to file:// URL format if needed
+            if ref_dir == url or f"file://{ref_dir}" == url:
+                aot.remove(ref)
+                self.manager.invalidate()
+                return True
+        return False
+
     def write_config(self) -> None:
         """
         Writes the current (possibly modified) configuration back to the repository's config file.
@@ -92,9 +132,30 @@ class Repo:
             raise ValueError("Cannot resolve path for non-local repository")
 
         config_path = base_path / repo_suffix
-        # FIXME, be more careful to write the file atomically (by writing to a temp file and renaming)
-        TOMLFile(config_path).write(self.config)
+        # Write a temp file next to the config and rename it over the original, so a
+        # crash (or full disk) can never leave a truncated config behind
+        fd, temp_path = tempfile.mkstemp(
+            dir=base_path, prefix=f".{repo_suffix}.", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+                f.write(self.config.as_string())
+                f.flush()
+                os.fsync(f.fileno())
+            if config_path.exists():
+                mode = config_path.stat().st_mode & 0o7777
+            else:
+                # mkstemp files are private, but new configs get the usual permissions
+                umask = os.umask(0)
+                os.umask(umask)
+                mode = 0o666 & ~umask
+            os.chmod(temp_path, mode)
+            os.replace(temp_path, config_path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
         logging.debug(f"Wrote config to {config_path}")
+        self._cache_config(self.config)
 
     def is_scheme(self, scheme: str = "file") -> bool:
         """
@@ -149,7 +210,7 @@ class Repo:
 
     def add_by_repo_refs(self) -> None:
         """Add all repos mentioned by repo-refs in this repo's config."""
-        repo_refs = self.config.get(REPO_REF, [])
+        repo_refs = self._data.get(REPO_REF, [])
 
         for ref in repo_refs:
             self.add_from_ref(ref)
@@ -206,6 +267,44 @@ class Repo:
         res = resources.files("starbash").joinpath(subpath).joinpath(filepath)
         return res.read_text()
 
+    def _config_path(self) -> Path | None:
+        """The config file of this repo, if it is a file on disk."""
+        if self.is_scheme("file"):
+            base_path = self.get_path()
+            return base_path / repo_suffix if base_path else None
+        if self.is_scheme("pkg"):
+            subpath = self.url[len("pkg://") :].strip("/")
+            res = resources.files("starbash").joinpath(subpath).joinpath(repo_suffix)
+            return res if isinstance(res, Path) else None  # i.e. not inside a zip
+        return None
+
+    def _cache_config(self, config: tomlkit.TOMLDocument) -> None:
+        """Store the config in the manager's config cache (if it has one)."""
+        cache = self.manager.config_cache
+        path = self._config_path()
+        signature = file_signature(path) if cache and path else None
+        if cache and signature:
+            cache.put(self.url, signature, config.unwrap())
+
+    def _load_data(self) -> dict[str, Any]:
+        """
+        Loads the repository's config for reading, from the manager's config cache if
+        the config file is unchanged since it was cached.
+        """
+        cache = self.manager.config_cache
+        path = self._config_path()
+        signature = file_signature(path) if cache and path else None
+        if cache and signature:
+            cached = cache.get(self.url, signature)
+            if cached is not None:
+                logging.debug(f"Loaded repo config for {self.url} from cache")
+                return cached
+
+        self._config = self._load_config()
+        if cache and signature:
+            cache.put(self.url, signature, self._config.unwrap())
+        return self._config
+
     def _load_config(self) -> tomlkit.TOMLDocument:
         """
         Loads the repository's configuration file (e.g., repo.sb.toml).
@@ -242,7 +341,7 @@ class Repo:
         Returns:
             The found value or the default.
         """
-        value = self.config
+        value = self._data
         for k in key.split("."):
             if not isinstance(value, dict):
                 return default
@@ -278,3 +377,24 @@ class Repo:
 
         # Set the final value
         current[keys[-1]] = value
+        self.manager.invalidate()
+
+    def unset(self, key: str) -> bool:
+        """
+        Removes a value from this repo's config for a given (dot-separated) key, the
+        reverse of set().
+
+        Returns:
+            False if the key had no value.
+        """
+        keys = key.split(".")
+        current: Any = self.config
+        for k in keys[:-1]:
+            current = current.get(k)
+            if not isinstance(current, dict):
+                return False
+        if keys[-1] not in current:
+            return False
+        del current[keys[-1]]
+        self.manager.invalidate()
+        return True
@@ -4,7 +4,6 @@ import os
 import starbash
 from starbash import console, _is_test_env
 import starbash.url as url
-from sentry_sdk.integrations.excepthook import ExcepthookIntegration
 
 # Default to no analytics/auto crash reports
 analytics_allowed = False
@@ -15,6 +14,7 @@ def analytics_setup(allowed: bool = False, user_email: str | None = None) -> Non
     analytics_allowed = allowed
     if analytics_allowed:
         import sentry_sdk
+        from sentry_sdk.integrations.excepthook import ExcepthookIntegration
         from sentry_sdk.integrations.logging import LoggingIntegration
 
         logging.info(
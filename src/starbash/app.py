@@ -6,17 +6,30 @@ import typer
 import tomlkit
 from tomlkit.toml_file import TOMLFile
 import glob
-from typing import Any
-from astropy.io import fits
+from typing import Any, Callable, Iterable, Iterator
 import itertools
-from rich.progress import track
+import math
+from rich.progress import MofNCompleteColumn, Progress, TaskID, track
 from rich.logging import RichHandler
 import shutil
-from datetime import datetime
+import threading
+import time
+from contextlib import closing
 
 import starbash
-from starbash import console, _is_test_env
-from starbash.database import Database, SessionRow, ImageRow, get_column_name
+from starbash import calibration, console, _is_test_env
+from starbash.database import (
+    Database,
+    FileSignature,
+    SessionRow,
+    ImageRow,
+    file_signature,
+    get_column_name,
+    normalize_target_name,
+)
+from starbash.fitsheader import read_headers
+from starbash.walker import DEFAULT_INCLUDE, walk_files
+from starbash.watch import DEFAULT_SETTLE_SECONDS, WatchRoot, create_watcher, run_watch
 from repo import Repo, repo_suffix
 from starbash.toml import toml_from_template
 from starbash.tool import Tool
@@ -32,8 +45,15 @@ from starbash.analytics import (
     analytics_start_transaction,
 )
 
+# Parsed repo configs are cached in this file (in the user data dir)
+REPO_CONFIG_CACHE = "repo-config-cache.pickle"
+
 # Type aliases for better documentation
 
+# An image ready to be stored by Starbash._ingest:
+# (path, header, is_new, signature, content hash if deduplicating)
+IngestItem = tuple[str, dict[str, Any], bool, FileSignature | None, str | None]
+
 
 def setup_logging():
     """
@@ -115,20 +135,61 @@ def copy_images_to_dir(images: list[ImageRow], output_dir: Path) -> None:
 class Starbash:
     """The main Starbash application class."""
 
-    def __init__(self, cmd: str = "unspecified"):
+    # FITS headers used to build session entries
+    SESSION_HEADER_KEYS = (
+        Database.DATE_OBS_KEY,
+        Database.EXPTIME_KEY,
+        Database.FILTER_KEY,
+        Database.IMAGETYP_KEY,
+        Database.OBJECT_KEY,
+        Database.TELESCOP_KEY,
+    )
+
+    # Calibration frame types which get ranked candidates stored for each light session
+    # (see calibration_candidates)
+    LIGHT_TYPE = "LIGHT"
+    CALIBRATION_TYPES = ("BIAS", "DARK", "FLAT")
+
+    # Number of ranked candidates stored per (light session, calibration type)
+    MAX_CALIBRATION_MATCHES = 10
+
+    # Number of reference sessions guess_sessions_batch() scores at once (bounding the
+    # size of its score matrices)
+    CALIBRATION_CHUNK_SIZE = 256
+
+    def __init__(self, cmd: str = "unspecified", read_only: bool = False):
         """
         Initializes the Starbash application by loading configurations
         and setting up the repository manager.
+
+        Args:
+            cmd: Name of the command being run (for analytics).
+            read_only: The command only queries the database, so open it read-only
+                (which lets it run while another process is indexing).
         """
+        # Seconds taken by each step of starting up (see 'sb --profile-startup')
+        self.startup_times: dict[str, float] = {}
+        step_start = time.perf_counter()
+
+        def step_done(name: str) -> None:
+            nonlocal step_start
+            now = time.perf_counter()
+            self.startup_times[name] = now - step_start
+            step_start = now
+
         setup_logging()
         logging.info("Starbash starting...")
+        step_done("logging")
 
         # Load app defaults and initialize the repository manager
-        self.repo_manager = RepoManager()
+        self.repo_manager = RepoManager(
+            cache_path=get_user_data_dir() / REPO_CONFIG_CACHE
+        )
         self.repo_manager.add_repo("pkg://defaults")
 
         # Add user prefs as a repo
         self.user_repo = self.repo_manager.add_repo("file://" + str(create_user()))
+        step_done("repos")
 
         self.analytics = NopAnalytics()
         if self.user_repo.get("analytics.enabled", True):
@@ -142,17 +203,24 @@ class Starbash:
             # this is intended for use with "with" so we manually do enter/exit
             self.analytics = analytics_start_transaction(name="App session", op=cmd)
             self.analytics.__enter__()
+        step_done("analytics")
 
         logging.info(
             f"Repo manager initialized with {len(self.repo_manager.repos)} repos."
         )
         # self.repo_manager.dump()
 
-        self.db = Database()
+        promoted_keys = self.repo_manager.get("config.promoted-keys")
+        self.db = Database(read_only=read_only, promoted_keys=promoted_keys)
+        step_done("database")
+        # Ids of sessions which are new (or whose reference image changed) since the
+        # calibration matches were last updated
+        self._calibration_dirty: set[int] = set()
         self.session_query = None  # None means search all sessions
 
         # Initialize selection state (stored in user config repo)
         self.selection = Selection(self.user_repo)
+        step_done("selection")
 
         # FIXME, call reindex somewhere and also index whenever new repos are added
         # self.reindex_repos()
@@ -178,30 +246,67 @@ class Starbash:
 
     def _add_session(self, f: str, image_doc_id: int, header: dict) -> None:
         """We just added a new image, create or update its session entry as needed."""
-        filter = header.get(Database.FILTER_KEY, "unspecified")
-        image_type = header.get(Database.IMAGETYP_KEY)
-        date = header.get(Database.DATE_OBS_KEY)
-        if not date or not image_type:
-            logging.warning(
-                "Image %s missing either DATE-OBS or IMAGETYP FITS header, skipping...",
-                f,
-            )
-        else:
-            exptime = header.get(Database.EXPTIME_KEY, 0)
-            telescop = header.get(Database.TELESCOP_KEY, "unspecified")
-            new = {
-                Database.FILTER_KEY: filter,
-                Database.START_KEY: date,
-                Database.END_KEY: date,  # FIXME not quite correct, should be longer by exptime
-                Database.IMAGE_DOC_KEY: image_doc_id,
-                Database.IMAGETYP_KEY: image_type,
-                Database.NUM_IMAGES_KEY: 1,
-                Database.EXPTIME_TOTAL_KEY: exptime,
-                Database.OBJECT_KEY: header.get(Database.OBJECT_KEY, "unspecified"),
-                Database.TELESCOP_KEY: telescop,
-            }
-            session = self.db.get_session(new)
-            self.db.upsert_session(new, existing=session)
+        self._update_sessions([(f, header)])
+
+    def _update_sessions(
+        self,
+        images: list[tuple[str, dict[str, Any]]],
+        previous: list[ImageRow] | None = None,
+    ) -> None:
+        """Rebuild the sessions of images (path, header) which were added or changed.
+
+        Args:
+            images: (path, new header) of each image.
+            previous: The stored records of changed images, from before they were
+                      updated (so the sessions they used to be part of are rebuilt too).
+        """
+        touched: list[dict[str, Any]] = list(previous or [])
+        for f, header in images:
+            if header.get(Database.DATE_OBS_KEY) and header.get(Database.IMAGETYP_KEY):
+                touched.append(header)
+            else:
+                logging.warning(
+                    "Image %s missing either DATE-OBS or IMAGETYP FITS header, "
+                    "skipping...",
+                    f,
+                )
+        if touched:
+            # Extending a session doesn't change its reference image (so its scores)
+            self._calibration_dirty |= self.db.update_sessions(touched)
+
+    def _remove_from_session(self, image: ImageRow) -> None:
+        """An image was just removed from the DB, rebuild its session from the remaining images."""
+        self._calibration_dirty |= self.db.update_sessions([image])
+
+    def _remove_image(self, f: str) -> None:
+        """Forget an image whose file no longer exists (updating its session).
+
+        If a duplicate of the file still exists, that becomes the image's file instead.
+        """
+        if self.db.remove_alias(f):
+            logging.info("Removing vanished duplicate %s", f)
+            return
+        for alias in self.db.get_aliases(f):
+            if os.path.exists(alias):
+                logging.info("Image %s vanished, using its duplicate %s", f, alias)
+                self.db.promote_alias(alias)
+                return
+
+        image = self.db.remove_image(f)
+        if image:
+            logging.info("Removing vanished image %s", f)
+            self._remove_from_session(image)
+
+    def _rename_moved_image(self, f: str, signature: FileSignature) -> bool:
+        """If the new file f is really an already indexed file that was moved, rename it.
+
+        Returns True if f was recognised as a moved file."""
+        for old in self.db.find_images_by_signature(signature):
+            if old != f and not os.path.exists(old):
+                logging.info("Detected moved image %s -> %s", old, f)
+                self.db.rename_image(old, f)
+                return True
+        return False
 
     def guess_sessions(
         self, ref_session: SessionRow, want_type: str
@@ -230,16 +335,13 @@ class Starbash:
         """
         # Get reference image to access CCD-TEMP and DATE-OBS
         ref_image = self.get_session_image(ref_session)
-        ref_temp = ref_image.get("CCD-TEMP", None)
+        ref_temp = calibration.to_temperature(ref_image.get(Database.CCD_TEMP_KEY))
         ref_date_str = ref_image.get(Database.DATE_OBS_KEY)
 
         # Parse reference date for time delta calculations
-        ref_date = None
-        if ref_date_str:
-            try:
-                ref_date = datetime.fromisoformat(ref_date_str)
-            except (ValueError, TypeError):
-                logging.warning(f"Malformed session ref date: {ref_date_str}")
+        ref_epoch = calibration.to_epoch(ref_date_str)
+        if ref_date_str and math.isnan(ref_epoch):
+            logging.warning(f"Malformed session ref date: {ref_date_str}")
 
         # Build search conditions - MUST match criteria
         conditions = {
@@ -253,69 +355,229 @@ class Starbash:
                 get_column_name(Database.FILTER_KEY)
             ]
 
-        # Search for candidate sessions
-        candidates = self.db.search_session(where_tuple(conditions))
+        # Search for candidate sessions (and the metadata of their reference images)
+        candidates = self.db.search_session_images(
+            where_tuple(conditions), [Database.CCD_TEMP_KEY, Database.DATE_OBS_KEY]
+        )
 
         # Now score and sort the candidates
         scored_candidates = []
 
-        for candidate in candidates:
-            score = 0.0
+        for candidate, candidate_image in self._scorable_candidates(candidates):
+            candidate_temp, candidate_epoch = candidate_image
 
-            # Get candidate image metadata to access CCD-TEMP and DATE-OBS
-            try:
-                candidate_image = self.get_session_image(candidate)
-
-                # Score by CCD-TEMP difference (most important)
-                # Lower temperature difference = better score
-                if ref_temp is not None:
-                    candidate_temp = candidate_image.get("CCD-TEMP")
-                    if candidate_temp is not None:
-                        try:
-                            temp_diff = abs(float(ref_temp) - float(candidate_temp))
-                            # Use exponential decay: closer temps get much better scores
-                            # Perfect match (0°C diff) = 1000, 1°C diff ≈ 368, 2°C diff ≈ 135
-                            score += 1000 * (2.718 ** (-temp_diff))
-                        except (ValueError, TypeError):
-                            # If we can't parse temps, give a neutral score
-                            score += 0
-
-                # Score by date/time proximity (secondary importance)
-                if ref_date is not None:
-                    candidate_date_str = candidate_image.get(Database.DATE_OBS_KEY)
-                    if candidate_date_str:
-                        try:
-                            candidate_date = datetime.fromisoformat(candidate_date_str)
-                            time_delta = abs(
-                                (ref_date - candidate_date).total_seconds()
-                            )
-                            # Closer in time = better score
-                            # Same day ≈ 100, 7 days ≈ 37, 30 days ≈ 9
-                            # Using 7-day half-life
-                            score += 100 * (2.718 ** (-time_delta / (7 * 86400)))
-                        except (ValueError, TypeError):
-                            logging.warning(
-                                f"Could not parse candidate date: {candidate_date_str}"
-                            )
-
-                scored_candidates.append((score, candidate))
-
-            except (AssertionError, KeyError) as e:
+            # CCD-TEMP difference is most important, date/time proximity secondary
+            score = calibration.score_candidate(
+                ref_temp, ref_epoch, candidate_temp, candidate_epoch
+            )
+            scored_candidates.append((score, candidate))
+
+        # Sort by score (highest first) and return just the sessions
+        scored_candidates.sort(key=lambda x: x[0], reverse=True)
+
+        return [candidate for score, candidate in scored_candidates]
+
+    def guess_sessions_batch(
+        self, ref_sessions: list[SessionRow], want_type: str
+    ) -> list[list[SessionRow]]:
+        """Like guess_sessions(), but for many reference sessions at once.
+
+        The reference sessions are grouped by what candidates MUST match (telescope,
+        and filter for flats), each group's candidates are fetched with a single query
+        and scored CALIBRATION_CHUNK_SIZE references at a time in one NumPy pass.  This
+        is much faster when planning calibration for a whole season of sessions, while
+        keeping the score matrices small.  Each reference session gets the same ranking
+        guess_sessions() would give it.
+
+        Returns:
+            For each reference session, its acceptable candidates (best first).
+            Reference sessions whose reference image is missing get no candidates.
+        """
+        if not ref_sessions:
+            return []
+        import numpy as np  # (deferred, it's slow to import)
+
+        keys = [Database.CCD_TEMP_KEY, Database.DATE_OBS_KEY]
+        ref_ids = [ref[Database.ID_KEY] for ref in ref_sessions]
+        placeholders = ", ".join("?" * len(ref_ids))
+        refs = {
+            session[Database.ID_KEY]: image
+            for session, image in self._scorable_candidates(
+                self.db.search_session_images(
+                    (f"WHERE id IN ({placeholders})", ref_ids), keys
+                )
+            )
+        }
+        # (the scorer ignores NaNs, so missing references are masked out below)
+        missing_ref = (math.nan, math.nan)
+
+        def column(sessions: list[SessionRow], key: str) -> np.ndarray:
+            return np.array([s[get_column_name(key)] for s in sessions], dtype=object)
+
+        # The MUST match criteria (see guess_sessions)
+        must_match = [Database.TELESCOP_KEY]
+        if want_type.upper() == "FLAT":
+            must_match.append(Database.FILTER_KEY)
+        groups: dict[tuple[Any, ...], list[int]] = {}
+        for i, ref in enumerate(ref_sessions):
+            group = tuple(ref[get_column_name(key)] for key in must_match)
+            groups.setdefault(group, []).append(i)
+
+        rankings: list[list[SessionRow]] = [[] for _ in ref_sessions]
+        for group, indexes in groups.items():
+            conditions = dict(zip(must_match, group))
+            conditions[Database.IMAGETYP_KEY] = want_type
+            candidates = list(
+                self._scorable_candidates(
+                    self.db.search_session_images(where_tuple(conditions), keys)
+                )
+            )
+            if not candidates:
+                continue
+            candidate_sessions = [session for session, _ in candidates]
+            candidate_temps, candidate_epochs = np.array(
+                [image for _, image in candidates], dtype=np.float64
+            ).reshape(-1, 2).T
+
+            for start in range(0, len(indexes), self.CALIBRATION_CHUNK_SIZE):
+                chunk = indexes[start : start + self.CALIBRATION_CHUNK_SIZE]
+                ref_temps, ref_epochs = np.array(
+                    [refs.get(ref_ids[i], missing_ref) for i in chunk],
+                    dtype=np.float64,
+                ).reshape(-1, 2).T
+                scores = calibration.score_candidates(
+                    ref_temps, ref_epochs, candidate_temps, candidate_epochs
+                )
+
+                chunk_refs = [ref_sessions[i] for i in chunk]
+                has_ref = np.array([ref_ids[i] in refs for i in chunk])
+                acceptable = has_ref[:, np.newaxis]
+                for key in must_match:
+                    # (the query matched these already, this just makes sure)
+                    acceptable = acceptable & (
+                        column(chunk_refs, key)[:, np.newaxis]
+                        == column(candidate_sessions, key)[np.newaxis, :]
+                    )
+
+                ranked = calibration.rank_candidates(scores, acceptable)
+                for i, ranking in zip(chunk, ranked):
+                    rankings[i] = [candidate_sessions[j] for j in ranking]
+        return rankings
+
+    def _scorable_candidates(
+        self, candidates: list[tuple[SessionRow, dict[str, Any] | None]]
+    ) -> Iterator[tuple[SessionRow, tuple[float, float]]]:
+        """Convert the results of Database.search_session_images into scorer inputs.
+
+        Yields (session, (CCD temperature, DATE-OBS epoch)) pairs, skipping (and
+        logging) sessions whose reference image is missing.
+        """
+        for candidate, candidate_image in candidates:
+            if candidate_image is None:
                 # If we can't get the session image, log and skip this candidate
                 logging.warning(
-                    f"Could not score candidate session {candidate.get('id')}: {e}"
+                    f"Could not score candidate session {candidate.get('id')}: "
+                    "missing reference image"
                 )
                 continue
 
-        # Sort by score (highest first) and return just the sessions
-        scored_candidates.sort(key=lambda x: x[0], reverse=True)
+            candidate_date_str = candidate_image.get(Database.DATE_OBS_KEY)
+            candidate_epoch = calibration.to_epoch(candidate_date_str)
+            if candidate_date_str and math.isnan(candidate_epoch):
+                logging.warning(f"Could not parse candidate date: {candidate_date_str}")
 
-        return [candidate for score, candidate in scored_candidates]
+            candidate_temp = calibration.to_temperature(
+                candidate_image.get(Database.CCD_TEMP_KEY)
+            )
+            yield candidate, (candidate_temp, candidate_epoch)
+
+    def calibration_candidates(
+        self, session: SessionRow, want_type: str
+    ) -> list[SessionRow]:
+        """Return candidate calibration sessions for a session, best first.
+
+        For light sessions this is normally a single read of the rankings stored as
+        sessions are indexed (the best MAX_CALIBRATION_MATCHES of what guess_sessions()
+        would return).  Sessions without stored rankings (i.e. indexed by an older
+        version of starbash) fall back to guess_sessions().
+        """
+        matches = self.db.get_calibration_matches(session["id"], want_type)
+        if matches:
+            return matches
+        return self.guess_sessions(session, want_type)
+
+    def _update_calibration_matches(self) -> None:
+        """Update the stored calibration rankings affected by new or changed sessions.
+
+        New/changed light sessions get their rankings (re)computed, and a new/changed
+        calibration session re-ranks that calibration type for every light session
+        using the same telescope (because it might now be a better candidate).
+        """
+        if not self._calibration_dirty:
+            return
+        ids = list(self._calibration_dirty)
+        self._calibration_dirty.clear()
+
+        placeholders = ", ".join("?" * len(ids))
+        changed = self.db.search_session((f"WHERE id IN ({placeholders})", ids))
+
+        imagetyp = get_column_name(Database.IMAGETYP_KEY)
+        telescop = get_column_name(Database.TELESCOP_KEY)
+        lights = {s["id"]: s for s in changed if s[imagetyp].upper() == self.LIGHT_TYPE}
+
+        for want_type in self.CALIBRATION_TYPES:
+            refs = dict(lights)
+            telescopes = {s[telescop] for s in changed if s[imagetyp] == want_type}
+            if telescopes:
+                placeholders = ", ".join("?" * len(telescopes))
+                where = f"WHERE upper(imagetyp) = ? AND telescop IN ({placeholders})"
+                refs.update(
+                    (s["id"], s)
+                    for s in self.db.search_session(
+                        (where, [self.LIGHT_TYPE, *telescopes])
+                    )
+                )
+            if not refs:
+                continue
+
+            ref_sessions = list(refs.values())
+            rankings = self.guess_sessions_batch(ref_sessions, want_type)
+            for ref, ranking in zip(ref_sessions, rankings):
+                self.db.set_calibration_matches(
+                    ref["id"],
+                    want_type,
+                    [c["id"] for c in ranking[: self.MAX_CALIBRATION_MATCHES]],
+                )
+
+    def add_target_alias(self, alias: str, target: str) -> None:
+        """Treat alias as another name for target, merging their sessions.
+
+        Raises:
+            ValueError: If alias is already a name of target.
+        """
+        self._calibration_dirty |= self.db.add_target_alias(alias, target)
+        self._update_calibration_matches()
+
+    def remove_target_alias(self, alias: str) -> bool:
+        """Stop treating alias as another name for a target, splitting their sessions.
+
+        Returns:
+            False if alias wasn't an alias of any target.
+        """
+        if normalize_target_name(alias) not in self.db.get_target_aliases():
+            return False
+        self._calibration_dirty |= self.db.remove_target_alias(alias)
+        self._update_calibration_matches()
+        return True
 
     def search_session(self) -> list[SessionRow]:
         """Search for sessions, optionally filtered by the current selection."""
         # Get query conditions from selection
         conditions = self.selection.get_query_conditions()
+        saved_name = self.selection.saved_name()
+        if saved_name is not None:
+            # A saved selection, whose matching sessions are cached by the DB
+            return self.db.search_saved_selection(saved_name, conditions)
         return self.db.search_session(conditions)
 
     def get_session_image(self, session: SessionRow) -> ImageRow:
@@ -335,8 +597,9 @@ class Starbash:
         Get all images belonging to a specific session.
 
         Sessions are defined by a unique combination of filter, imagetyp (image type),
-        object (target name), telescope, and date range. This method queries the images
-        table for all images matching the session's criteria in a single database query.
+        object (canonical target name), telescope, and date range. This method queries
+        the images table for all images matching the session's criteria in a single
+        database query.
 
         Args:
             session_id: The database ID of the session
@@ -352,12 +615,19 @@ class Starbash:
         conditions = {
             Database.FILTER_KEY: session[get_column_name(Database.FILTER_KEY)],
             Database.IMAGETYP_KEY: session[get_column_name(Database.IMAGETYP_KEY)],
-            Database.OBJECT_KEY: session[get_column_name(Database.OBJECT_KEY)],
+            "target": session[get_column_name(Database.OBJECT_KEY)],
             Database.TELESCOP_KEY: session[get_column_name(Database.TELESCOP_KEY)],
+            Database.EXPTIME_KEY: session.get("exptime"),
             "date_start": session[get_column_name(Database.START_KEY)],
             "date_end": session[get_column_name(Database.END_KEY)],
         }
 
+        # Sessions record missing headers as "unspecified" (see update_sessions), the
+        # images those sessions were built from simply lack the header.
+        for k, v in conditions.items():
+            if v == "unspecified":
+                conditions[k] = None
+
         # Single query with all conditions
         images = self.db.search_image(conditions)
         return images if images else []
@@ -373,90 +643,377 @@ class Starbash:
             ValueError: If the repository URL is not found in user configuration
         """
         # Get the repo-ref list from user config
-        repo_refs = self.user_repo.config.get("repo-ref")
+        repo_refs = self.user_repo.get("repo-ref")
 
         if not repo_refs:
             raise ValueError(f"No repository references found in user configuration.")
 
         # Find and remove the matching repo-ref
-        found = False
-        refs_copy = [r for r in repo_refs]  # Make a copy to iterate
-        for ref in refs_copy:
-            ref_dir = ref.get("dir", "")
-            # Match by converting to file:// URL format if needed
-            if ref_dir == url or f"file://{ref_dir}" == url:
-                repo_refs.remove(ref)
-                found = True
-                break
-
-        if not found:
+        if not self.user_repo.remove_repo_ref(url):
             raise ValueError(f"Repository '{url}' not found in user configuration.")
 
         # Write the updated config
         self.user_repo.write_config()
 
-    def reindex_repo(self, repo: Repo, force: bool = False):
-        """Reindex all repositories managed by the RepoManager."""
+    def reindex_repo(
+        self,
+        repo: Repo,
+        force: bool = False,
+        jobs: int = 1,
+        batch_size: int = Database.DEFAULT_BATCH_SIZE,
+        resume: bool = False,
+    ):
+        """Reindex all repositories managed by the RepoManager.
+
+        A checkpoint (the last file committed, in walk order) is stored with each batch
+        of images, and cleared once the reindex completes.
+
+        Args:
+            repo: The repo to scan for FITS files.
+            force: Reread FITS headers, even if they are already indexed.
+            jobs: Number of worker processes used to parse FITS headers (0 = one per CPU).
+                  The database is only ever written from this (the calling) process.
+            batch_size: Number of images written to the database per transaction.
+            resume: Continue an interrupted reindex from its checkpoint.  Files up to
+                    the checkpoint are not forced to be reread (they still are if they
+                    have changed since), so the result is the same as an uninterrupted
+                    run.  A repo whose reindex already completed isn't forced at all.
+        """
         # FIXME, add a method to get just the repos that contain images
         if repo.is_scheme("file") and repo.kind != "recipe":
             logging.debug("Reindexing %s...", repo.url)
 
-            whitelist = None
-            config = self.repo_manager.merged.get("config")
-            if config:
-                whitelist = config.get("fits-whitelist", None)
-
             path = repo.get_path()
             if not path:
                 raise ValueError(f"Repo path not found for {repo}")
 
-            # Find all FITS files under this repo path
-            for f in track(
-                list(path.rglob("*.fit*")),
-                description=f"Indexing {repo.url}...",
-            ):
-                # progress.console.print(f"Indexing {f}...")
+            checkpoint = self.db.get_reindex_checkpoint(repo.url)
+            num_images = 0
+            done_parts: tuple[str, ...] | None = None
+            if resume and self.db.is_reindex_complete(repo.url):
+                # Finished before the reindex being resumed was interrupted
+                console.print(f"{repo.url} was already reindexed, checking for changes")
+                force = False
+            elif checkpoint and resume:
+                last_path, num_images = checkpoint
+                try:
+                    done_parts = Path(last_path).relative_to(path).parts
+                    console.print(f"Resuming {repo.url} after {num_images} images")
+                except ValueError:
+                    logging.warning(
+                        "Ignoring the reindex checkpoint of %s, %s isn't in the repo "
+                        "(did it move?)",
+                        repo.url,
+                        last_path,
+                    )
+                    num_images = 0
+                    self.db.clear_reindex_checkpoint(repo.url)
+            else:
+                # Starting over, so don't let a later --resume pick up the old position
+                self.db.clear_reindex_checkpoint(repo.url)
+
+            def is_done(f: str) -> bool:
+                # Files are walked in the order of their path parts (see walk_files)
+                return done_parts is not None and (
+                    Path(f).relative_to(path).parts <= done_parts
+                )
+
+            def save_checkpoint(last_path: str, batch_images: int) -> None:
+                nonlocal num_images
+                num_images += batch_images
+                self.db.set_reindex_checkpoint(repo.url, last_path, num_images)
+
+            # Files are streamed from the directory walk through the header readers
+            # into the DB, so indexing starts as soon as the first file is found.
+            known = self.db.get_signatures(str(path))
+            aliases = self.db.get_signatures(str(path), aliases=True)
+            with Progress(
+                *Progress.get_default_columns(), MofNCompleteColumn(), console=console
+            ) as progress:
+                task = progress.add_task(f"Indexing {repo.url}...", total=None)
                 try:
-                    found = self.db.get_image(str(f))
-                    if not found or force:
-                        # Read and log the primary header (HDU 0)
-                        with fits.open(str(f), memmap=False) as hdul:
-                            # convert headers to dict
-                            hdu0: Any = hdul[0]
-                            header = hdu0.header
-                            if type(header).__name__ == "Unknown":
-                                raise ValueError("FITS header has Unknown type: %s", f)
-
-                            items = header.items()
-                            headers = {}
-                            for key, value in items:
-                                if (not whitelist) or (key in whitelist):
-                                    headers[key] = value
-                            logging.debug("Headers for %s: %s", f, headers)
-                            headers["path"] = str(f)
-                            image_doc_id = self.db.upsert_image(headers)
-
-                            if not found:
-                                # Update the session infos, but ONLY on first file scan
-                                # (otherwise invariants will get messed up)
-                                self._add_session(str(f), image_doc_id, header)
-
-                except Exception as e:
-                    logging.warning("Failed to read FITS header for %s: %s", f, e)
-
-    def reindex_repos(self, force: bool = False):
+                    seen = self._index_files(
+                        walk_files(path, *self._repo_globs(repo)),
+                        known,
+                        aliases,
+                        force=force,
+                        jobs=jobs,
+                        batch_size=batch_size,
+                        progress=(progress, task),
+                        is_done=is_done if done_parts else None,
+                        checkpoint=save_checkpoint,
+                    )
+                except KeyboardInterrupt:
+                    console.print(
+                        f"[yellow]Reindex interrupted after {num_images} images, use "
+                        "'sb repo reindex --resume' to continue.[/yellow]"
+                    )
+                    raise
+
+            # Forget images (under this repo) whose files have been deleted
+            with self.db.transaction():
+                for f in (known.keys() | aliases.keys()) - seen:
+                    if not os.path.exists(f):
+                        self._remove_image(f)
+                self._update_calibration_matches()
+                self.db.set_reindex_complete(repo.url, num_images)
+
+    def _repo_globs(self, repo: Repo) -> tuple[list[str], list[str]]:
+        """Return the (include, exclude) globs of the files to index in a repo.
+
+        Set per repo in its starbash.toml (index.include/index.exclude).
+        """
+        include = repo.get("index.include", list(DEFAULT_INCLUDE))
+        exclude = repo.get("index.exclude", [])
+        return (include, exclude)  # type: ignore[return-value]
+
+    def index_files(
+        self,
+        files: Iterable[tuple[str, os.stat_result]],
+        jobs: int = 1,
+        batch_size: int = Database.DEFAULT_BATCH_SIZE,
+    ) -> None:
+        """Index specific (new or changed) files, i.e. as reported by 'sb repo watch'.
+
+        Files go through the same path as reindex_repo(), so unchanged files are skipped
+        and moved files are renamed rather than reread.
+
+        Args:
+            files: (path, stat) of each file.
+            jobs: Number of worker processes used to parse FITS headers.
+            batch_size: Number of images written to the database per transaction.
+        """
+        files = list(files)
+        known = self.db.get_file_signatures(f for f, _ in files)
+        aliases = self.db.get_file_signatures((f for f, _ in files), aliases=True)
+        self._index_files(files, known, aliases, jobs=jobs, batch_size=batch_size)
+
+    def _index_files(
+        self,
+        files: Iterable[tuple[str, os.stat_result]],
+        known: dict[str, FileSignature | None],
+        aliases: dict[str, FileSignature | None],
+        force: bool = False,
+        jobs: int = 1,
+        batch_size: int = Database.DEFAULT_BATCH_SIZE,
+        progress: tuple[Progress, TaskID] | None = None,
+        is_done: Callable[[str], bool] | None = None,
+        checkpoint: Callable[[str, int], None] | None = None,
+    ) -> set[str]:
+        """Read the headers of files which are new or changed and store them in the DB.
+
+        Args:
+            files: (path, stat) of each file, these are consumed lazily.
+            known: The signatures of already indexed images (see
+                   Database.get_signatures), updated for moved files.
+            aliases: The signatures of files already known to be duplicates.
+            force: Reread FITS headers, even if the file is unchanged.
+            jobs: Number of worker processes used to parse FITS headers.
+            batch_size: Number of images written to the database per transaction.
+            progress: Progress bar (and task) to report to, its total is a running count
+                      of the files found which need reading.
+            is_done: Says if a file was already handled by an interrupted run, such
+                     files are only reread if they have changed (even with force).
+            checkpoint: Called (see _ingest) as each batch of images is committed.
+
+        Returns:
+            The paths of all the files.
+        """
+        whitelist = self.repo_manager.get("config.fits-whitelist")
+        dedupe = bool(self.repo_manager.get("config.dedupe", False))
+
+        # Only parse the cards we are going to use (_update_sessions needs its keys even
+        # if the user has chosen not to store them)
+        keep = set(whitelist) | set(self.SESSION_HEADER_KEYS) if whitelist else None
+
+        seen: set[str] = set()
+        signatures: dict[str, FileSignature] = {}
+
+        # Files whose (size, mtime, inode) signature is unchanged are never opened
+        def to_read() -> Iterator[str]:
+            for f, st in files:
+                sig = file_signature(st)
+                seen.add(f)
+                reread = force and not (is_done and is_done(f))
+                if f in aliases:
+                    if not reread and aliases[f] == sig:
+                        continue  # an unchanged duplicate
+                    if not dedupe:
+                        self.db.remove_alias(f)  # it will be indexed as an image
+                elif f not in known and self._rename_moved_image(f, sig):
+                    known[f] = sig  # now indexed under its new name
+                if not reread and known.get(f) == sig:
+                    continue
+                signatures[f] = sig
+                if progress:
+                    progress[0].update(progress[1], total=len(signatures))
+                yield f
+
+        def headers() -> Iterator[IngestItem]:
+            for f, header, error, content_hash in read_headers(
+                to_read(), jobs=jobs, keep=keep, hash_content=dedupe
+            ):
+                if progress:
+                    progress[0].advance(progress[1])
+                if header is None:
+                    logging.warning("Failed to read FITS header for %s: %s", f, error)
+                    continue
+                yield (f, header, f not in known, signatures[f], content_hash)
+
+        self._ingest(headers(), whitelist, batch_size=batch_size, checkpoint=checkpoint)
+        return seen
+
+    def _ingest(
+        self,
+        items: Iterable[IngestItem],
+        whitelist: list[str] | None,
+        batch_size: int = Database.DEFAULT_BATCH_SIZE,
+        checkpoint: Callable[[str, int], None] | None = None,
+    ) -> None:
+        """Store (already parsed) primary headers in the DB and update their sessions.
+
+        Args:
+            items: (path, header, is_new, signature, content hash) for each image.
+                   Files with the same content hash as an image which is already
+                   stored are recorded as its aliases instead.
+            whitelist: If set, only these headers are stored.
+            batch_size: Number of images written to the database per transaction.
+            checkpoint: Called with (last path, number of images) for each batch, as
+                        part of the batch's transaction.
+        """
+        # Full headers/etc... for the records in the batch being written
+        pending: dict[
+            str, tuple[dict[str, Any], bool, FileSignature | None, str | None]
+        ] = {}
+        # The stored records of (changed) images in the batch, before it is written
+        previous: list[ImageRow] = []
+        # content hash -> path of the images stored by this call (maybe not yet written)
+        hashes: dict[str, str] = {}
+        # (path, content hash, signature, is_new) of duplicates awaiting their image
+        duplicates: list[tuple[str, str, FileSignature, bool]] = []
+
+        def records() -> Iterator[dict[str, Any]]:
+            for f, header, is_new, signature, content_hash in items:
+                if content_hash and signature:
+                    canonical = hashes.get(content_hash)
+                    if canonical is None:
+                        found = self.db.find_image_by_hash(content_hash)
+                        canonical = found[1] if found else f
+                    if canonical != f:
+                        duplicates.append((f, content_hash, signature, is_new))
+                        continue
+                    hashes[content_hash] = f
+
+                record = {}
+                for key, value in header.items():
+                    if (not whitelist) or (key in whitelist):
+                        record[key] = value
+                logging.debug("Headers for %s: %s", f, record)
+                record["path"] = f
+                pending[f] = (header, is_new, signature, content_hash)
+                if not is_new:
+                    # Its session keys may have changed, so its old session is
+                    # rebuilt too (this runs before the batch is written)
+                    old = self.db.get_image(f)
+                    if old:
+                        previous.append(old)
+                yield record
+
+        def add_duplicates() -> None:
+            for f, content_hash, signature, is_new in duplicates:
+                canonical = self.db.find_image_by_hash(content_hash)
+                if canonical is None:
+                    logging.warning("Failed to store the original of duplicate %s", f)
+                    continue
+                if not is_new:
+                    # Indexed as an image before (i.e. before dedupe was enabled)
+                    image = self.db.remove_image(f)
+                    if image:
+                        self._remove_from_session(image)
+                logging.info("%s is a duplicate of %s", f, canonical[1])
+                self.db.add_alias(f, canonical[0], signature)
+            duplicates.clear()
+
+        # Closed on errors too, which rolls back the batch in progress (rather than
+        # leaving it to be committed later with its sessions half rebuilt)
+        batches = self.db.upsert_images(records(), batch_size=batch_size)
+        with closing(batches):
+            for batch in batches:
+                # Everything done here is committed along with the batch of images
+                signatures = []
+                added = []
+                for record, image_doc_id in batch:
+                    f = record["path"]
+                    header, is_new, signature, content_hash = pending[f]
+                    if signature is not None:
+                        signatures.append((image_doc_id, signature))
+                    if content_hash:
+                        self.db.set_content_hash(image_doc_id, content_hash)
+                        if is_new:
+                            self.db.remove_alias(f)  # in case it used to be a duplicate
+                    added.append((f, header))
+                # (an error here rolls back the whole batch)
+                self._update_sessions(added, previous)
+                add_duplicates()
+                self._update_calibration_matches()
+                self.db.upsert_signatures(signatures)
+                if checkpoint:
+                    checkpoint(batch[-1][0]["path"], len(batch))
+                pending.clear()
+                previous.clear()
+
+        if duplicates:
+            with self.db.transaction():
+                add_duplicates()
+                self._update_calibration_matches()
+
+    def reindex_repos(self, force: bool = False, jobs: int = 1, resume: bool = False):
         """Reindex all repositories managed by the RepoManager."""
         logging.debug("Reindexing all repositories...")
+        if not resume:
+            # A new run, so no repo counts as done yet if it is resumed later
+            self.db.clear_reindex_checkpoint()
 
         for repo in track(self.repo_manager.repos, description="Reindexing repos..."):
-            self.reindex_repo(repo, force=force)
+            self.reindex_repo(repo, force=force, jobs=jobs, resume=resume)
+
+    def watch_repos(
+        self,
+        settle: float = DEFAULT_SETTLE_SECONDS,
+        poll: bool = False,
+        stop: threading.Event | None = None,
+    ) -> None:
+        """Index new frames in the regular repos as they are written (until stop).
+
+        Args:
+            settle: Seconds a file must be unchanged before it is indexed (so frames
+                    still being written by the capture software are left alone).
+            poll: Periodically walk the repos rather than using inotify.
+            stop: Set to make the watch return.
+        """
+        roots = []
+        for repo in self.repo_manager.regular_repos:
+            path = repo.get_path()
+            if path and path.is_dir():
+                roots.append(WatchRoot(path, *self._repo_globs(repo)))
+
+        def on_files(files: list[tuple[str, os.stat_result]]) -> None:
+            for f, _ in files:
+                console.print(f"Indexing {f}")
+            self.index_files(files)
+
+        watcher = create_watcher(roots, poll=poll)
+        try:
+            run_watch(watcher, on_files, settle=settle, stop=stop)
+        finally:
+            watcher.close()
 
     def run_all_stages(self):
         """On the currently active session, run all processing stages"""
         logging.info("--- Running all stages ---")
 
         # 1. Get all pipeline definitions (the `[[stages]]` tables with name and priority).
-        pipeline_definitions = self.repo_manager.merged.getall("stages")
+        pipeline_definitions = self.repo_manager.get_all("stages")
         flat_pipeline_steps = list(itertools.chain.from_iterable(pipeline_definitions))
 
         # 2. Sort the pipeline steps by their 'priority' field.
@@ -484,7 +1041,7 @@ class Starbash:
         logging.info(f"--- Running pipeline step: '{step_name}' ---")
 
         # 3. Get all available task definitions (the `[[stage]]` tables with tool, script, when).
-        task_definitions = self.repo_manager.merged.getall("stage")
+        task_definitions = self.repo_manager.get_all("stage")
         all_tasks = list(itertools.chain.from_iterable(task_definitions))
 
         # Find all tasks that should run during this pipeline step.
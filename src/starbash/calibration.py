@@ -0,0 +1,139 @@
+"""Scoring of candidate calibration sessions (see Starbash.guess_sessions).
+
+A candidate (i.e. a DARK session) scores points for how close its CCD-TEMP is to the
+reference session (most important) and for how close in time it was taken.  There is
+a scalar scorer for a single (reference, candidate) pair and a NumPy batch scorer which
+scores every pair of many references and candidates at once.
+"""
+
+from __future__ import annotations
+
+import math
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    # numpy is imported where it's used, so commands which never score candidates
+    # start faster
+    import numpy as np
+
+# Perfect temperature match (0°C diff) = 1000, 1°C diff ≈ 368, 2°C diff ≈ 135
+TEMP_SCORE = 1000.0
+# Same day ≈ 100, 7 days ≈ 37, 30 days ≈ 9
+DATE_SCORE = 100.0
+DATE_SCORE_SECONDS = 7 * 86400.0
+
+# The base of the exponential decay (scores have always used this approximation of e,
+# so keep it to stay comparable with older rankings)
+DECAY_BASE = 2.718
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def to_temperature(value: Any) -> float:
+    """Convert a CCD-TEMP header value to a float (NaN if missing or unparsable)."""
+    if value is None:
+        return math.nan
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return math.nan
+
+
+def to_epoch(value: Any) -> float:
+    """Convert a DATE-OBS header value to seconds since 1970 (NaN if unparsable).
+
+    DATE-OBS is UTC, so times without a timezone are treated as UTC.
+    """
+    if not value:
+        return math.nan
+    try:
+        dt = datetime.fromisoformat(value)
+    except (ValueError, TypeError):
+        return math.nan
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return (dt - _EPOCH).total_seconds()
+
+
+def score_candidate(
+    ref_temp: float, ref_epoch: float, candidate_temp: float, candidate_epoch: float
+) -> float:
+    """Score one candidate session against a reference session (higher is better).
+
+    Args:
+        ref_temp, candidate_temp: CCD temperatures (see to_temperature).
+        ref_epoch, candidate_epoch: Observation times (see to_epoch).
+
+    NaN values don't contribute to the score.
+    """
+    score = 0.0
+
+    temp_diff = abs(ref_temp - candidate_temp)
+    if not math.isnan(temp_diff):
+        score += TEMP_SCORE * (DECAY_BASE ** (-temp_diff))
+
+    time_delta = abs(ref_epoch - candidate_epoch)
+    if not math.isnan(time_delta):
+        score += DATE_SCORE * (DECAY_BASE ** (-time_delta / DATE_SCORE_SECONDS))
+
+    return score
+
+
+def score_candidates(
+    ref_temps: np.ndarray,
+    ref_epochs: np.ndarray,
+    candidate_temps: np.ndarray,
+    candidate_epochs: np.ndarray,
+) -> np.ndarray:
+    """Score every candidate session against every reference session.
+
+    Equivalent to calling score_candidate() for each pair, but in a single NumPy pass.
+    The scores can differ from score_candidate() in the last bit (NumPy's vectorized pow
+    isn't the C library's), so only candidates whose scores are equal to within rounding
+    could be ranked differently.
+
+    Returns:
+        A (len(ref_temps), len(candidate_temps)) array of scores.
+    """
+    import numpy as np
+
+    ref_temps = np.asarray(ref_temps, dtype=np.float64)[:, np.newaxis]
+    ref_epochs = np.asarray(ref_epochs, dtype=np.float64)[:, np.newaxis]
+    candidate_temps = np.asarray(candidate_temps, dtype=np.float64)[np.newaxis, :]
+    candidate_epochs = np.asarray(candidate_epochs, dtype=np.float64)[np.newaxis, :]
+
+    with np.errstate(invalid="ignore"):
+        temp_diff = np.abs(ref_temps - candidate_temps)
+        time_delta = np.abs(ref_epochs - candidate_epochs)
+
+        temp_score = TEMP_SCORE * np.power(DECAY_BASE, -temp_diff)
+        date_score = DATE_SCORE * np.power(DECAY_BASE, -time_delta / DATE_SCORE_SECONDS)
+
+    # Same order of additions as score_candidate
+    scores = np.where(np.isnan(temp_diff), 0.0, temp_score)
+    return scores + np.where(np.isnan(time_delta), 0.0, date_score)
+
+
+def rank_candidates(
+    scores: np.ndarray, acceptable: np.ndarray | None = None
+) -> list[list[int]]:
+    """Rank the candidates for each reference session by score (highest first).
+
+    Args:
+        scores: Scores from score_candidates().
+        acceptable: Optional boolean array (same shape as scores), candidates which are
+            not acceptable for a reference session are left out of its ranking.
+
+    Returns:
+        For each reference session, the indexes of its candidates, best first.  Equal
+        scores keep their original order.
+    """
+    import numpy as np
+
+    # A stable sort on the negated scores keeps ties in candidate order
+    order = np.argsort(-scores, axis=1, kind="stable")
+    if acceptable is None:
+        return order.tolist()
+    keep = np.take_along_axis(acceptable, order, axis=1)
+    return [row[mask].tolist() for row, mask in zip(order, keep)]
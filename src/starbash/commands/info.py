@@ -3,7 +3,6 @@
 import typer
 from typing_extensions import Annotated
 from rich.table import Table
-from collections import Counter
 
 from starbash.app import Starbash
 from starbash import console
@@ -23,34 +22,37 @@ def plural(name: str) -> str:
 
 
 def dump_column(sb: Starbash, human_name: str, column_name: str) -> None:
-    # Get all telescopes from the database
-    sessions = sb.search_session()
-
-    # Also do a complete unfiltered search so we can compare for the users
-    allsessions = sb.db.search_session(("", []))
-
     column_name = get_column_name(column_name)
-    found = [session[column_name] for session in sessions if session[column_name]]
-    allfound = [session[column_name] for session in allsessions if session[column_name]]
 
-    # Count occurrences of each telescope
-    found_counts = Counter(found)
-    all_counts = Counter(allfound)
-
-    # Sort by telescope name
-    sorted_telescopes = sorted(found_counts.items())
+    # Summaries of all sessions come straight from the DB rollups, only a selection
+    # needs the sessions themselves to be grouped
+    all_stats = sb.db.get_session_stats(column_name)
+    if sb.selection.is_empty():
+        found_stats = all_stats
+    else:
+        found_stats = sb.db.get_session_stats(
+            column_name, sb.selection.get_query_conditions()
+        )
+    found_stats = {k: v for k, v in found_stats.items() if k}
+    all_count = len([k for k in all_stats if k])
 
     # Create and display table
     table = Table(
-        title=f"{plural(human_name)} ({len(found_counts)} / {len(all_counts)} selected)"
+        title=f"{plural(human_name)} ({len(found_stats)} / {all_count} selected)"
     )
     table.add_column(human_name, style=TABLE_COLUMN_STYLE, no_wrap=False)
     table.add_column(
         "# of sessions", style=TABLE_COLUMN_STYLE, no_wrap=True, justify="right"
     )
+    table.add_column("Time", style=TABLE_COLUMN_STYLE, no_wrap=True, justify="right")
 
-    for i, count in sorted_telescopes:
-        table.add_row(i, str(count))
+    # Sort by name
+    for name, stats in sorted(found_stats.items()):
+        table.add_row(
+            name,
+            str(stats["num_sessions"]),
+            format_duration(int(stats["exptime_total"])),
+        )
 
     console.print(table)
 
@@ -58,21 +60,21 @@ def dump_column(sb: Starbash, human_name: str, column_name: str) -> None:
 @app.command()
 def target():
     """List targets (filtered based on the current selection)."""
-    with Starbash("info.target") as sb:
+    with Starbash("info.target", read_only=True) as sb:
         dump_column(sb, "Target", Database.OBJECT_KEY)
 
 
 @app.command()
 def telescope():
     """List telescopes/instruments (filtered based on the current selection)."""
-    with Starbash("info.telescope") as sb:
+    with Starbash("info.telescope", read_only=True) as sb:
         dump_column(sb, "Telescope", Database.TELESCOP_KEY)
 
 
 @app.command()
 def filter():
     """List all filters (filtered based on the current selection)."""
-    with Starbash("info.filter") as sb:
+    with Starbash("info.filter", read_only=True) as sb:
         dump_column(sb, "Filter", Database.FILTER_KEY)
 
 
@@ -83,7 +85,7 @@ def main_callback(ctx: typer.Context):
     This is the default command when no subcommand is specified.
     """
     if ctx.invoked_subcommand is None:
-        with Starbash("info") as sb:
+        with Starbash("info", read_only=True) as sb:
             table = Table(title="Starbash Information")
             table.add_column("Setting", style=TABLE_COLUMN_STYLE, no_wrap=True)
             table.add_column("Value", style=TABLE_VALUE_STYLE)
@@ -112,7 +114,7 @@ def main_callback(ctx: typer.Context):
 
             table.add_row("Images Indexed", str(sb.db.len_table(Database.IMAGES_TABLE)))
 
-            total_exptime = sb.db.sum_column(Database.SESSIONS_TABLE, "exptime_total")
+            total_exptime = sb.db.get_session_totals()["exptime_total"]
             table.add_row(
                 "Total image time",
                 format_duration(total_exptime),
@@ -41,7 +41,7 @@ def siril(
     If --run is specified, launches the Siril GUI with the generated directory
     structure loaded and ready for processing.
     """
-    with Starbash("process.siril") as sb:
+    with Starbash("process.siril", read_only=True) as sb:
         console.print(
             f"[yellow]Processing session {session_num} for Siril in {destdir}...[/yellow]"
         )
@@ -72,7 +72,7 @@ def siril(
             ("FLAT", "flats"),
         ]
         for typ, subdir in extras:
-            candidates = sb.guess_sessions(session, typ)
+            candidates = sb.calibration_candidates(session, typ)
             if not candidates:
                 console.print(
                     f"[yellow]No candidate sessions found for {typ} calibration frames.[/yellow]"
@@ -6,6 +6,7 @@ from repo import repo_suffix
 from starbash.app import Starbash
 from starbash import console
 from starbash.toml import toml_from_template
+from starbash.watch import DEFAULT_SETTLE_SECONDS
 
 app = typer.Typer(invoke_without_command=True)
 
@@ -25,7 +26,7 @@ def main(
     """
     # If no subcommand is invoked, run the list behavior
     if ctx.invoked_subcommand is None:
-        with Starbash("repo.list") as sb:
+        with Starbash("repo.list", read_only=True) as sb:
             repos = sb.repo_manager.repos if verbose else sb.repo_manager.regular_repos
             for i, repo in enumerate(repos):
                 kind = repo.kind("input")
@@ -132,6 +133,15 @@ def reindex(
     force: bool = typer.Option(
         default=False, help="Reread FITS headers, even if they are already indexed."
     ),
+    jobs: int = typer.Option(
+        1,
+        "--jobs",
+        "-j",
+        help="Number of worker processes used to read FITS headers (0 = one per CPU).",
+    ),
+    resume: bool = typer.Option(
+        default=False, help="Continue an interrupted reindex where it stopped."
+    ),
 ):
     """
     Reindex a repository by number.
@@ -140,7 +150,7 @@ def reindex(
     """
     with Starbash("repo.reindex") as sb:
         if reponum is None:
-            sb.reindex_repos(force=force)
+            sb.reindex_repos(force=force, jobs=jobs, resume=resume)
         else:
             try:
                 # Parse the repo number (1-indexed)
@@ -158,7 +168,9 @@ def reindex(
                 # Get the repo to reindex
                 repo_to_reindex = regular_repos[repo_index]
                 console.print(f"Reindexing repository: {repo_to_reindex.url}")
-                sb.reindex_repo(repo_to_reindex, force=force)
+                sb.reindex_repo(
+                    repo_to_reindex, force=force, jobs=jobs, resume=resume
+                )
                 console.print(
                     f"[green]Successfully reindexed repository {reponum}[/green]"
                 )
@@ -170,5 +182,27 @@ def reindex(
                 raise typer.Exit(code=1)
 
 
+@app.command()
+def watch(
+    settle: float = typer.Option(
+        DEFAULT_SETTLE_SECONDS,
+        help="Seconds a file must be unchanged before it is indexed.",
+    ),
+    poll: bool = typer.Option(
+        False, help="Periodically rescan the repos instead of using inotify."
+    ),
+):
+    """
+    Watch all repositories, indexing new frames as they are written.
+    Runs until interrupted with Ctrl-C.
+    """
+    with Starbash("repo.watch") as sb:
+        console.print("Watching repositories for new frames (Ctrl-C to stop)...")
+        try:
+            sb.watch_repos(settle=settle, poll=poll)
+        except KeyboardInterrupt:
+            console.print("[green]Stopped watching.[/green]")
+
+
 if __name__ == "__main__":
     app()
@@ -11,6 +11,7 @@ from rich.table import Table
 from starbash.app import Starbash, copy_images_to_dir
 from starbash.database import Database, SessionRow, get_column_name
 from starbash import console
+from starbash.sky import DEFAULT_RADIUS_DEG, format_position, parse_dec, parse_ra
 from starbash.commands import (
     format_duration,
     to_shortdate,
@@ -34,17 +35,128 @@ def target(
     target_name: Annotated[
         str,
         typer.Argument(
-            help="Target name to add to the selection (e.g., 'M31', 'NGC 7000')"
+            help="Target name to add to the selection (e.g., 'M31', 'NGC 7000'), "
+            "or the RA of a position (e.g., '00 42 44' or 10.68)"
         ),
     ],
+    dec: Annotated[
+        str | None,
+        typer.Argument(
+            help="Declination of the position (e.g., '+41 16 09' or 41.27)"
+        ),
+    ] = None,
+    radius: Annotated[
+        float | None,
+        typer.Option(
+            "--radius",
+            "-r",
+            help="Select sessions pointed within this many degrees of the position "
+            f"(default {DEFAULT_RADIUS_DEG:g}), rather than by target name",
+        ),
+    ] = None,
 ):
-    """Limit the current selection to only the named target."""
+    """Limit the current selection to only the named target (or a patch of sky).
+
+    Examples:
+        starbash select target M31
+        starbash select target M31 --radius 2
+        starbash select target "00 42 44" "+41 16 09" --radius 0.5
+    """
     with Starbash("selection.target") as sb:
-        # For now, replace existing targets with this one
-        # In the future, we could support adding multiple targets
-        sb.selection.targets = []
-        sb.selection.add_target(target_name)
-        console.print(f"[green]Selection limited to target: {target_name}[/green]")
+        if dec is None and radius is None:
+            # For now, replace existing targets with this one
+            # In the future, we could support adding multiple targets
+            with sb.selection.transaction():
+                sb.selection.targets = []
+                sb.selection.set_cone(None)
+                sb.selection.add_target(target_name)
+            console.print(f"[green]Selection limited to target: {target_name}[/green]")
+            return
+
+        if dec is not None:
+            position = (parse_ra(target_name), parse_dec(dec))
+            if None in position:
+                console.print(
+                    f"[red]Error: Can't parse position: {target_name} {dec}[/red]"
+                )
+                raise typer.Exit(1)
+            ra_deg, dec_deg = position
+        else:
+            # Also finds frames of the same field which were named differently
+            known = sb.db.get_target_position(target_name)
+            if known is None:
+                console.print(
+                    f"[red]Error: No images of '{target_name}' have a position[/red]"
+                )
+                raise typer.Exit(1)
+            ra_deg, dec_deg = known
+
+        if radius is None:
+            radius = DEFAULT_RADIUS_DEG
+        with sb.selection.transaction():
+            sb.selection.targets = []
+            sb.selection.set_cone(ra_deg, dec_deg, radius)
+        sessions = sb.search_session()
+        console.print(
+            f"[green]Selection limited to within {radius:g}° of "
+            f"{format_position(ra_deg, dec_deg)} ({len(sessions)} sessions)[/green]"
+        )
+
+
+@app.command()
+def alias(
+    name: Annotated[
+        str | None,
+        typer.Argument(help="Another name of a target (e.g., 'Andromeda')"),
+    ] = None,
+    target_name: Annotated[
+        str | None,
+        typer.Argument(help="The target it is another name of (e.g., 'M31')"),
+    ] = None,
+    remove: Annotated[
+        bool,
+        typer.Option("--remove", help="Stop NAME being another name of its target"),
+    ] = False,
+):
+    """Treat a name as another name of a target (merging their sessions).
+
+    Without arguments the aliases are listed.  Names which only differ in case, spaces
+    or underscores (i.e. 'M 31' and 'm31') are always the same target.
+
+    Examples:
+        starbash select alias Andromeda M31
+        starbash select alias Andromeda --remove
+    """
+    with Starbash("selection.alias") as sb:
+        if name is None:
+            aliases = sb.db.get_target_aliases()
+            if not aliases:
+                console.print("[yellow]No target aliases[/yellow]")
+                return
+            table = Table(title="Target aliases")
+            table.add_column("Alias", style=TABLE_COLUMN_STYLE, no_wrap=True)
+            table.add_column("Target", style=TABLE_VALUE_STYLE)
+            for alias_name, target in sorted(aliases.items()):
+                table.add_row(alias_name, target)
+            console.print(table)
+        elif remove:
+            if not sb.remove_target_alias(name):
+                console.print(f"[yellow]'{name}' is not an alias[/yellow]")
+                raise typer.Exit(1)
+            console.print(f"[green]'{name}' is no longer an alias[/green]")
+        elif target_name is None:
+            console.print("[red]Error: Missing the TARGET_NAME of NAME[/red]")
+            raise typer.Exit(1)
+        else:
+            try:
+                sb.add_target_alias(name, target_name)
+            except ValueError as e:
+                console.print(f"[red]Error: {e}[/red]")
+                raise typer.Exit(1)
+            console.print(
+                f"[green]'{name}' is now another name of "
+                f"{sb.db.canonical_target(target_name)}[/green]"
+            )
 
 
 @app.command()
@@ -67,6 +179,46 @@ def telescope(
         )
 
 
+@app.command()
+def save(
+    name: Annotated[
+        str,
+        typer.Argument(help="Name to save the selection as (e.g., 'M31 all seasons')"),
+    ],
+):
+    """Save the current selection under a name (see 'select load')."""
+    with Starbash("selection.save") as sb:
+        sb.selection.save_as(name)
+        # Also caches the matching sessions for later loads
+        sessions = sb.search_session()
+        console.print(
+            f"[green]Saved selection '{name}' ({len(sessions)} sessions)[/green]"
+        )
+
+
+@app.command()
+def load(
+    name: Annotated[
+        str,
+        typer.Argument(help="Name of the saved selection (from 'select save')"),
+    ],
+):
+    """Replace the current selection with a saved one."""
+    with Starbash("selection.load") as sb:
+        try:
+            sb.selection.load(name)
+        except ValueError as e:
+            console.print(f"[red]Error: {e}[/red]")
+            saved = sb.selection.saved_names()
+            if saved:
+                console.print(f"[yellow]Saved selections: {', '.join(saved)}[/yellow]")
+            raise typer.Exit(1)
+        sessions = sb.search_session()
+        console.print(
+            f"[green]Loaded selection '{name}' ({len(sessions)} sessions)[/green]"
+        )
+
+
 @app.command()
 def date(
     operation: Annotated[
@@ -132,7 +284,7 @@ def list_sessions(
 ):
     """List sessions (filtered based on the current selection)"""
 
-    with Starbash("selection.list") as sb:
+    with Starbash("selection.list", read_only=True) as sb:
         sessions = sb.search_session()
         if sessions and isinstance(sessions, list):
             len_all = sb.db.len_table(Database.SESSIONS_TABLE)
@@ -274,7 +426,7 @@ def export(
     Uses symbolic links when possible, otherwise copies files.
     The session number corresponds to the '#' column in 'select list' output.
     """
-    with Starbash("selection.export") as sb:
+    with Starbash("selection.export", read_only=True) as sb:
         # Get the selected session (convert from 1-based to 0-based index)
         session = selection_by_number(sb, session_num)
 
@@ -302,7 +454,7 @@ def show_selection(ctx: typer.Context):
     This is the default command when no subcommand is specified.
     """
     if ctx.invoked_subcommand is None:
-        with Starbash("selection.show") as sb:
+        with Starbash("selection.show", read_only=True) as sb:
             summary = sb.selection.summary()
 
             if summary["status"] == "all":
@@ -1,16 +1,59 @@
 from __future__ import annotations
 
+import logging
+import os
+import re
 import sqlite3
+import string
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, Iterable, Iterator, Optional
 from datetime import datetime, timedelta
 import json
 from typing import TypeAlias
 
 from .paths import get_user_data_dir
+from .sky import (
+    POSITION_KEYS,
+    cone_bounds,
+    image_position,
+    unit_vector,
+    vector_position,
+)
 
 SessionRow: TypeAlias = dict[str, Any]
 ImageRow: TypeAlias = dict[str, Any]
+FileSignature: TypeAlias = tuple[int, int, int]  # (size, mtime_ns, inode)
+
+
+def json_extract_expr(key: str, column: str = "metadata") -> str:
+    """Return the SQL expression extracting a FITS key from the images metadata JSON."""
+    if '"' in key or "'" in key:
+        raise ValueError(f"Unsupported metadata key: {key}")
+    return f"""json_extract({column}, '$."{key}"')"""
+
+
+# normalize_target_name() drops these characters and upper cases ASCII letters, exactly
+# like target_key_expr() does in SQL (whose upper() only knows about ASCII)
+_TARGET_KEY_TABLE = str.maketrans(string.ascii_lowercase, string.ascii_uppercase, " _")
+
+
+def normalize_target_name(name: str) -> str:
+    """Return the canonical form of a target name, i.e. "M 27" and "m_27" -> "M27".
+
+    This is also safe to use as a file or directory name.
+    """
+    return name.translate(_TARGET_KEY_TABLE)
+
+
+def target_key_expr(expr: str) -> str:
+    """Return the SQL computing normalize_target_name() of an SQL expression."""
+    return f"upper(replace(replace({expr}, ' ', ''), '_', ''))"
+
+
+def file_signature(st: os.stat_result) -> FileSignature:
+    """Return the signature we use to detect if a file has changed since it was indexed."""
+    return (st.st_size, st.st_mtime_ns, st.st_ino)
 
 
 def get_column_name(k: str) -> str:
@@ -29,6 +72,8 @@ class Database:
 
     The images table stores DATE-OBS and DATE as indexed SQL columns for
     efficient date-based queries, while other FITS metadata is stored in JSON.
+    Frequently queried keywords (see DEFAULT_PROMOTED_KEYS) are also copied into
+    typed, indexed columns of their own.
     """
 
     EXPTIME_KEY = "EXPTIME"
@@ -43,15 +88,111 @@ class Database:
     IMAGETYP_KEY = "IMAGETYP"
     OBJECT_KEY = "OBJECT"
     TELESCOP_KEY = "TELESCOP"
+    CCD_TEMP_KEY = "CCD-TEMP"
     ID_KEY = "id"  # for finding any row by its ID
 
     SESSIONS_TABLE = "sessions"
     IMAGES_TABLE = "images"
+    SIGNATURES_TABLE = "signatures"
+    PROMOTED_TABLE = "promoted_columns"
+    CALIBRATION_MATCHES_TABLE = "calibration_matches"
+    REINDEX_CHECKPOINTS_TABLE = "reindex_checkpoints"
+    CONTENT_HASHES_TABLE = "content_hashes"
+    ALIASES_TABLE = "image_aliases"
+    ROW_COUNTS_TABLE = "row_counts"
+    SESSION_STATS_TABLE = "session_stats"
+    SAVED_SELECTIONS_TABLE = "saved_selections"
+    SAVED_SELECTION_SESSIONS_TABLE = "saved_selection_sessions"
+    SESSION_CHANGES_TABLE = "session_changes"
+    IMAGE_POSITIONS_TABLE = "image_positions"
+    TARGET_ALIASES_TABLE = "target_aliases"
+
+    # Tables whose number of rows is tracked in ROW_COUNTS_TABLE (see len_table)
+    _COUNTED_TABLES = (IMAGES_TABLE, SESSIONS_TABLE)
+
+    # Session columns rolled up in SESSION_STATS_TABLE (see get_session_stats)
+    _STATS_COLUMNS = ("object", "filter", "telescop")
+
+    # FITS keywords which get their own indexed column in the images table (in addition
+    # to the metadata JSON), so they can be searched without parsing JSON
+    DEFAULT_PROMOTED_KEYS = (
+        CCD_TEMP_KEY,
+        EXPTIME_KEY,
+        FILTER_KEY,
+        IMAGETYP_KEY,
+        OBJECT_KEY,
+        TELESCOP_KEY,
+        "XBINNING",
+        "GAIN",
+        "OBJCTRA",
+        "OBJCTDEC",
+    )
+
+    # SQL types of the promoted columns, keywords not listed here get a column with no
+    # type affinity (so values are stored exactly as they were in the header)
+    PROMOTED_KEY_TYPES = {
+        CCD_TEMP_KEY: "REAL",
+        EXPTIME_KEY: "REAL",
+        FILTER_KEY: "TEXT",
+        IMAGETYP_KEY: "TEXT",
+        OBJECT_KEY: "TEXT",
+        TELESCOP_KEY: "TEXT",
+        "XBINNING": "INTEGER",
+        "GAIN": "REAL",
+        "OBJCTRA": "TEXT",
+        "OBJCTDEC": "TEXT",
+    }
+
+    # The fixed columns of the images table, keyed by the image record key they hold
+    _IMAGE_COLUMNS = {
+        ID_KEY: "id",
+        "path": "path",
+        DATE_OBS_KEY: "date_obs",
+        DATE_KEY: "date",
+    }
+
+    # Number of images written per transaction by upsert_images()
+    DEFAULT_BATCH_SIZE = 1000
+
+    # Frames of the same kind more than this far apart are in different sessions
+    SESSION_GAP_HOURS = 8
+
+    # What makes frames the same kind (see update_sessions): session column -> image key
+    _SESSION_KEYS = {
+        "filter": FILTER_KEY,
+        "imagetyp": IMAGETYP_KEY,
+        "object": OBJECT_KEY,
+        "telescop": TELESCOP_KEY,
+        "exptime": EXPTIME_KEY,
+    }
+    # Session keys which may be NULL (the others default to "unspecified")
+    _EXACT_SESSION_KEYS = ("exptime",)
+
+    # Keeps multi-row INSERTs well below SQLITE_MAX_VARIABLE_NUMBER
+    _MAX_ROWS_PER_INSERT = 200
+
+    # Connection tuning (see _apply_pragmas)
+    CACHE_SIZE_KIB = 64 * 1024
+    MMAP_SIZE = 256 * 1024 * 1024
+    BUSY_TIMEOUT_MS = 30 * 1000
 
     def __init__(
         self,
         base_dir: Optional[Path] = None,
+        read_only: bool = False,
+        promoted_keys: Optional[Iterable[str]] = None,
     ) -> None:
+        """Open (creating if needed) the application database.
+
+        Args:
+            base_dir: Directory holding the DB file, defaults to the user data directory.
+            read_only: Open a query-only connection.  Read-only connections never take
+                the write lock, so they can be used while another process (i.e. a long
+                'sb repo reindex') is writing.
+            promoted_keys: FITS keywords to store in their own columns, defaults to
+                DEFAULT_PROMOTED_KEYS.  Ignored by read-only connections, which use
+                whatever columns the database already has.
+        """
         # Resolve base data directory (allow override for tests)
         if base_dir is None:
             data_dir = get_user_data_dir()
@@ -61,17 +202,86 @@ class Database:
         db_filename = "db.sqlite3"
         self.db_path = data_dir / db_filename
 
+        # A read-only connection can't create (or upgrade) the DB, so the first run (of
+        # a new version) is always writable
+        self.read_only = (
+            read_only
+            and self.db_path.exists()
+            and self._schema_version() >= len(self._MIGRATIONS)
+        )
+
         # Open SQLite database
-        self._db = sqlite3.connect(str(self.db_path))
+        if self.read_only:
+            self._db = sqlite3.connect(f"{self.db_path.as_uri()}?mode=ro", uri=True)
+        else:
+            self._db = sqlite3.connect(str(self.db_path))
         self._db.row_factory = sqlite3.Row  # Enable column access by name
+        self._tx_depth = 0  # see transaction()
+        self._promoted: dict[str, str] = {}  # loaded below (migrations only use JSON)
+        self._canonical_targets = False  # sessions group canonical names (from v10)
+        self._apply_pragmas()
 
         # Initialize tables
-        self._init_tables()
+        if not self.read_only:
+            self._init_tables()
+            if promoted_keys is None:
+                promoted_keys = self.DEFAULT_PROMOTED_KEYS
+            self._sync_promoted_columns(promoted_keys)
+        self._canonical_targets = True
+
+        # FITS key -> column name, for the keywords which have been promoted
+        self._promoted = self._load_promoted_columns()
+
+    def _schema_version(self) -> int:
+        """Return the schema version of the (existing) DB file, without locking it."""
+        conn = sqlite3.connect(f"{self.db_path.as_uri()}?mode=ro", uri=True)
+        try:
+            return conn.execute("PRAGMA user_version").fetchone()[0]
+        finally:
+            conn.close()
+
+    def _apply_pragmas(self) -> None:
+        """Tune the connection for our workload.
+
+        WAL journaling lets readers run concurrently with a writer (and makes commits
+        much cheaper), synchronous=NORMAL is crash safe in WAL mode (only the last
+        transactions might be lost on power failure), and busy_timeout makes concurrent
+        writers wait for each other rather than failing with 'database is locked'.
+        """
+        cursor = self._db.cursor()
+        cursor.execute(f"PRAGMA busy_timeout = {self.BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA cache_size = {-self.CACHE_SIZE_KIB}")
+        cursor.execute(f"PRAGMA mmap_size = {self.MMAP_SIZE}")
+        cursor.execute("PRAGMA foreign_keys = ON")
+        if self.read_only:
+            cursor.execute("PRAGMA query_only = ON")
+        else:
+            # journal_mode is persistent (stored in the DB file) but cheap to reassert
+            cursor.execute("PRAGMA journal_mode = WAL")
+            cursor.execute("PRAGMA synchronous = NORMAL")
 
     def _init_tables(self) -> None:
-        """Create the images and sessions tables if they don't exist."""
-        cursor = self._db.cursor()
+        """Create the tables, or upgrade them from an older version of the schema.
 
+        The schema version is kept in the user_version pragma.  Each migration in
+        _MIGRATIONS upgrades the schema by one version and runs in its own transaction.
+        """
+        cursor = self._db.cursor()
+        version = cursor.execute("PRAGMA user_version").fetchone()[0]
+
+        for new_version, migration in enumerate(self._MIGRATIONS, start=1):
+            if new_version <= version:
+                continue
+            logging.debug("Migrating database to schema version %d", new_version)
+            with self.transaction():
+                # Python's sqlite3 doesn't start a transaction for DDL statements
+                if not self._db.in_transaction:
+                    cursor.execute("BEGIN")
+                migration(self, cursor)
+                cursor.execute(f"PRAGMA user_version = {new_version}")
+
+    def _migrate_v1(self, cursor: sqlite3.Cursor) -> None:
+        """The original schema (databases which predate versioning are already here)."""
         # Create images table with DATE-OBS and DATE as indexed columns
         cursor.execute(
             f"""
@@ -106,6 +316,26 @@ class Database:
         """
         )
 
+        # Create file signature table (used to skip rereading unchanged files on reindex)
+        cursor.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {self.SIGNATURES_TABLE} (
+                image_id INTEGER PRIMARY KEY REFERENCES {self.IMAGES_TABLE}(id) ON DELETE CASCADE,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                inode INTEGER NOT NULL
+            )
+        """
+        )
+
+        # Create index on the signature so moved files can be recognised
+        cursor.execute(
+            f"""
+            CREATE INDEX IF NOT EXISTS idx_signatures_inode
+            ON {self.SIGNATURES_TABLE}(inode, size, mtime_ns)
+        """
+        )
+
         # Create sessions table
         cursor.execute(
             f"""
@@ -132,15 +362,438 @@ class Database:
         """
         )
 
-        self._db.commit()
+    def _migrate_v2(self, cursor: sqlite3.Cursor) -> None:
+        """Add the table which tracks promoted columns (see _sync_promoted_columns)."""
+        cursor.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {self.PROMOTED_TABLE} (
+                key TEXT PRIMARY KEY,
+                column_name TEXT UNIQUE NOT NULL
+            )
+        """
+        )
+
+        # Superseded by the promoted columns (an index on a real column is smaller and
+        # also usable for numeric comparisons)
+        for key in (
+            self.FILTER_KEY,
+            self.IMAGETYP_KEY,
+            self.OBJECT_KEY,
+            self.TELESCOP_KEY,
+        ):
+            cursor.execute(f"DROP INDEX IF EXISTS idx_images_{get_column_name(key)}")
+
+    def _migrate_v3(self, cursor: sqlite3.Cursor) -> None:
+        """Add the table of ranked calibration candidates for each (light) session."""
+        cursor.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {self.CALIBRATION_MATCHES_TABLE} (
+                session_id INTEGER NOT NULL
+                    REFERENCES {self.SESSIONS_TABLE}(id) ON DELETE CASCADE,
+                imagetyp TEXT NOT NULL,
+                rank INTEGER NOT NULL,
+                candidate_id INTEGER NOT NULL
+                    REFERENCES {self.SESSIONS_TABLE}(id) ON DELETE CASCADE,
+                PRIMARY KEY (session_id, imagetyp, rank)
+            ) WITHOUT ROWID
+        """
+        )
+
+        # So deleting a calibration session can quickly find the matches it was part of
+        cursor.execute(
+            f"""
+            CREATE INDEX IF NOT EXISTS idx_calibration_matches_candidate
+            ON {self.CALIBRATION_MATCHES_TABLE}(candidate_id)
+        """
+        )
+
+    def _migrate_v4(self, cursor: sqlite3.Cursor) -> None:
+        """Add the table of reindex progress, so interrupted reindexes can resume."""
+        cursor.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {self.REINDEX_CHECKPOINTS_TABLE} (
+                repo TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                num_images INTEGER NOT NULL
+            )
+        """
+        )
+
+    def _migrate_v5(self, cursor: sqlite3.Cursor) -> None:
+        """Add the tables used to find duplicate files (see config.dedupe)."""
+        # Each content hash belongs to one (canonical) image
+        cursor.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {self.CONTENT_HASHES_TABLE} (
+                image_id INTEGER PRIMARY KEY
+                    REFERENCES {self.IMAGES_TABLE}(id) ON DELETE CASCADE,
+                hash TEXT NOT NULL UNIQUE
+            )
+        """
+        )
+
+        # Other copies of a canonical image (with the signature of the copy's file)
+        cursor.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {self.ALIASES_TABLE} (
+                path TEXT PRIMARY KEY,
+                image_id INTEGER NOT NULL
+                    REFERENCES {self.IMAGES_TABLE}(id) ON DELETE CASCADE,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                inode INTEGER NOT NULL
+            )
+        """
+        )
+        cursor.execute(
+            f"""
+            CREATE INDEX IF NOT EXISTS idx_image_aliases_image_id
+            ON {self.ALIASES_TABLE}(image_id)
+        """
+        )
+
+    def _migrate_v6(self, cursor: sqlite3.Cursor) -> None:
+        """Make exposure length part of what identifies a session, and rebuild them all.
+
+        Sessions now also end when their last exposure does (see update_sessions).
+        """
+        cursor.execute(f"ALTER TABLE {self.SESSIONS_TABLE} ADD COLUMN exptime REAL")
+        cursor.execute("DROP INDEX IF EXISTS idx_sessions_lookup")
+        cursor.execute(
+            f"""
+            CREATE INDEX idx_sessions_lookup ON {self.SESSIONS_TABLE}
+            (filter, imagetyp, object, telescop, exptime, start)
+        """
+        )
+
+        # Existing sessions take the exposure length of their reference image, so the
+        # rebuild below can keep their ids (and calibration matches) where possible
+        cursor.execute(
+            f"""
+            UPDATE {self.SESSIONS_TABLE} SET exptime = (
+                SELECT {self._image_key_expr(self.EXPTIME_KEY, "i")}
+                FROM {self.IMAGES_TABLE} i WHERE i.id = image_doc_id
+            )
+        """
+        )
+        self.update_sessions()
+
+    def _migrate_v7(self, cursor: sqlite3.Cursor) -> None:
+        """Add the row counts and session rollups, kept up to date by triggers.
+
+        These let 'sb info' and friends summarize huge databases without scanning them.
+        """
+        cursor.execute(
+            f"""
+            CREATE TABLE {self.ROW_COUNTS_TABLE} (
+                name TEXT PRIMARY KEY,
+                num_rows INTEGER NOT NULL
+            ) WITHOUT ROWID
+        """
+        )
+        for table in self._COUNTED_TABLES:
+            cursor.execute(
+                f"""
+                INSERT INTO {self.ROW_COUNTS_TABLE}
+                SELECT '{table}', COUNT(*) FROM {table}
+            """
+            )
+            for event, delta in (("INSERT", "+ 1"), ("DELETE", "- 1")):
+                cursor.execute(
+                    f"""
+                    CREATE TRIGGER {table}_count_{event.lower()}
+                    AFTER {event} ON {table} BEGIN
+                        UPDATE {self.ROW_COUNTS_TABLE} SET num_rows = num_rows {delta}
+                        WHERE name = '{table}';
+                    END
+                """
+                )
+
+        # The number of sessions, images and total exposure time for each target,
+        # filter and telescope (a session is counted once for each of its columns)
+        cursor.execute(
+            f"""
+            CREATE TABLE {self.SESSION_STATS_TABLE} (
+                attribute TEXT NOT NULL,
+                value TEXT NOT NULL,
+                num_sessions INTEGER NOT NULL,
+                num_images INTEGER NOT NULL,
+                exptime_total REAL NOT NULL,
+                PRIMARY KEY (attribute, value)
+            ) WITHOUT ROWID
+        """
+        )
+        for column in self._STATS_COLUMNS:
+            cursor.execute(
+                f"""
+                INSERT INTO {self.SESSION_STATS_TABLE}
+                SELECT '{column}', {column}, COUNT(*), SUM(num_images),
+                       TOTAL(exptime_total)
+                FROM {self.SESSIONS_TABLE}
+                GROUP BY {column}
+            """
+            )
+
+        def add(row: str, sign: str) -> str:
+            """SQL adding (or subtracting) a session row to the rollups."""
+            values = ", ".join(
+                f"('{column}', {row}.{column}, {sign}1, {sign}{row}.num_images, "
+                f"{sign}{row}.exptime_total)"
+                for column in self._STATS_COLUMNS
+            )
+            return f"""
+                INSERT INTO {self.SESSION_STATS_TABLE} VALUES {values}
+                ON CONFLICT (attribute, value) DO UPDATE SET
+                    num_sessions = num_sessions + excluded.num_sessions,
+                    num_images = num_images + excluded.num_images,
+                    exptime_total = exptime_total + excluded.exptime_total;
+            """
+
+        prune = f"DELETE FROM {self.SESSION_STATS_TABLE} WHERE num_sessions <= 0;"
+        changes = ", ".join(self._STATS_COLUMNS + ("num_images", "exptime_total"))
+        for name, event, body in (
+            ("insert", "INSERT", add("new", "")),
+            ("delete", "DELETE", add("old", "-")),
+            ("update", f"UPDATE OF {changes}", add("old", "-") + add("new", "")),
+        ):
+            cursor.execute(
+                f"""
+                CREATE TRIGGER {self.SESSION_STATS_TABLE}_{name}
+                AFTER {event} ON {self.SESSIONS_TABLE} BEGIN
+                    {body}
+                    {prune}
+                END
+            """
+            )
+
+    def _migrate_v8(self, cursor: sqlite3.Cursor) -> None:
+        """Add the cached results of saved selections (see search_saved_selection)."""
+        cursor.execute(
+            f"""
+            CREATE TABLE {self.SAVED_SELECTIONS_TABLE} (
+                name TEXT PRIMARY KEY,
+                where_clause TEXT NOT NULL,
+                params TEXT NOT NULL,
+                seq INTEGER NOT NULL
+            )
+        """
+        )
+        cursor.execute(
+            f"""
+            CREATE TABLE {self.SAVED_SELECTION_SESSIONS_TABLE} (
+                name TEXT NOT NULL
+                    REFERENCES {self.SAVED_SELECTIONS_TABLE}(name) ON DELETE CASCADE,
+                session_id INTEGER NOT NULL
+                    REFERENCES {self.SESSIONS_TABLE}(id) ON DELETE CASCADE,
+                PRIMARY KEY (name, session_id)
+            ) WITHOUT ROWID
+        """
+        )
+        cursor.execute(
+            f"""
+            CREATE INDEX idx_saved_selection_sessions_session_id
+            ON {self.SAVED_SELECTION_SESSIONS_TABLE}(session_id)
+        """
+        )
+
+        # The sessions added or changed since the saved selections were last brought up
+        # to date (deleted sessions simply drop out of them)
+        cursor.execute(
+            f"""
+            CREATE TABLE {self.SESSION_CHANGES_TABLE} (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id INTEGER NOT NULL
+            )
+        """
+        )
+        for event in ("INSERT", "UPDATE"):
+            cursor.execute(
+                f"""
+                CREATE TRIGGER {self.SESSION_CHANGES_TABLE}_{event.lower()}
+                AFTER {event} ON {self.SESSIONS_TABLE}
+                WHEN EXISTS (SELECT 1 FROM {self.SAVED_SELECTIONS_TABLE})
+                BEGIN
+                    INSERT INTO {self.SESSION_CHANGES_TABLE} (session_id)
+                    VALUES (new.id);
+                END
+            """
+            )
+
+    def _migrate_v9(self, cursor: sqlite3.Cursor) -> None:
+        """Add the spatial index of where images were pointed (see cone_condition)."""
+        # Each image is a point (its unit vector) in the R-tree, which only stores 32
+        # bit bounds, so the exact vector is kept alongside for the final check
+        cursor.execute(
+            f"""
+            CREATE VIRTUAL TABLE {self.IMAGE_POSITIONS_TABLE} USING rtree(
+                id, x_min, x_max, y_min, y_max, z_min, z_max, +x, +y, +z
+            )
+        """
+        )
+        cursor.execute(
+            f"""
+            CREATE TRIGGER {self.IMAGE_POSITIONS_TABLE}_delete
+            AFTER DELETE ON {self.IMAGES_TABLE} BEGIN
+                DELETE FROM {self.IMAGE_POSITIONS_TABLE} WHERE id = old.id;
+            END
+        """
+        )
+
+        keys = ", ".join(json_extract_expr(key) for key in POSITION_KEYS)
+        cursor.execute(f"SELECT id, {keys} FROM {self.IMAGES_TABLE}")
+        while rows := cursor.fetchmany(self.DEFAULT_BATCH_SIZE):
+            self._set_positions(
+                self._db.cursor(),
+                [(row[0], dict(zip(POSITION_KEYS, row[1:]))) for row in rows],
+            )
+
+    def _migrate_v10(self, cursor: sqlite3.Cursor) -> None:
+        """Group sessions by canonical target name (see canonical_target).
+
+        Sessions are relabelled with the normalised names of their targets and rebuilt,
+        which merges the sessions that were split by differently written names.
+        """
+        cursor.execute(
+            f"""
+            CREATE TABLE {self.TARGET_ALIASES_TABLE} (
+                alias TEXT PRIMARY KEY,
+                target TEXT NOT NULL
+            ) WITHOUT ROWID
+        """
+        )
+        cursor.execute(
+            f"""
+            CREATE INDEX idx_target_aliases_target
+            ON {self.TARGET_ALIASES_TABLE}(target)
+        """
+        )
+        cursor.execute(
+            f"CREATE INDEX idx_sessions_object ON {self.SESSIONS_TABLE}(object)"
+        )
+        self._canonical_targets = True
+        column = self._load_promoted_columns().get(self.OBJECT_KEY)
+        if column:
+            self._create_target_key_index(cursor, column)
+
+        cursor.execute(
+            f"""
+            UPDATE {self.SESSIONS_TABLE} SET object = {target_key_expr("object")}
+            WHERE object != 'unspecified'
+        """
+        )
+        self.update_sessions()
+
+    # Schema migrations, in order: the schema version is the number applied
+    _MIGRATIONS = (
+        _migrate_v1,
+        _migrate_v2,
+        _migrate_v3,
+        _migrate_v4,
+        _migrate_v5,
+        _migrate_v6,
+        _migrate_v7,
+        _migrate_v8,
+        _migrate_v9,
+        _migrate_v10,
+    )
+
+    def _sync_promoted_columns(self, keys: Iterable[str]) -> None:
+        """Make the promoted columns of the images table match the given keywords.
+
+        New columns are added, indexed and backfilled from the metadata JSON of the
+        images which are already in the database.  Columns for keywords which are no
+        longer wanted are dropped.
+        """
+        wanted: dict[str, str] = {}
+        for key in keys:
+            column = get_column_name(key)
+            if key in self._IMAGE_COLUMNS or column in self._IMAGE_COLUMNS.values():
+                continue  # already a column
+            if column == "metadata" or not re.fullmatch(r"[a-z_][a-z0-9_]*", column):
+                raise ValueError(f"Can't promote FITS keyword to a column: {key}")
+            wanted[key] = column
+
+        current = self._load_promoted_columns()
+        if current == wanted:
+            return
+
+        with self.transaction():
+            cursor = self._db.cursor()
+            if not self._db.in_transaction:
+                cursor.execute("BEGIN")
+
+            for key, column in current.items():
+                if wanted.get(key) != column:
+                    logging.debug("Removing promoted column %s", column)
+                    cursor.execute(f"DROP INDEX IF EXISTS idx_images_{column}")
+                    cursor.execute(f"DROP INDEX IF EXISTS idx_images_{column}_key")
+                    cursor.execute(
+                        f'ALTER TABLE {self.IMAGES_TABLE} DROP COLUMN "{column}"'
+                    )
+                    cursor.execute(
+                        f"DELETE FROM {self.PROMOTED_TABLE} WHERE key = ?", (key,)
+                    )
+
+            for key, column in wanted.items():
+                if current.get(key) == column:
+                    continue
+                logging.debug("Promoting %s to a column", key)
+                sql_type = self.PROMOTED_KEY_TYPES.get(key, "")
+                cursor.execute(
+                    f'ALTER TABLE {self.IMAGES_TABLE} ADD COLUMN "{column}" {sql_type}'
+                )
+                cursor.execute(
+                    f'UPDATE {self.IMAGES_TABLE} SET "{column}" = {json_extract_expr(key)}'
+                )
+                cursor.execute(
+                    f'CREATE INDEX idx_images_{column} ON {self.IMAGES_TABLE}("{column}")'
+                )
+                if key == self.OBJECT_KEY:
+                    self._create_target_key_index(cursor, column)
+                cursor.execute(
+                    f"INSERT INTO {self.PROMOTED_TABLE} (key, column_name) VALUES (?, ?)",
+                    (key, column),
+                )
+
+    def _load_promoted_columns(self) -> dict[str, str]:
+        """Return the FITS key -> column name map of the promoted columns in the DB."""
+        cursor = self._db.cursor()
+        try:
+            cursor.execute(f"SELECT key, column_name FROM {self.PROMOTED_TABLE}")
+        except sqlite3.OperationalError:
+            return {}  # A (read-only) database from before promoted columns existed
+        return {row["key"]: row["column_name"] for row in cursor.fetchall()}
+
+    # --- Transactions ---
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """Group all writes made inside the with block into a single transaction.
+
+        Nested uses join the outermost transaction, which commits when it exits (or rolls
+        back if an exception escapes it).
+        """
+        self._tx_depth += 1
+        try:
+            yield
+        except BaseException:
+            self._tx_depth -= 1
+            if self._tx_depth == 0:
+                self._db.rollback()
+            raise
+        self._tx_depth -= 1
+        if self._tx_depth == 0:
+            self._db.commit()
+
+    def _commit(self) -> None:
+        """Commit, unless we are inside a transaction() block (which will commit later)."""
+        if self._tx_depth == 0:
+            self._db.commit()
 
     # --- Convenience helpers for common image operations ---
-    def upsert_image(self, record: dict[str, Any]) -> int:
-        """Insert or update an image record by unique path.
+    def _image_values(self, record: dict[str, Any]) -> tuple[Any, ...]:
+        """Convert an image record into the column values of the images table.
 
-        The record must include a 'path' key; other keys are arbitrary FITS metadata.
-        DATE-OBS and DATE are extracted and stored as indexed columns for efficient queries.
-        Returns the rowid of the inserted/updated record.
+        The values are in the order used by _upsert_image_sql (path first).
         """
         path = record.get("path")
         if not path:
@@ -150,39 +803,544 @@ class Database:
         date_obs = record.get(self.DATE_OBS_KEY)
         date = record.get(self.DATE_KEY)
 
-        # Separate path and date fields from metadata
-        metadata = {k: v for k, v in record.items() if k != "path"}
-        metadata_json = json.dumps(metadata)
+        # Separate path and date fields from metadata
+        metadata = {k: v for k, v in record.items() if k != "path"}
+        metadata_json = json.dumps(metadata)
+        promoted = tuple(record.get(key) for key in self._promoted)
+        return (path, date_obs, date, metadata_json, *promoted)
+
+    def _upsert_image_sql(self, num_rows: int) -> str:
+        columns = ["path", "date_obs", "date", "metadata"]
+        columns += [f'"{column}"' for column in self._promoted.values()]
+        row = "(" + ", ".join(["?"] * len(columns)) + ")"
+        values = ", ".join([row] * num_rows)
+        updates = ",\n                ".join(
+            f"{column} = excluded.{column}" for column in columns[1:]
+        )
+        return f"""
+            INSERT INTO {self.IMAGES_TABLE} ({", ".join(columns)}) VALUES {values}
+            ON CONFLICT(path) DO UPDATE SET
+                {updates}
+            RETURNING id, path
+        """
+
+    def upsert_image(self, record: dict[str, Any]) -> int:
+        """Insert or update an image record by unique path.
+
+        The record must include a 'path' key; other keys are arbitrary FITS metadata.
+        DATE-OBS and DATE are extracted and stored as indexed columns for efficient queries.
+        Returns the rowid of the inserted/updated record.
+        """
+        values = self._image_values(record)
+
+        cursor = self._db.cursor()
+        cursor.execute(self._upsert_image_sql(1), values)
+        image_id = cursor.fetchall()[0]["id"]
+        self._set_positions(cursor, [(image_id, record)])
+
+        self._commit()
+        return image_id
+
+    def upsert_images(
+        self, records: Iterable[dict[str, Any]], batch_size: int = DEFAULT_BATCH_SIZE
+    ) -> Iterator[list[tuple[dict[str, Any], int]]]:
+        """Bulk insert or update image records (see upsert_image).
+
+        Records are written batch_size at a time, each batch in a single transaction.
+        After each batch is written a list of (record, image id) pairs is yielded - any
+        further writes the caller makes before asking for the next batch (i.e. the
+        sessions for those images) become part of the same transaction.  A batch is
+        committed when the caller asks for the next one, so the iterator must be run to
+        completion (abandoning it rolls back the batch in progress).
+
+        Records which can't be stored (missing path, or metadata which can't be
+        serialized) are logged and skipped.
+        """
+        batch: list[tuple[dict[str, Any], tuple[Any, ...]]] = []
+
+        def flush() -> Iterator[list[tuple[dict[str, Any], int]]]:
+            with self.transaction():
+                ids: dict[str, int] = {}
+                cursor = self._db.cursor()
+                # One multi-row statement per chunk (RETURNING rows come back in no
+                # particular order, so we map them back to records by path)
+                for i in range(0, len(batch), self._MAX_ROWS_PER_INSERT):
+                    chunk = batch[i : i + self._MAX_ROWS_PER_INSERT]
+                    params = [v for _, values in chunk for v in values]
+                    cursor.execute(self._upsert_image_sql(len(chunk)), params)
+                    ids.update((row["path"], row["id"]) for row in cursor.fetchall())
+                written = [(record, ids[values[0]]) for record, values in batch]
+                self._set_positions(
+                    cursor, ((image_id, record) for record, image_id in written)
+                )
+                yield written
+            batch.clear()
+
+        for record in records:
+            try:
+                batch.append((record, self._image_values(record)))
+            except (ValueError, TypeError) as e:
+                logging.warning("Failed to store image %s: %s", record.get("path"), e)
+                continue
+            if len(batch) >= batch_size:
+                yield from flush()
+        if batch:
+            yield from flush()
+
+    def _set_positions(
+        self, cursor: sqlite3.Cursor, images: Iterable[tuple[int, dict[str, Any]]]
+    ) -> None:
+        """Store (or forget) where (image id, record) pairs were pointed."""
+        rows = []
+        missing = []
+        for image_id, record in images:
+            position = image_position(record)
+            if position is None:
+                missing.append((image_id,))
+                continue
+            x, y, z = unit_vector(*position)
+            rows.append((image_id, x, x, y, y, z, z, x, y, z))
+        if rows:
+            cursor.executemany(
+                f"""
+                INSERT OR REPLACE INTO {self.IMAGE_POSITIONS_TABLE}
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+                rows,
+            )
+        if missing:
+            cursor.executemany(
+                f"DELETE FROM {self.IMAGE_POSITIONS_TABLE} WHERE id = ?", missing
+            )
+
+    @classmethod
+    def cone_condition(
+        cls, ra: float, dec: float, radius: float, column: str = "id"
+    ) -> tuple[str, list[Any]]:
+        """Return SQL which is true if an image was pointed within a cone.
+
+        The R-tree finds the images in the box around the cone, so this stays fast
+        however many images there are, then their exact positions are checked.
+
+        Args:
+            ra: The RA of the centre of the cone (degrees).
+            dec: The Dec of the centre of the cone (degrees).
+            radius: The radius of the cone (degrees).
+            column: The column holding the image id (i.e. image_doc_id for sessions).
+
+        Returns:
+            (SQL expression, list of parameters)
+        """
+        (x, y, z), chord, min_dot = cone_bounds(ra, dec, radius)
+        sql = f"""{column} IN (
+                SELECT id FROM {cls.IMAGE_POSITIONS_TABLE}
+                WHERE x_max >= ? AND x_min <= ? AND y_max >= ? AND y_min <= ?
+                  AND z_max >= ? AND z_min <= ?
+                  AND x * ? + y * ? + z * ? >= ?
+            )"""
+        params = [x - chord, x + chord, y - chord, y + chord, z - chord, z + chord]
+        return sql, params + [x, y, z, min_dot]
+
+    def search_images_near(self, ra: float, dec: float, radius: float) -> list[int]:
+        """Return the ids of the images pointed within radius degrees of (ra, dec)."""
+        sql, params = self.cone_condition(ra, dec, radius)
+        cursor = self._db.cursor()
+        cursor.execute(f"SELECT id FROM {self.IMAGES_TABLE} WHERE {sql}", params)
+        return [row[0] for row in cursor.fetchall()]
+
+    def get_target_position(self, target: str) -> tuple[float, float] | None:
+        """Return the (mean) RA/Dec (degrees) of the images of a target, if known.
+
+        Images named any of the target's names (see canonical_target) are included.
+        """
+        canonical = self.canonical_target(target)
+        cursor = self._db.cursor()
+        cursor.execute(
+            f"""
+            SELECT TOTAL(p.x), TOTAL(p.y), TOTAL(p.z), COUNT(*)
+            FROM {self.IMAGES_TABLE} i
+            JOIN {self.IMAGE_POSITIONS_TABLE} p ON p.id = i.id
+            WHERE {self._target_condition(self._image_key_expr(self.OBJECT_KEY, "i"))}
+        """,
+            (canonical, canonical),
+        )
+        x, y, z, count = cursor.fetchone()
+        return vector_position((x, y, z)) if count else None
+
+    @classmethod
+    def canonical_target_expr(cls, expr: str) -> str:
+        """Return the SQL computing canonical_target() of an SQL expression."""
+        return f"""(
+            SELECT COALESCE(a.target, k.name)
+            FROM (SELECT {target_key_expr(expr)} AS name) k
+            LEFT JOIN {cls.TARGET_ALIASES_TABLE} a ON a.alias = k.name
+        )"""
+
+    def _target_condition(self, expr: str) -> str:
+        """SQL which is true if the target named by expr has a canonical name.
+
+        Takes the canonical name as two parameters, and uses the index on the
+        normalised OBJECT column (see _create_target_key_index).
+        """
+        return f"""{target_key_expr(expr)} IN (
+            SELECT alias FROM {self.TARGET_ALIASES_TABLE} WHERE target = ?
+            UNION ALL SELECT ?
+        )"""
+
+    def _create_target_key_index(self, cursor: sqlite3.Cursor, column: str) -> None:
+        """Index the normalised target names of the images (column holds OBJECT)."""
+        cursor.execute(
+            f"""
+            CREATE INDEX IF NOT EXISTS idx_images_{column}_key
+            ON {self.IMAGES_TABLE}({target_key_expr(f'"{column}"')})
+        """
+        )
+
+    def get_target_aliases(self) -> dict[str, str]:
+        """Return the target aliases (normalised alias -> canonical target name)."""
+        cursor = self._db.cursor()
+        cursor.execute(f"SELECT alias, target FROM {self.TARGET_ALIASES_TABLE}")
+        return {row["alias"]: row["target"] for row in cursor.fetchall()}
+
+    def canonical_target(
+        self, name: str, aliases: dict[str, str] | None = None
+    ) -> str:
+        """Return the canonical name of a target, which sessions are grouped by.
+
+        That is the normalised name (see normalize_target_name), or the target it is an
+        alias of.
+
+        Args:
+            name: The target name (i.e. an OBJECT header).
+            aliases: The result of get_target_aliases(), if already known.
+        """
+        if aliases is None:
+            aliases = self.get_target_aliases()
+        key = normalize_target_name(name)
+        return aliases.get(key, key)
+
+    def add_target_alias(self, alias: str, target: str) -> set[int]:
+        """Make alias another name for target, merging their sessions.
+
+        The sessions of the alias are simply relabelled, and only those which now
+        overlap sessions of the target are rebuilt (rather than reindexing anything).
+
+        Returns:
+            The ids of the sessions which are new or have a new reference image (see
+            update_sessions).
+
+        Raises:
+            ValueError: If alias is the same name as target.
+        """
+        key = normalize_target_name(alias)
+        canonical = self.canonical_target(target)
+        if not key or key == canonical:
+            raise ValueError(f"'{alias}' is already named '{canonical}'")
+
+        cursor = self._db.cursor()
+        with self.transaction():
+            self._forget_saved_selections()
+            changed = set()
+            if self.canonical_target(key) != key:
+                # It was an alias of another target, so has to be split off that first
+                changed = self.remove_target_alias(key)
+
+            # Names which were aliases of alias are now aliases of target too
+            cursor.execute(
+                f"UPDATE {self.TARGET_ALIASES_TABLE} SET target = ? WHERE target = ?",
+                (canonical, key),
+            )
+            cursor.execute(
+                f"INSERT INTO {self.TARGET_ALIASES_TABLE} VALUES (?, ?)",
+                (key, canonical),
+            )
+
+            cursor.execute(
+                f"""
+                UPDATE {self.SESSIONS_TABLE} SET object = ? WHERE object = ?
+                RETURNING filter, imagetyp, telescop, exptime, start
+            """,
+                (canonical, key),
+            )
+            relabelled = [
+                {
+                    self.FILTER_KEY: row["filter"],
+                    self.IMAGETYP_KEY: row["imagetyp"],
+                    self.OBJECT_KEY: canonical,
+                    self.TELESCOP_KEY: row["telescop"],
+                    self.EXPTIME_KEY: row["exptime"],
+                    self.DATE_OBS_KEY: row["start"],
+                }
+                for row in cursor.fetchall()
+            ]
+            # Join up the sessions of both names which are now one
+            changed |= self.update_sessions(relabelled)
+        return changed
+
+    def remove_target_alias(self, alias: str) -> set[int]:
+        """Stop alias being another name for a target, splitting their sessions again.
+
+        Returns:
+            The ids of the sessions which are new or have a new reference image (see
+            update_sessions), nothing if alias wasn't an alias.
+        """
+        key = normalize_target_name(alias)
+        target = self.get_target_aliases().get(key)
+        if target is None:
+            return set()
+
+        with self.transaction():
+            self._forget_saved_selections()
+            self._db.execute(
+                f"DELETE FROM {self.TARGET_ALIASES_TABLE} WHERE alias = ?", (key,)
+            )
+            # Rebuild the sessions the images had, and will now have
+            images = self.search_image({"target": key})
+            images += [{**image, self.OBJECT_KEY: target} for image in images]
+            return self.update_sessions(images)
+
+    def upsert_signature(self, image_id: int, signature: FileSignature) -> None:
+        """Record the (size, mtime_ns, inode) signature of the file for an image."""
+        self.upsert_signatures([(image_id, signature)])
+
+    def upsert_signatures(
+        self, signatures: Iterable[tuple[int, FileSignature]]
+    ) -> None:
+        """Record the file signatures for many images (see upsert_signature)."""
+        cursor = self._db.cursor()
+        cursor.executemany(
+            f"""
+            INSERT INTO {self.SIGNATURES_TABLE} (image_id, size, mtime_ns, inode) VALUES (?, ?, ?, ?)
+            ON CONFLICT(image_id) DO UPDATE SET
+                size = excluded.size,
+                mtime_ns = excluded.mtime_ns,
+                inode = excluded.inode
+        """,
+            [(image_id, *signature) for image_id, signature in signatures],
+        )
+        self._commit()
+
+    def _signatures_source(self, aliases: bool) -> str:
+        """A FROM clause giving (path, size, mtime_ns, inode) of images or aliases."""
+        if aliases:
+            return self.ALIASES_TABLE
+        return f"""(
+            SELECT i.path, s.size, s.mtime_ns, s.inode
+            FROM {self.IMAGES_TABLE} i
+            LEFT JOIN {self.SIGNATURES_TABLE} s ON s.image_id = i.id
+        )"""
+
+    def get_signatures(
+        self, dir: str, aliases: bool = False
+    ) -> dict[str, FileSignature | None]:
+        """Return the file signatures of all images stored under the given directory.
+
+        Images which are indexed but have no signature yet (i.e. they were indexed by an
+        older version of starbash) map to None.
+
+        Args:
+            dir: The directory.
+            aliases: Return the signatures of duplicate files (see add_alias) instead.
+        """
+        # A range query (rather than LIKE) so the path index can be used
+        prefix = dir.rstrip(os.sep) + os.sep
+        prefix_end = prefix[:-1] + chr(ord(os.sep) + 1)
+
+        cursor = self._db.cursor()
+        cursor.execute(
+            f"""
+            SELECT path, size, mtime_ns, inode
+            FROM {self._signatures_source(aliases)}
+            WHERE path >= ? AND path < ?
+        """,
+            (prefix, prefix_end),
+        )
+
+        return {
+            row["path"]: (
+                (row["size"], row["mtime_ns"], row["inode"])
+                if row["size"] is not None
+                else None
+            )
+            for row in cursor.fetchall()
+        }
+
+    def get_file_signatures(
+        self, paths: Iterable[str], aliases: bool = False
+    ) -> dict[str, FileSignature | None]:
+        """Return the file signatures of the given paths which are indexed images.
+
+        Like get_signatures, but for specific files rather than a whole directory.
+        """
+        paths = list(paths)
+        results: dict[str, FileSignature | None] = {}
+        cursor = self._db.cursor()
+        for i in range(0, len(paths), self._MAX_ROWS_PER_INSERT):
+            chunk = paths[i : i + self._MAX_ROWS_PER_INSERT]
+            placeholders = ", ".join("?" * len(chunk))
+            cursor.execute(
+                f"""
+                SELECT path, size, mtime_ns, inode
+                FROM {self._signatures_source(aliases)}
+                WHERE path IN ({placeholders})
+            """,
+                chunk,
+            )
+            for row in cursor.fetchall():
+                results[row["path"]] = (
+                    (row["size"], row["mtime_ns"], row["inode"])
+                    if row["size"] is not None
+                    else None
+                )
+        return results
+
+    def find_images_by_signature(self, signature: FileSignature) -> list[str]:
+        """Return the paths of all images whose file had the given signature when indexed."""
+        cursor = self._db.cursor()
+        cursor.execute(
+            f"""
+            SELECT i.path FROM {self.SIGNATURES_TABLE} s
+            JOIN {self.IMAGES_TABLE} i ON i.id = s.image_id
+            WHERE s.inode = ? AND s.size = ? AND s.mtime_ns = ?
+        """,
+            (signature[2], signature[0], signature[1]),
+        )
+        return [row["path"] for row in cursor.fetchall()]
+
+    def rename_image(self, old_path: str, new_path: str) -> None:
+        """Change the path of an indexed image (i.e. because the file was moved)."""
+        cursor = self._db.cursor()
+        cursor.execute(
+            f"UPDATE {self.IMAGES_TABLE} SET path = ? WHERE path = ?",
+            (new_path, old_path),
+        )
+        self._commit()
+
+    def remove_image(self, path: str) -> ImageRow | None:
+        """Remove an image record by path.
+
+        Returns the removed record (or None if no such image was indexed).
+        """
+        image = self.get_image(path)
+        if image is not None:
+            cursor = self._db.cursor()
+            cursor.execute(
+                f"DELETE FROM {self.IMAGES_TABLE} WHERE id = ?", (image["id"],)
+            )
+            self._commit()
+        return image
+
+    def set_content_hash(self, image_id: int, content_hash: str) -> None:
+        """Record the content hash of an image (see fitsheader.content_hash).
+
+        If another image had this hash, its hash was stale (its file has changed since
+        it was indexed), so it is forgotten.
+        """
+        cursor = self._db.cursor()
+        cursor.execute(
+            f"DELETE FROM {self.CONTENT_HASHES_TABLE} WHERE hash = ? AND image_id != ?",
+            (content_hash, image_id),
+        )
+        cursor.execute(
+            f"""
+            INSERT INTO {self.CONTENT_HASHES_TABLE} (image_id, hash) VALUES (?, ?)
+            ON CONFLICT(image_id) DO UPDATE SET hash = excluded.hash
+        """,
+            (image_id, content_hash),
+        )
+        self._commit()
+
+    def find_image_by_hash(self, content_hash: str) -> tuple[int, str] | None:
+        """Return the (id, path) of the image with the given content hash (if any)."""
+        cursor = self._db.cursor()
+        cursor.execute(
+            f"""
+            SELECT i.id, i.path FROM {self.CONTENT_HASHES_TABLE} h
+            JOIN {self.IMAGES_TABLE} i ON i.id = h.image_id
+            WHERE h.hash = ?
+        """,
+            (content_hash,),
+        )
+        row = cursor.fetchone()
+        return (row["id"], row["path"]) if row else None
+
+    def add_alias(self, path: str, image_id: int, signature: FileSignature) -> None:
+        """Record that the file at path is a duplicate of an (already indexed) image.
 
+        Aliases aren't images: they are not counted in sessions or exported.
+        """
         cursor = self._db.cursor()
         cursor.execute(
             f"""
-            INSERT INTO {self.IMAGES_TABLE} (path, date_obs, date, metadata) VALUES (?, ?, ?, ?)
+            INSERT INTO {self.ALIASES_TABLE} (path, image_id, size, mtime_ns, inode)
+            VALUES (?, ?, ?, ?, ?)
             ON CONFLICT(path) DO UPDATE SET
-                date_obs = excluded.date_obs,
-                date = excluded.date,
-                metadata = excluded.metadata
+                image_id = excluded.image_id,
+                size = excluded.size,
+                mtime_ns = excluded.mtime_ns,
+                inode = excluded.inode
         """,
-            (path, date_obs, date, metadata_json),
+            (path, image_id, *signature),
         )
+        self._commit()
+
+    def remove_alias(self, path: str) -> bool:
+        """Forget an alias, returning True if there was one."""
+        cursor = self._db.cursor()
+        cursor.execute(f"DELETE FROM {self.ALIASES_TABLE} WHERE path = ?", (path,))
+        self._commit()
+        return cursor.rowcount > 0
 
-        self._db.commit()
+    def get_aliases(self, path: str) -> list[str]:
+        """Return the paths of the duplicates of the image at path."""
+        cursor = self._db.cursor()
+        cursor.execute(
+            f"""
+            SELECT a.path FROM {self.ALIASES_TABLE} a
+            JOIN {self.IMAGES_TABLE} i ON i.id = a.image_id
+            WHERE i.path = ?
+            ORDER BY a.path
+        """,
+            (path,),
+        )
+        return [row["path"] for row in cursor.fetchall()]
 
-        # Get the rowid of the inserted/updated record
-        cursor.execute(f"SELECT id FROM {self.IMAGES_TABLE} WHERE path = ?", (path,))
-        result = cursor.fetchone()
-        if result:
-            return result[0]
-        return cursor.lastrowid if cursor.lastrowid is not None else 0
+    def promote_alias(self, path: str) -> None:
+        """Make the alias at path its image's canonical file (replacing the old path).
+
+        Used when the canonical file of an image has been deleted, but a copy remains.
+        """
+        cursor = self._db.cursor()
+        cursor.execute(
+            f"""
+            DELETE FROM {self.ALIASES_TABLE} WHERE path = ?
+            RETURNING image_id, size, mtime_ns, inode
+        """,
+            (path,),
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            raise ValueError(f"Not an alias: {path}")
+        row = rows[0]
+        cursor.execute(
+            f"UPDATE {self.IMAGES_TABLE} SET path = ? WHERE id = ?",
+            (path, row["image_id"]),
+        )
+        self.upsert_signatures(
+            [(row["image_id"], (row["size"], row["mtime_ns"], row["inode"]))]
+        )
 
     def search_image(self, conditions: dict[str, Any]) -> list[SessionRow]:
         """Search for images matching the given conditions.
 
         Args:
-            conditions: Dictionary of metadata key-value pairs to match.
+            conditions: Dictionary of metadata key-value pairs to match (a value of None
+                       matches images which don't have that key).
                        Special keys:
                        - 'date_start': Filter images with DATE-OBS >= this date
                        - 'date_end': Filter images with DATE-OBS <= this date
+                       - 'target': Images of the target with this canonical name
+                         (see canonical_target), None for images without an OBJECT
 
         Returns:
             List of matching image records or None if no matches
@@ -196,6 +1354,15 @@ class Database:
         where_clauses = []
         params = []
 
+        if "target" in conditions_copy:
+            target = conditions_copy.pop("target")
+            object_expr = self._image_key_expr(self.OBJECT_KEY)
+            if target is None:
+                where_clauses.append(f"{object_expr} IS NULL")
+            else:
+                where_clauses.append(self._target_condition(object_expr))
+                params += [target, target]
+
         if date_start:
             where_clauses.append("date_obs >= ?")
             params.append(date_start)
@@ -204,6 +1371,17 @@ class Database:
             where_clauses.append("date_obs <= ?")
             params.append(date_end)
 
+        # All other conditions are also evaluated by SQLite (so only matching rows are
+        # returned), using the JSON1 extension for keys which aren't columns.
+        for key, value in conditions_copy.items():
+            expr = self._image_key_expr(key)
+            if value is None:
+                # Matches images which don't have this key at all
+                where_clauses.append(f"{expr} IS NULL")
+            else:
+                where_clauses.append(f"{expr} = ?")
+                params.append(value)
+
         # Build the query
         query = f"SELECT id, path, date_obs, date, metadata FROM {self.IMAGES_TABLE}"
         if where_clauses:
@@ -212,25 +1390,36 @@ class Database:
         cursor = self._db.cursor()
         cursor.execute(query, params)
 
-        results = []
-        for row in cursor.fetchall():
-            metadata = json.loads(row["metadata"])
-            metadata["path"] = row["path"]
-            metadata["id"] = row["id"]
-
-            # Add date fields back to metadata for compatibility
-            if row["date_obs"]:
-                metadata[self.DATE_OBS_KEY] = row["date_obs"]
-            if row["date"]:
-                metadata[self.DATE_KEY] = row["date"]
+        return [self._row_to_image(row) for row in cursor.fetchall()]
 
-            # Check if remaining conditions match (those stored in JSON metadata)
-            match = all(metadata.get(k) == v for k, v in conditions_copy.items())
+    def _image_key_expr(self, key: str, table: str | None = None) -> str:
+        """Return the SQL expression for an image key (a column or a JSON field).
 
-            if match:
-                results.append(metadata)
+        Args:
+            key: The image record key.
+            table: If set, the alias used for the images table in the query.
+        """
+        prefix = f"{table}." if table else ""
+        column = self._IMAGE_COLUMNS.get(key)
+        if column:
+            return prefix + column
+        column = self._promoted.get(key)
+        if column:
+            return f'{prefix}"{column}"'
+        return json_extract_expr(key, prefix + "metadata")
+
+    def _row_to_image(self, row: sqlite3.Row) -> ImageRow:
+        """Convert a row of the images table back into an image record."""
+        metadata = json.loads(row["metadata"])
+        metadata["path"] = row["path"]
+        metadata["id"] = row["id"]
 
-        return results
+        # Add date fields back to metadata for compatibility
+        if row["date_obs"]:
+            metadata[self.DATE_OBS_KEY] = row["date_obs"]
+        if row["date"]:
+            metadata[self.DATE_KEY] = row["date"]
+        return metadata
 
     def search_session(self, where_tuple: tuple[str, list[Any]] = ("", [])) -> list[SessionRow]:
         """Search for sessions matching the given conditions.
@@ -250,7 +1439,7 @@ class Database:
         # Build the query
         query = f"""
             SELECT id, start, end, filter, imagetyp, object, telescop,
-                   num_images, exptime_total, image_doc_id
+                   exptime, num_images, exptime_total, image_doc_id
             FROM {self.SESSIONS_TABLE}
             {where_clause}
         """
@@ -261,13 +1450,136 @@ class Database:
         results = [dict(row) for row in cursor.fetchall()]
         return results
 
+    def search_session_images(
+        self, where_tuple: tuple[str, list[Any]], keys: Iterable[str]
+    ) -> list[tuple[SessionRow, dict[str, Any] | None]]:
+        """Search for sessions (see search_session) along with their reference images.
+
+        The given keys of each session's reference image are fetched by the same query
+        as the sessions themselves (rather than one query per session).
+
+        Returns:
+            List of (session record, {key: value} for its reference image) pairs.  The
+            image dict is None if the session's reference image is missing.
+        """
+        keys = list(keys)
+        where_clause, params = where_tuple
+
+        image_columns = "".join(
+            f", {self._image_key_expr(key, 'i')} AS image_{n}"
+            for n, key in enumerate(keys)
+        )
+        query = f"""
+            SELECT s.*, i.id AS image_id{image_columns}
+            FROM (
+                SELECT id, start, end, filter, imagetyp, object, telescop,
+                       exptime, num_images, exptime_total, image_doc_id
+                FROM {self.SESSIONS_TABLE}
+                {where_clause}
+            ) s
+            LEFT JOIN {self.IMAGES_TABLE} i ON i.id = s.image_doc_id
+        """
+
+        cursor = self._db.cursor()
+        cursor.execute(query, params)
+
+        results = []
+        for row in cursor.fetchall():
+            session = dict(row)
+            image_id = session.pop("image_id")
+            values = {key: session.pop(f"image_{n}") for n, key in enumerate(keys)}
+            results.append((session, values if image_id is not None else None))
+        return results
+
     def len_table(self, table_name: str) -> int:
-        """Return the total number of rows in the specified table."""
+        """Return the total number of rows in the specified table.
+
+        The images and sessions tables have their rows counted as they change, so this
+        doesn't need to scan them.
+        """
         cursor = self._db.cursor()
-        cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
+        if table_name in self._COUNTED_TABLES:
+            cursor.execute(
+                f"SELECT num_rows FROM {self.ROW_COUNTS_TABLE} WHERE name = ?",
+                (table_name,),
+            )
+        else:
+            cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
         result = cursor.fetchone()
         return result[0] if result else 0
 
+    def get_session_stats(
+        self, column: str, where_tuple: tuple[str, list[Any]] | None = None
+    ) -> dict[str, dict[str, Any]]:
+        """Summarize the sessions by target, filter or telescope.
+
+        Args:
+            column: The session column to group by ("object", "filter" or "telescop").
+            where_tuple: If set, only summarize the sessions matching this WHERE clause
+                         (see search_session).  Otherwise the summary is read straight
+                         from the rollups (without looking at the sessions at all).
+
+        Returns:
+            value -> {"num_sessions", "num_images", "exptime_total"} for each value of
+            the column.
+        """
+        if column not in self._STATS_COLUMNS:
+            raise ValueError(f"Sessions are not summarized by {column}")
+
+        cursor = self._db.cursor()
+        if where_tuple is None:
+            cursor.execute(
+                f"""
+                SELECT value, num_sessions, num_images, exptime_total
+                FROM {self.SESSION_STATS_TABLE}
+                WHERE attribute = ?
+            """,
+                (column,),
+            )
+        else:
+            where_clause, params = where_tuple
+            cursor.execute(
+                f"""
+                SELECT {column} AS value, COUNT(*) AS num_sessions,
+                       TOTAL(num_images) AS num_images,
+                       TOTAL(exptime_total) AS exptime_total
+                FROM {self.SESSIONS_TABLE}
+                {where_clause}
+                GROUP BY {column}
+            """,
+                params,
+            )
+        return {
+            row["value"]: {
+                "num_sessions": row["num_sessions"],
+                "num_images": int(row["num_images"]),
+                "exptime_total": row["exptime_total"],
+            }
+            for row in cursor.fetchall()
+        }
+
+    def get_session_totals(self) -> dict[str, Any]:
+        """Return the total number of sessions, their images and exposure time.
+
+        Read from the rollups (see get_session_stats), so this is instant however many
+        sessions there are.
+        """
+        # Every session has exactly one filter, so the filter rollups add up to totals
+        cursor = self._db.cursor()
+        cursor.execute(
+            f"""
+            SELECT TOTAL(num_sessions), TOTAL(num_images), TOTAL(exptime_total)
+            FROM {self.SESSION_STATS_TABLE}
+            WHERE attribute = 'filter'
+        """
+        )
+        num_sessions, num_images, exptime_total = cursor.fetchone()
+        return {
+            "num_sessions": int(num_sessions),
+            "num_images": int(num_images),
+            "exptime_total": exptime_total,
+        }
+
     def get_column(self, table_name: str, column_name: str) -> list[Any]:
         """Return all values from a specific column in the specified table."""
         cursor = self._db.cursor()
@@ -298,17 +1610,7 @@ class Database:
         if row is None:
             return None
 
-        metadata = json.loads(row["metadata"])
-        metadata["path"] = row["path"]
-        metadata["id"] = row["id"]
-
-        # Add date fields back to metadata for compatibility
-        if row["date_obs"]:
-            metadata[self.DATE_OBS_KEY] = row["date_obs"]
-        if row["date"]:
-            metadata[self.DATE_KEY] = row["date"]
-
-        return metadata
+        return self._row_to_image(row)
 
     def all_images(self) -> list[ImageRow]:
         """Return all image records."""
@@ -317,21 +1619,7 @@ class Database:
             f"SELECT id, path, date_obs, date, metadata FROM {self.IMAGES_TABLE}"
         )
 
-        results = []
-        for row in cursor.fetchall():
-            metadata = json.loads(row["metadata"])
-            metadata["path"] = row["path"]
-            metadata["id"] = row["id"]
-
-            # Add date fields back to metadata for compatibility
-            if row["date_obs"]:
-                metadata[self.DATE_OBS_KEY] = row["date_obs"]
-            if row["date"]:
-                metadata[self.DATE_KEY] = row["date"]
-
-            results.append(metadata)
-
-        return results
+        return [self._row_to_image(row) for row in cursor.fetchall()]
 
     def get_session_by_id(self, session_id: int) -> dict[str, Any] | None:
         """Get a session record by its ID.
@@ -346,7 +1634,7 @@ class Database:
         cursor.execute(
             f"""
             SELECT id, start, end, filter, imagetyp, object, telescop,
-                   num_images, exptime_total, image_doc_id
+                   exptime, num_images, exptime_total, image_doc_id
             FROM {self.SESSIONS_TABLE}
             WHERE id = ?
         """,
@@ -362,8 +1650,8 @@ class Database:
     def get_session(self, to_find: dict[str, str]) -> SessionRow | None:
         """Find a session matching the given criteria.
 
-        Searches for sessions with the same filter, image type, target, and telescope
-        whose start time is within +/- 8 hours of the provided date.
+        Searches for sessions with the same filter, image type, target, telescope and
+        exposure length whose start time is within +/- 8 hours of the provided date.
         """
         date = to_find.get(Database.START_KEY)
         assert date
@@ -373,7 +1661,9 @@ class Database:
         assert filter
         target = to_find.get(Database.OBJECT_KEY)
         assert target
+        target = self.canonical_target(target)
         telescop = to_find.get(Database.TELESCOP_KEY, "unspecified")
+        exptime = to_find.get(Database.EXPTIME_KEY)
 
         # Convert the provided ISO8601 date string to a datetime, then
         # search for sessions with the same filter whose start time is
@@ -389,13 +1679,13 @@ class Database:
         cursor.execute(
             f"""
             SELECT id, start, end, filter, imagetyp, object, telescop,
-                   num_images, exptime_total, image_doc_id
+                   exptime, num_images, exptime_total, image_doc_id
             FROM {self.SESSIONS_TABLE}
             WHERE filter = ? AND imagetyp = ? AND object = ? AND telescop = ?
-              AND start >= ? AND start <= ?
+              AND exptime IS ? AND start >= ? AND start <= ?
             LIMIT 1
         """,
-            (filter, image_type, target, telescop, start_min, start_max),
+            (filter, image_type, target, telescop, exptime, start_min, start_max),
         )
 
         row = cursor.fetchone()
@@ -404,21 +1694,53 @@ class Database:
 
         return dict(row)
 
+    def update_session(self, session_id: int, new: SessionRow) -> None:
+        """Replace the start/end, totals and reference image of an existing session."""
+        cursor = self._db.cursor()
+        cursor.execute(
+            f"""
+            UPDATE {self.SESSIONS_TABLE}
+            SET start = ?, end = ?, num_images = ?, exptime_total = ?, image_doc_id = ?
+            WHERE id = ?
+        """,
+            (
+                new[Database.START_KEY],
+                new[Database.END_KEY],
+                new[Database.NUM_IMAGES_KEY],
+                new[Database.EXPTIME_TOTAL_KEY],
+                new[Database.IMAGE_DOC_KEY],
+                session_id,
+            ),
+        )
+        self._commit()
+
+    def delete_session(self, session_id: int) -> None:
+        """Remove a session record."""
+        cursor = self._db.cursor()
+        cursor.execute(
+            f"DELETE FROM {self.SESSIONS_TABLE} WHERE id = ?", (session_id,)
+        )
+        self._commit()
+
     def upsert_session(
         self, new: SessionRow, existing: SessionRow | None = None
-    ) -> None:
-        """Insert or update a session record."""
+    ) -> int:
+        """Insert or update a session record.
+
+        Returns the id of the session.
+        """
         cursor = self._db.cursor()
 
         if existing:
             # Update existing session with new data
             updated_start = min(new[Database.START_KEY], existing[Database.START_KEY])
             updated_end = max(new[Database.END_KEY], existing[Database.END_KEY])
-            updated_num_images = existing.get(Database.NUM_IMAGES_KEY, 0) + new.get(
-                Database.NUM_IMAGES_KEY, 0
-            )
+            # existing is a row from the DB, so its keys are column names
+            updated_num_images = existing.get(
+                get_column_name(Database.NUM_IMAGES_KEY), 0
+            ) + new.get(Database.NUM_IMAGES_KEY, 0)
             updated_exptime_total = existing.get(
-                Database.EXPTIME_TOTAL_KEY, 0
+                get_column_name(Database.EXPTIME_TOTAL_KEY), 0
             ) + new.get(Database.EXPTIME_TOTAL_KEY, 0)
 
             cursor.execute(
@@ -435,13 +1757,15 @@ class Database:
                     existing["id"],
                 ),
             )
+            session_id = existing["id"]
         else:
             # Insert new session
             cursor.execute(
                 f"""
                 INSERT INTO {self.SESSIONS_TABLE}
-                (start, end, filter, imagetyp, object, telescop, num_images, exptime_total, image_doc_id)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                (start, end, filter, imagetyp, object, telescop, exptime, num_images,
+                 exptime_total, image_doc_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """,
                 (
                     new[Database.START_KEY],
@@ -450,13 +1774,552 @@ class Database:
                     new[Database.IMAGETYP_KEY],
                     new[Database.OBJECT_KEY],
                     new.get(Database.TELESCOP_KEY, "unspecified"),
+                    new.get(Database.EXPTIME_KEY),
                     new[Database.NUM_IMAGES_KEY],
                     new[Database.EXPTIME_TOTAL_KEY],
                     new.get(Database.IMAGE_DOC_KEY),
                 ),
             )
+            session_id = cursor.lastrowid
+            assert session_id is not None
+
+        self._commit()
+        return session_id
+
+    def _session_key_values(
+        self, image: dict[str, Any], aliases: dict[str, str]
+    ) -> tuple[Any, ...] | None:
+        """The session key values (see _SESSION_KEYS) of an image record.
+
+        Returns None if the image can't be part of a session (it has no DATE-OBS or
+        IMAGETYP).  A missing filter, target or telescope is "unspecified", the target
+        is its canonical name (see canonical_target, aliases as get_target_aliases).
+        """
+        if not image.get(self.DATE_OBS_KEY) or not image.get(self.IMAGETYP_KEY):
+            return None
+        values = []
+        for column, key in self._SESSION_KEYS.items():
+            value = image.get(key)
+            if column == "object" and value is not None and self._canonical_targets:
+                value = self.canonical_target(str(value), aliases)
+            if value is None and column not in self._EXACT_SESSION_KEYS:
+                value = "unspecified"
+            values.append(value)
+        return tuple(values)
+
+    def _session_key_exprs(self, table: str) -> str:
+        """SQL selecting the session key columns from the images table (as table)."""
+        exprs = []
+        for column, key in self._SESSION_KEYS.items():
+            expr = self._image_key_expr(key, table)
+            if column == "object" and self._canonical_targets:
+                expr = self.canonical_target_expr(expr)
+            if column not in self._EXACT_SESSION_KEYS:
+                expr = f"COALESCE({expr}, 'unspecified')"
+            exprs.append(f"{expr} AS {column}")
+        return ", ".join(exprs)
+
+    def _same_session_keys(self, a: str, b: str) -> str:
+        """SQL which is true if two tables' rows have the same session key columns."""
+        return " AND ".join(
+            f"{a}.{column} IS {b}.{column}" for column in self._SESSION_KEYS
+        )
+
+    def update_sessions(
+        self, images: Iterable[dict[str, Any]] | None = None
+    ) -> set[int]:
+        """Rebuild the sessions of (and around) the given images from the images table.
+
+        Frames are grouped by filter, image type, target (its canonical name, see
+        canonical_target), telescope and exposure length, and each group is split into
+        sessions wherever consecutive frames are more than SESSION_GAP_HOURS apart.  A
+        session ends when its last exposure does (DATE-OBS + EXPTIME).  This is done in
+        a handful of set based statements, so updating the sessions for a whole batch of
+        new images costs about the same as for one.
+
+        Sessions which still cover (some of) the same frames keep their ids, and their
+        reference image if it is still one of their frames.
+
+        Args:
+            images: Records (or headers) of images which have been added, changed or
+                    removed.  Only the sessions of these kinds of frames, near these
+                    times, are rebuilt.  None rebuilds every session.
+
+        Returns:
+            The ids of the sessions which are new or have a new reference image, and of
+            those which lost a stored calibration match (because the candidate session
+            was deleted), i.e. the sessions whose calibration matches need updating.
+        """
+        keys = ", ".join(self._SESSION_KEYS)
+        t_keys = ", ".join(f"t.{column}" for column in self._SESSION_KEYS)
+        i_keys = ", ".join(f"i.{column}" for column in self._SESSION_KEYS)
+        gap = self.SESSION_GAP_HOURS / 24.0
+        cursor = self._db.cursor()
+        with self.transaction():
+            for table in ("touched", "ranges", "frames", "clusters", "matches"):
+                cursor.execute(f"DROP TABLE IF EXISTS temp.session_{table}")
+
+            ranges_join = ""
+            in_ranges = ""
+            if images is not None:
+                # The kinds of frames touched, and when
+                cursor.execute(
+                    """
+                    CREATE TEMP TABLE session_touched (
+                        filter TEXT, imagetyp TEXT, object TEXT, telescop TEXT,
+                        exptime REAL, date_obs TEXT
+                    )
+                """
+                )
+                touched = []
+                aliases = self.get_target_aliases() if self._canonical_targets else {}
+                for image in images:
+                    values = self._session_key_values(image, aliases)
+                    if values is not None:
+                        touched.append((*values, image[self.DATE_OBS_KEY]))
+                cursor.executemany(
+                    "INSERT INTO temp.session_touched VALUES (?, ?, ?, ?, ?, ?)",
+                    touched,
+                )
+
+                # The time range to rebuild for each kind: the touched frames, plus the
+                # existing sessions they could be part of (or join together)
+                cursor.execute(
+                    f"""
+                    CREATE TEMP TABLE session_ranges AS
+                    WITH t AS (
+                        SELECT {keys}, MIN(date_obs) AS lo, MAX(date_obs) AS hi
+                        FROM temp.session_touched
+                        GROUP BY {keys}
+                    )
+                    SELECT {t_keys},
+                           MIN(t.lo, COALESCE(MIN(s.start), t.lo)) AS lo,
+                           MAX(t.hi, COALESCE(MAX(s.end), t.hi)) AS hi
+                    FROM t
+                    LEFT JOIN {self.SESSIONS_TABLE} s
+                        ON {self._same_session_keys("s", "t")}
+                        AND julianday(s.end) >= julianday(t.lo) - ?
+                        AND julianday(s.start) <= julianday(t.hi) + ?
+                    GROUP BY {t_keys}
+                """,
+                    (gap, gap),
+                )
+                ranges_join = f"""
+                    JOIN temp.session_ranges r
+                        ON {self._same_session_keys("i", "r")}
+                        AND i.date_obs BETWEEN r.lo AND r.hi
+                """
+                in_ranges = f"""
+                    AND id IN (
+                        SELECT s.id FROM {self.SESSIONS_TABLE} s
+                        JOIN temp.session_ranges r
+                            ON {self._same_session_keys("s", "r")}
+                            AND s.start <= r.hi AND s.end >= r.lo
+                    )
+                """
+
+            # Number the sessions within each kind of frame: a new one starts whenever a
+            # frame is more than the gap after the previous one
+            cursor.execute(
+                f"""
+                CREATE TEMP TABLE session_frames AS
+                WITH i AS (
+                    SELECT i.id, i.date_obs, {self._session_key_exprs("i")}
+                    FROM {self.IMAGES_TABLE} i
+                    WHERE i.date_obs != ''
+                      AND {self._image_key_expr(self.IMAGETYP_KEY, "i")} != ''
+                ), marked AS (
+                    SELECT i.*, COALESCE(
+                        julianday(i.date_obs) - julianday(LAG(i.date_obs) OVER w) > ?, 1
+                    ) AS is_first
+                    FROM i {ranges_join}
+                    WINDOW w AS (PARTITION BY {i_keys} ORDER BY i.date_obs, i.id)
+                ), numbered AS (
+                    SELECT *, SUM(is_first) OVER (
+                        PARTITION BY {keys} ORDER BY date_obs, id
+                        ROWS UNBOUNDED PRECEDING
+                    ) AS cluster
+                    FROM marked
+                )
+                SELECT *, FIRST_VALUE(id) OVER (
+                    PARTITION BY {keys}, cluster ORDER BY date_obs, id
+                ) AS first_id
+                FROM numbered
+            """,
+                (gap,),
+            )
+            cursor.execute("CREATE INDEX temp.session_frames_id ON session_frames(id)")
+
+            # One row per (new) session
+            cursor.execute(
+                f"""
+                CREATE TEMP TABLE session_clusters AS
+                SELECT {keys}, cluster, first_id,
+                    MIN(date_obs) AS start,
+                    CASE WHEN COALESCE(exptime, 0) = 0 THEN MAX(date_obs) ELSE COALESCE(
+                        rtrim(rtrim(strftime(
+                            '%Y-%m-%dT%H:%M:%f', MAX(date_obs),
+                            printf('%+f seconds', exptime)
+                        ), '0'), '.'),
+                        MAX(date_obs)
+                    ) END AS end,
+                    COUNT(*) AS num_images,
+                    TOTAL(exptime) AS exptime_total
+                FROM temp.session_frames
+                GROUP BY {keys}, cluster
+            """
+            )
+
+            # The existing session (if any) each new one replaces: one which overlaps
+            # it, and which isn't already replaced by an earlier one
+            cursor.execute(
+                f"""
+                CREATE TEMP TABLE session_matches AS
+                WITH candidates AS (
+                    SELECT c.rowid AS cluster_row, s.id AS session_id,
+                        ROW_NUMBER() OVER (
+                            PARTITION BY s.id ORDER BY c.start, c.rowid
+                        ) AS n
+                    FROM temp.session_clusters c
+                    JOIN {self.SESSIONS_TABLE} s
+                        ON {self._same_session_keys("s", "c")}
+                        AND s.start <= c.end AND s.end >= c.start
+                )
+                SELECT m.cluster_row, m.session_id, EXISTS (
+                    SELECT 1 FROM temp.session_frames f
+                    WHERE f.id = s.image_doc_id AND f.cluster = c.cluster
+                      AND {self._same_session_keys("f", "c")}
+                ) AS keeps_reference
+                FROM (
+                    SELECT cluster_row, MIN(session_id) AS session_id
+                    FROM candidates WHERE n = 1
+                    GROUP BY cluster_row
+                ) m
+                JOIN temp.session_clusters c ON c.rowid = m.cluster_row
+                JOIN {self.SESSIONS_TABLE} s ON s.id = m.session_id
+            """
+            )
+
+            # Sessions (of the kinds and times being rebuilt) which aren't reused
+            deleted = f"""
+                SELECT id FROM {self.SESSIONS_TABLE}
+                WHERE id NOT IN (SELECT session_id FROM temp.session_matches)
+                {in_ranges}
+            """
+
+            # The sessions which ranked one of those as a calibration candidate lose
+            # that match (it is deleted with it), so they must be ranked again
+            cursor.execute(
+                f"""
+                SELECT DISTINCT session_id FROM {self.CALIBRATION_MATCHES_TABLE}
+                WHERE candidate_id IN ({deleted})
+            """
+            )
+            unranked = {row[0] for row in cursor.fetchall()}
+
+            cursor.execute(f"DELETE FROM {self.SESSIONS_TABLE} WHERE id IN ({deleted})")
+
+            cursor.execute(
+                f"""
+                UPDATE {self.SESSIONS_TABLE} SET
+                    start = c.start,
+                    end = c.end,
+                    num_images = c.num_images,
+                    exptime_total = c.exptime_total,
+                    image_doc_id = CASE WHEN m.keeps_reference
+                        THEN {self.SESSIONS_TABLE}.image_doc_id ELSE c.first_id END
+                FROM temp.session_matches m
+                JOIN temp.session_clusters c ON c.rowid = m.cluster_row
+                WHERE {self.SESSIONS_TABLE}.id = m.session_id
+            """
+            )
+            changed = {
+                row[0]
+                for row in cursor.execute(
+                    "SELECT session_id FROM temp.session_matches "
+                    "WHERE NOT keeps_reference"
+                )
+            }
+
+            cursor.execute(
+                f"""
+                INSERT INTO {self.SESSIONS_TABLE}
+                (start, end, {keys}, num_images, exptime_total, image_doc_id)
+                SELECT start, end, {keys}, num_images, exptime_total, first_id
+                FROM temp.session_clusters
+                WHERE rowid NOT IN (SELECT cluster_row FROM temp.session_matches)
+                RETURNING id
+            """
+            )
+            changed.update(row[0] for row in cursor.fetchall())
+            changed |= unranked
+
+            for table in ("touched", "ranges", "frames", "clusters", "matches"):
+                cursor.execute(f"DROP TABLE IF EXISTS temp.session_{table}")
+        return changed
+
+    def set_calibration_matches(
+        self, session_id: int, imagetyp: str, candidate_ids: Iterable[int]
+    ) -> None:
+        """Replace the ranked calibration candidates of a given type for a session.
+
+        Args:
+            session_id: The (light) session.
+            imagetyp: The calibration image type (i.e. DARK).
+            candidate_ids: Ids of the candidate sessions, best first.
+        """
+        cursor = self._db.cursor()
+        cursor.execute(
+            f"""
+            DELETE FROM {self.CALIBRATION_MATCHES_TABLE}
+            WHERE session_id = ? AND imagetyp = ?
+        """,
+            (session_id, imagetyp),
+        )
+        cursor.executemany(
+            f"""
+            INSERT INTO {self.CALIBRATION_MATCHES_TABLE}
+            (session_id, imagetyp, rank, candidate_id) VALUES (?, ?, ?, ?)
+        """,
+            [
+                (session_id, imagetyp, rank, candidate_id)
+                for rank, candidate_id in enumerate(candidate_ids)
+            ],
+        )
+        self._commit()
+
+    def get_calibration_matches(
+        self, session_id: int, imagetyp: str
+    ) -> list[SessionRow]:
+        """Return the stored calibration candidates of a type for a session, best first.
+
+        Candidates which have since been deleted are left out (their ranks are gaps).
+        """
+        cursor = self._db.cursor()
+        cursor.execute(
+            f"""
+            SELECT s.id, s.start, s.end, s.filter, s.imagetyp, s.object, s.telescop,
+                   s.exptime, s.num_images, s.exptime_total, s.image_doc_id
+            FROM {self.CALIBRATION_MATCHES_TABLE} m
+            JOIN {self.SESSIONS_TABLE} s ON s.id = m.candidate_id
+            WHERE m.session_id = ? AND m.imagetyp = ?
+            ORDER BY m.rank
+        """,
+            (session_id, imagetyp),
+        )
+        return [dict(row) for row in cursor.fetchall()]
+
+    def _last_session_change(self) -> int:
+        """Return the seq of the latest entry (ever) in the session changes log."""
+        cursor = self._db.cursor()
+        cursor.execute(
+            "SELECT seq FROM sqlite_sequence WHERE name = ?",
+            (self.SESSION_CHANGES_TABLE,),
+        )
+        row = cursor.fetchone()
+        return row[0] if row else 0
+
+    def search_saved_selection(
+        self, name: str, where_tuple: tuple[str, list[Any]]
+    ) -> list[SessionRow]:
+        """Search for the sessions of a saved selection, via its cached session ids.
+
+        The ids matching a saved selection are stored the first time it is searched.
+        After that only sessions which ingest has added or changed since are checked
+        against its conditions, so this costs about the size of the result rather than
+        a search of all the sessions.
+
+        The cache only follows changes to the sessions table (the session_changes log).
+        Anything else which changes what a where clause matches must drop the cached
+        results (see _forget_saved_selections), as changing target aliases does.
+
+        Args:
+            name: The name of the saved selection.
+            where_tuple: Its conditions (see search_session).  If they differ from the
+                         ones the ids were cached for, the cache is rebuilt.
+
+        Returns:
+            The matching sessions, in the same order as search_session.
+        """
+        where_clause, params = where_tuple
+        params_json = json.dumps(params)
+        cursor = self._db.cursor()
+        cursor.execute(
+            f"""
+            SELECT where_clause, params, seq FROM {self.SAVED_SELECTIONS_TABLE}
+            WHERE name = ?
+        """,
+            (name,),
+        )
+        row = cursor.fetchone()
+        cached = (
+            row is not None
+            and row["where_clause"] == where_clause
+            and row["params"] == params_json
+        )
+        last_seq = self._last_session_change()
+
+        if self.read_only:
+            # We can't bring the cache up to date
+            if not cached or row["seq"] != last_seq:
+                return self.search_session(where_tuple)
+        elif not cached:
+            with self.transaction():
+                cursor.execute(
+                    f"""
+                    INSERT INTO {self.SAVED_SELECTIONS_TABLE}
+                    (name, where_clause, params, seq) VALUES (?, ?, ?, ?)
+                    ON CONFLICT(name) DO UPDATE SET
+                        where_clause = excluded.where_clause,
+                        params = excluded.params,
+                        seq = excluded.seq
+                """,
+                    (name, where_clause, params_json, last_seq),
+                )
+                cursor.execute(
+                    f"DELETE FROM {self.SAVED_SELECTION_SESSIONS_TABLE} WHERE name = ?",
+                    (name,),
+                )
+                cursor.execute(
+                    f"""
+                    INSERT INTO {self.SAVED_SELECTION_SESSIONS_TABLE}
+                    SELECT ?, id FROM {self.SESSIONS_TABLE} {where_clause}
+                """,
+                    [name, *params],
+                )
+                self._prune_session_changes()
+        elif row["seq"] != last_seq:
+            changes = self.SESSION_CHANGES_TABLE
+            changed = f"SELECT session_id FROM {changes} WHERE seq > ?"
+            with self.transaction():
+                cursor.execute(
+                    f"""
+                    DELETE FROM {self.SAVED_SELECTION_SESSIONS_TABLE}
+                    WHERE name = ? AND session_id IN ({changed})
+                """,
+                    (name, row["seq"]),
+                )
+                cursor.execute(
+                    f"""
+                    INSERT OR IGNORE INTO {self.SAVED_SELECTION_SESSIONS_TABLE}
+                    SELECT ?, id FROM {self.SESSIONS_TABLE}
+                    {where_clause + " AND" if where_clause else "WHERE"}
+                    id IN ({changed})
+                """,
+                    [name, *params, row["seq"]],
+                )
+                cursor.execute(
+                    f"UPDATE {self.SAVED_SELECTIONS_TABLE} SET seq = ? WHERE name = ?",
+                    (last_seq, name),
+                )
+                self._prune_session_changes()
+
+        cursor.execute(
+            f"""
+            SELECT id, start, end, filter, imagetyp, object, telescop,
+                   exptime, num_images, exptime_total, image_doc_id
+            FROM {self.SESSIONS_TABLE}
+            WHERE id IN (
+                SELECT session_id FROM {self.SAVED_SELECTION_SESSIONS_TABLE}
+                WHERE name = ?
+            )
+            ORDER BY id
+        """,
+            (name,),
+        )
+        return [dict(row) for row in cursor.fetchall()]
+
+    def _forget_saved_selections(self) -> None:
+        """Drop the cached results of every saved selection (so they are rebuilt).
+
+        Needed when what their conditions match changes without the sessions changing,
+        i.e. target names (OBJECT conditions match every name of a target).
+        """
+        self._db.execute(f"DELETE FROM {self.SAVED_SELECTIONS_TABLE}")
+        self._prune_session_changes()
+
+    def _prune_session_changes(self) -> None:
+        """Drop the session changes which every saved selection has caught up with."""
+        self._db.execute(
+            f"""
+            DELETE FROM {self.SESSION_CHANGES_TABLE} WHERE seq <= (
+                SELECT COALESCE(MIN(seq), ?) FROM {self.SAVED_SELECTIONS_TABLE}
+            )
+        """,
+            (self._last_session_change(),),
+        )
+
+    def set_reindex_checkpoint(self, repo: str, path: str, num_images: int) -> None:
+        """Record how far a reindex of a repo has got.
+
+        Args:
+            repo: The repo URL.
+            path: The last file (in walk order) whose image has been committed.
+            num_images: The number of images written by the reindex so far.
+        """
+        cursor = self._db.cursor()
+        cursor.execute(
+            f"""
+            INSERT INTO {self.REINDEX_CHECKPOINTS_TABLE} (repo, path, num_images)
+            VALUES (?, ?, ?)
+            ON CONFLICT(repo) DO UPDATE SET
+                path = excluded.path,
+                num_images = excluded.num_images
+        """,
+            (repo, path, num_images),
+        )
+        self._commit()
+
+    def set_reindex_complete(self, repo: str, num_images: int) -> None:
+        """Record that a reindex of a repo completed.
+
+        So resuming a reindex of several repos which was interrupted (after this one)
+        doesn't redo this one.  Stored as a checkpoint without a path.
+        """
+        self.set_reindex_checkpoint(repo, "", num_images)
+
+    def is_reindex_complete(self, repo: str) -> bool:
+        """Return True if the last reindex of a repo has completed."""
+        cursor = self._db.cursor()
+        cursor.execute(
+            f"""
+            SELECT 1 FROM {self.REINDEX_CHECKPOINTS_TABLE} WHERE repo = ? AND path = ''
+        """,
+            (repo,),
+        )
+        return cursor.fetchone() is not None
 
-        self._db.commit()
+    def get_reindex_checkpoint(self, repo: str) -> tuple[str, int] | None:
+        """Return the (path, num_images) checkpoint of an unfinished reindex of a repo.
+
+        Returns None if there isn't one (the last reindex completed).
+        """
+        cursor = self._db.cursor()
+        cursor.execute(
+            f"""
+            SELECT path, num_images FROM {self.REINDEX_CHECKPOINTS_TABLE}
+            WHERE repo = ? AND path != ''
+        """,
+            (repo,),
+        )
+        row = cursor.fetchone()
+        return (row["path"], row["num_images"]) if row else None
+
+    def clear_reindex_checkpoint(self, repo: str | None = None) -> None:
+        """Forget the checkpoint (or completion) of a repo's reindex.
+
+        Args:
+            repo: The repo URL, None forgets those of every repo (a new reindex of
+                  them all is starting).
+        """
+        cursor = self._db.cursor()
+        if repo is None:
+            cursor.execute(f"DELETE FROM {self.REINDEX_CHECKPOINTS_TABLE}")
+        else:
+            cursor.execute(
+                f"DELETE FROM {self.REINDEX_CHECKPOINTS_TABLE} WHERE repo = ?", (repo,)
+            )
+        self._commit()
 
     # --- Lifecycle ---
     def close(self) -> None:
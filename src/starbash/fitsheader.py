@@ -0,0 +1,298 @@
+"""Helpers for reading FITS primary headers while indexing repos.
+
+The functions in this module are deliberately free of any Starbash/Database state so
+they can be shipped to worker processes (see Starbash.reindex_repo --jobs).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import itertools
+import logging
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Collection, Iterable, Iterator
+
+# (path, header dict or None, error message or None, content hash or None)
+HeaderResult = tuple[str, dict[str, Any] | None, str | None, str | None]
+
+BLOCK_SIZE = 2880
+CARD_SIZE = 80
+
+# content_hash() hashes the whole header plus this many evenly spaced slices of the data
+HASH_SAMPLES = 4
+HASH_SAMPLE_SIZE = 64 * 1024
+
+# Files handed to a worker process at a time by read_headers, and the number of chunks
+# (per worker) which may be in flight at once
+CHUNK_SIZE = 32
+WINDOW_CHUNKS_PER_JOB = 4
+
+# Keywords whose value is free text starting in column 9 (no value indicator)
+_COMMENTARY_KEYS = ("COMMENT", "HISTORY", "")
+
+
+class MalformedHeader(ValueError):
+    """The fast scanner could not parse a header (the caller should fall back to astropy)."""
+
+
+def _parse_value(text: str) -> Any:
+    """Parse the value field of a card (everything after the '= ' value indicator).
+
+    Returns the value as the same python type astropy would produce.
+    """
+    text = text.lstrip()
+    if not text or text[0] == "/":
+        return None  # undefined value
+
+    if text[0] == "'":
+        # A quoted string, embedded quotes are doubled, trailing spaces are not significant
+        chars = []
+        i = 1
+        n = len(text)
+        while i < n:
+            c = text[i]
+            if c == "'":
+                if i + 1 < n and text[i + 1] == "'":
+                    chars.append("'")
+                    i += 2
+                    continue
+                return "".join(chars).rstrip()
+            chars.append(c)
+            i += 1
+        raise MalformedHeader(f"Unterminated string value: {text}")
+
+    token = text.split("/", 1)[0].strip()
+    if token == "T":
+        return True
+    if token == "F":
+        return False
+    try:
+        return int(token)
+    except ValueError:
+        pass
+    try:
+        return float(token.replace("D", "E"))
+    except ValueError:
+        # complex values etc... are too rare to bother with here
+        raise MalformedHeader(f"Unsupported value: {token}")
+
+
+def scan_header(path: str, keep: Collection[str] | None = None) -> dict[str, Any]:
+    """Read the primary header of a FITS file without building astropy objects.
+
+    Reads 2880 byte blocks until the END card and parses each 80 character card directly
+    into a dict (using the same key/value conventions as astropy's Header.items()).
+
+    Args:
+        path: The FITS file to read.
+        keep: If set, only these keywords are parsed/returned.
+
+    Raises:
+        MalformedHeader: If the file is not a plain (uncompressed) FITS file, or uses a
+            header construct this scanner doesn't understand.
+    """
+    headers: dict[str, Any] = {}
+    continued: str | None = None  # keyword of a long string awaiting CONTINUE cards
+
+    with open(path, "rb") as f:
+        first = True
+        while True:
+            block = f.read(BLOCK_SIZE)
+            if len(block) != BLOCK_SIZE:
+                raise MalformedHeader("Truncated header (no END card)")
+            if first:
+                if not block.startswith(b"SIMPLE  ="):
+                    raise MalformedHeader("Not a FITS primary header")
+                first = False
+
+            text = block.decode("latin-1")
+            for start in range(0, BLOCK_SIZE, CARD_SIZE):
+                card = text[start : start + CARD_SIZE]
+                key = card[:8].rstrip()
+
+                if key == "END":
+                    return headers
+
+                if key == "CONTINUE":
+                    if continued is not None:
+                        more = _parse_value(card[8:])
+                        if not isinstance(more, str):
+                            raise MalformedHeader(f"Bad CONTINUE card: {card}")
+                        value = headers[continued][:-1] + more
+                        headers[continued] = value
+                        if not value.endswith("&"):
+                            continued = None
+                    continue
+                continued = None
+
+                if key == "HIERARCH":
+                    hkey, sep, value_text = card[8:].partition("=")
+                    if not sep:
+                        raise MalformedHeader(f"Bad HIERARCH card: {card}")
+                    key = " ".join(hkey.split())
+                    if keep is not None and key not in keep:
+                        continue
+                    headers[key] = _parse_value(value_text)
+                    continue
+
+                if keep is not None and key not in keep:
+                    continue
+
+                if card[8:10] == "= ":
+                    value = _parse_value(card[10:])
+                    headers[key] = value
+                    if isinstance(value, str) and value.endswith("&"):
+                        continued = key
+                elif key in _COMMENTARY_KEYS:
+                    headers[key] = card[8:].rstrip()
+                else:
+                    raise MalformedHeader(f"Card without value indicator: {card}")
+
+
+def read_header_astropy(
+    path: str, keep: Collection[str] | None = None
+) -> dict[str, Any]:
+    """Read the primary HDU (HDU 0) header of a FITS file into a plain dict via astropy.
+
+    Raises:
+        ValueError: If astropy could not make sense of the header.
+    """
+    # astropy is slow to import, so only load it when a header actually needs it
+    from astropy.io import fits
+
+    with fits.open(path, memmap=False) as hdul:
+        hdu0: Any = hdul[0]
+        header = hdu0.header
+        if type(header).__name__ == "Unknown":
+            raise ValueError(f"FITS header has Unknown type: {path}")
+
+        return {
+            key: value
+            for key, value in header.items()
+            if keep is None or key in keep
+        }
+
+
+def read_header(path: str, keep: Collection[str] | None = None) -> dict[str, Any]:
+    """Read the primary HDU (HDU 0) header of a FITS file into a plain dict.
+
+    Uses the fast scanner, falling back to astropy for files it can't handle (compressed
+    files, unusual cards, etc...).
+
+    Args:
+        path: The FITS file to read.
+        keep: If set, only these keywords are returned.
+
+    Raises:
+        ValueError: If the file could not be read as FITS.
+    """
+    try:
+        return scan_header(path, keep)
+    except MalformedHeader as e:
+        logging.debug("Falling back to astropy for %s: %s", path, e)
+        return read_header_astropy(path, keep)
+
+
+def content_hash(path: str) -> str:
+    """Return a hash identifying the contents of a FITS file (for finding duplicates).
+
+    Rather than reading every byte of (potentially huge) frames, the hash covers the
+    file size, the whole primary header and HASH_SAMPLES slices spread evenly over the
+    rest of the file.  Copies of the same frame always hash the same, and different
+    frames (which at least differ in their DATE-OBS) practically never do.
+
+    Raises:
+        OSError: If the file can't be read.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        h.update(size.to_bytes(8, "little"))
+
+        # The header blocks, up to the one with the END card (without an END card the
+        # whole file ends up hashed)
+        while block := f.read(BLOCK_SIZE):
+            h.update(block)
+            cards = range(0, len(block), CARD_SIZE)
+            if any(block.startswith(b"END     ", i) for i in cards):
+                break
+        data_start = f.tell()
+
+        data_size = size - data_start
+        if data_size <= HASH_SAMPLES * HASH_SAMPLE_SIZE:
+            offsets = [data_start] if data_size else []
+            sample_size = data_size
+        else:
+            step = (data_size - HASH_SAMPLE_SIZE) // (HASH_SAMPLES - 1)
+            offsets = [data_start + i * step for i in range(HASH_SAMPLES)]
+            sample_size = HASH_SAMPLE_SIZE
+        for offset in offsets:
+            f.seek(offset)
+            h.update(f.read(sample_size))
+    return h.hexdigest()
+
+
+def read_header_safe(
+    path: str, keep: Collection[str] | None = None, hash_content: bool = False
+) -> HeaderResult:
+    """Like read_header() but never raises, so it is safe to use from a worker pool.
+
+    Errors are returned as strings (rather than exception objects) because some astropy
+    exceptions do not survive pickling back to the parent process.
+
+    Args:
+        hash_content: Also return the content_hash() of the file.
+    """
+    try:
+        header = read_header(path, keep)
+        return (path, header, None, content_hash(path) if hash_content else None)
+    except Exception as e:
+        return (path, None, str(e), None)
+
+
+def read_headers(
+    paths: Iterable[str],
+    jobs: int = 1,
+    keep: Collection[str] | None = None,
+    hash_content: bool = False,
+) -> Iterator[HeaderResult]:
+    """Read the primary headers of many FITS files, yielding results in input order.
+
+    Args:
+        paths: The files to read.
+        jobs: Number of worker processes to use.  1 reads on the calling thread,
+              0 means one worker per CPU.
+        keep: If set, only these keywords are returned.
+        hash_content: Also compute the content_hash() of each file (in the workers).
+    """
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+
+    if jobs <= 1:
+        for p in paths:
+            yield read_header_safe(p, keep, hash_content)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        # Executor.map would consume all of paths up front (which may be a lazy
+        # directory walk), so chunks are submitted through a bounded window instead.
+        # Results are yielded in input order, so the (single) DB writer sees files in
+        # exactly the same sequence as the serial path.  Chunking amortizes the IPC cost
+        # per file.
+        window: deque[Future[list[HeaderResult]]] = deque()
+        it = iter(paths)
+        while chunk := list(itertools.islice(it, CHUNK_SIZE)):
+            window.append(pool.submit(_read_chunk, chunk, keep, hash_content))
+            if len(window) >= jobs * WINDOW_CHUNKS_PER_JOB:
+                yield from window.popleft().result()
+        while window:
+            yield from window.popleft().result()
+
+
+def _read_chunk(
+    paths: list[str], keep: Collection[str] | None = None, hash_content: bool = False
+) -> list[HeaderResult]:
+    """Read a chunk of headers in a worker process (see read_headers)."""
+    return [read_header_safe(p, keep, hash_content) for p in paths]
@@ -32,12 +32,25 @@ def main_callback(
             help="Enable debug logging output.",
         ),
     ] = False,
+    profile_startup: Annotated[
+        bool,
+        typer.Option(
+            "--profile-startup",
+            help="Report how long starting up takes (imports and init), then exit.",
+        ),
+    ] = False,
 ):
     """Main callback for the Starbash application."""
     # Set the log level based on --debug flag
     if debug:
         starbash.log_filter_level = logging.DEBUG
 
+    if profile_startup:
+        from .startup import report_startup
+
+        report_startup()
+        raise typer.Exit()
+
     if ctx.invoked_subcommand is None:
         if not get_user_config_path().exists():
             with Starbash("app.first") as sb:
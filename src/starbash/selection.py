@@ -3,8 +3,14 @@
 from __future__ import annotations
 
 import logging
-from typing import Any, Optional, TYPE_CHECKING
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional, TYPE_CHECKING
+
+import tomlkit
+
 from repo import Repo
+from starbash.database import Database
+from starbash.sky import DEFAULT_RADIUS_DEG, format_position
 
 
 def where_tuple(conditions: dict[str, Any] | None) -> tuple[str, list[Any]]:
@@ -12,9 +18,15 @@ def where_tuple(conditions: dict[str, Any] | None) -> tuple[str, list[Any]]:
 
     Args:
         conditions: Dictionary of session key-value pairs to match, or None for all.
+                    A list (or tuple) value matches any of its values (with a single
+                    parameterised IN clause), None or an empty list matches anything.
+                    OBJECT values match any name of the target (see
+                    Database.canonical_target).
                     Special keys:
                     - 'date_start': Filter sessions starting on or after this date
                     - 'date_end': Filter sessions starting on or before this date
+                    - 'cone': (RA, Dec, radius) in degrees, sessions whose reference
+                      image was pointed within the cone (see Database.cone_condition)
 
     Returns:
         Tuple of (WHERE clause string, list of parameters)
@@ -39,12 +51,30 @@ def where_tuple(conditions: dict[str, Any] | None) -> tuple[str, list[Any]]:
         where_clauses.append("start <= ?")
         params.append(date_end)
 
+    cone = conditions.get("cone")
+    if cone:
+        sql, cone_params = Database.cone_condition(*cone, column="image_doc_id")
+        where_clauses.append(sql)
+        params.extend(cone_params)
+
     # Add standard conditions to WHERE clause
     for key, value in conditions.items():
-        if key not in ("date_start", "date_end") and value is not None:
-            column_name = key
-            where_clauses.append(f"{column_name} = ?")
-            params.append(value)
+        if key in ("date_start", "date_end", "cone") or value is None:
+            continue
+        column_name = key
+        values = list(value) if isinstance(value, (list, tuple)) else [value]
+        if not values:
+            continue
+        placeholder = "?"
+        if key == Database.OBJECT_KEY:
+            # Sessions are labelled with canonical target names
+            placeholder = Database.canonical_target_expr("?")
+        params.extend(values)
+        if len(values) > 1:
+            placeholders = ", ".join([placeholder] * len(values))
+            where_clauses.append(f"{column_name} IN ({placeholders})")
+        else:
+            where_clauses.append(f"{column_name} = {placeholder}")
 
     # Build the query
     query = ""
@@ -60,6 +90,7 @@ class Selection:
 
     This class maintains persistent state about what the user has selected:
     - Target names
+    - A position on the sky (cone search)
     - Date ranges
     - Filters
     - Image types
@@ -82,6 +113,13 @@ class Selection:
         self.filters: list[str] = []
         self.image_types: list[str] = []
         self.telescopes: list[str] = []
+        self.cone: Optional[list[float]] = None  # [RA, Dec, radius] in degrees
+
+        self._tx_depth = 0  # see transaction()
+        self._dirty = False  # changed inside the transaction
+
+        # (selection state, query) last built by get_query_conditions
+        self._compiled: tuple[tuple[Any, ...], tuple[str, list[Any]]] | None = None
 
         # Load existing state if it exists
         self._load()
@@ -105,12 +143,76 @@ class Selection:
             telescopes = self.user_repo.get("selection.telescopes", [])
             self.telescopes = telescopes if isinstance(telescopes, list) else []
 
+            self.cone = self._valid_cone(self.user_repo.get("selection.cone"))
+
             logging.debug(f"Loaded selection state from {self.user_repo.url}")
         except Exception as e:
             logging.warning(f"Failed to load selection state: {e}")
 
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """Group all changes made inside the with block into a single save.
+
+        The config file is only written once, when the (outermost) block exits.  If an
+        exception escapes the block, the selection is restored to how it was instead.
+        """
+        if self._tx_depth == 0:
+            snapshot = self._state()
+            self._dirty = False
+        self._tx_depth += 1
+        try:
+            yield
+        except BaseException:
+            self._tx_depth -= 1
+            if self._tx_depth == 0:
+                self._restore(snapshot)
+            raise
+        self._tx_depth -= 1
+        if self._tx_depth == 0 and self._dirty:
+            self._save()
+
+    @staticmethod
+    def _valid_cone(cone: Any) -> Optional[list[float]]:
+        """Return cone as [RA, Dec, radius] if it is one, otherwise None."""
+        if (
+            isinstance(cone, list)
+            and len(cone) == 3
+            and all(isinstance(v, (int, float)) for v in cone)
+        ):
+            return [float(v) for v in cone]
+        return None
+
+    def _state(self) -> tuple[Any, ...]:
+        """Return an (immutable) copy of the selection criteria."""
+        return (
+            tuple(self.targets),
+            tuple(self.filters),
+            tuple(self.image_types),
+            tuple(self.telescopes),
+            self.date_start,
+            self.date_end,
+            tuple(self.cone) if self.cone else None,
+        )
+
+    def _restore(self, state: tuple[Any, ...]) -> None:
+        """Put back the selection criteria saved by _state()."""
+        targets, filters, image_types, telescopes, date_start, date_end, cone = state
+        self.targets = list(targets)
+        self.filters = list(filters)
+        self.image_types = list(image_types)
+        self.telescopes = list(telescopes)
+        self.date_start = date_start
+        self.date_end = date_end
+        self.cone = list(cone) if cone else None
+
     def _save(self) -> None:
-        """Save selection state to user config repo."""
+        """Save selection state to user config repo.
+
+        Inside a transaction() this is deferred until the transaction ends.
+        """
+        if self._tx_depth:
+            self._dirty = True
+            return
         try:
             self.user_repo.set("selection.targets", self.targets)
 
@@ -118,25 +220,22 @@ class Selection:
             if self.date_start is not None:
                 self.user_repo.set("selection.date_start", self.date_start)
             else:
-                # Delete the key if it exists
-                if "selection" in self.user_repo.config:
-                    sel_section = self.user_repo.config["selection"]
-                    if isinstance(sel_section, dict) and "date_start" in sel_section:
-                        del sel_section["date_start"]  # type: ignore
+                self.user_repo.unset("selection.date_start")
 
             if self.date_end is not None:
                 self.user_repo.set("selection.date_end", self.date_end)
             else:
-                # Delete the key if it exists
-                if "selection" in self.user_repo.config:
-                    sel_section = self.user_repo.config["selection"]
-                    if isinstance(sel_section, dict) and "date_end" in sel_section:
-                        del sel_section["date_end"]  # type: ignore
+                self.user_repo.unset("selection.date_end")
 
             self.user_repo.set("selection.filters", self.filters)
             self.user_repo.set("selection.image_types", self.image_types)
             self.user_repo.set("selection.telescopes", self.telescopes)
 
+            if self.cone is not None:
+                self.user_repo.set("selection.cone", self.cone)
+            else:
+                self.user_repo.unset("selection.cone")
+
             # Write the updated config to disk
             self.user_repo.write_config()
             logging.debug(f"Saved selection state to {self.user_repo.url}")
@@ -151,6 +250,7 @@ class Selection:
         self.filters = []
         self.image_types = []
         self.telescopes = []
+        self.cone = None
         self._save()
 
     def add_target(self, target: str) -> None:
@@ -173,6 +273,25 @@ class Selection:
             self.targets.remove(target)
             self._save()
 
+    def set_cone(
+        self,
+        ra: float | None = None,
+        dec: float | None = None,
+        radius: float = DEFAULT_RADIUS_DEG,
+    ) -> None:
+        """Limit the selection to sessions pointed near a position on the sky.
+
+        Args:
+            ra: Right ascension of the centre (degrees), None to remove the limit
+            dec: Declination of the centre (degrees)
+            radius: Radius of the cone (degrees)
+        """
+        if ra is None or dec is None:
+            self.cone = None
+        else:
+            self.cone = [float(ra), float(dec), float(radius)]
+        self._save()
+
     def add_telescope(self, telescope: str) -> None:
         """Add a telescope to the selection.
 
@@ -226,6 +345,74 @@ class Selection:
             self.filters.remove(filter_name)
             self._save()
 
+    def _criteria(self) -> dict[str, Any]:
+        """The selection criteria as stored in a saved selection."""
+        criteria: dict[str, Any] = {
+            "targets": list(self.targets),
+            "filters": list(self.filters),
+            "image_types": list(self.image_types),
+            "telescopes": list(self.telescopes),
+        }
+        if self.date_start is not None:
+            criteria["date_start"] = self.date_start
+        if self.date_end is not None:
+            criteria["date_end"] = self.date_end
+        if self.cone is not None:
+            criteria["cone"] = list(self.cone)
+        return criteria
+
+    def _saved(self) -> dict[str, Any]:
+        """The saved selections (name -> criteria) stored in the user config repo."""
+        saved = self.user_repo.get("selection.saved", {})
+        return saved if isinstance(saved, dict) else {}
+
+    def saved_names(self) -> list[str]:
+        """Return the names of the saved selections."""
+        return sorted(self._saved())
+
+    def save_as(self, name: str) -> None:
+        """Save the current selection criteria under a name (replacing any old ones).
+
+        Args:
+            name: The name to save the selection as (e.g. "M31 all seasons")
+        """
+        # Change the config document itself (get() may return a cached copy)
+        saved = self.user_repo.config.get("selection", {}).get("saved")
+        if not isinstance(saved, dict):
+            saved = tomlkit.table()
+            self.user_repo.set("selection.saved", saved)
+        saved[name] = self._criteria()
+        self._save()
+
+    def load(self, name: str) -> None:
+        """Replace the current selection with a saved one.
+
+        Args:
+            name: The name the selection was saved as
+
+        Raises:
+            ValueError: If there is no saved selection with that name
+        """
+        criteria = self._saved().get(name)
+        if not isinstance(criteria, dict):
+            raise ValueError(f"No saved selection named '{name}'")
+        self.targets = list(criteria.get("targets", []))
+        self.filters = list(criteria.get("filters", []))
+        self.image_types = list(criteria.get("image_types", []))
+        self.telescopes = list(criteria.get("telescopes", []))
+        self.date_start = criteria.get("date_start")
+        self.date_end = criteria.get("date_end")
+        self.cone = self._valid_cone(criteria.get("cone"))
+        self._save()
+
+    def saved_name(self) -> str | None:
+        """Return the name of a saved selection identical to the current one, if any."""
+        criteria = self._criteria()
+        for name, saved in self._saved().items():
+            if saved == criteria:
+                return name
+        return None
+
     def is_empty(self) -> bool:
         """Check if the selection has any criteria set.
 
@@ -239,44 +426,43 @@ class Selection:
             and not self.filters
             and not self.image_types
             and not self.telescopes
+            and self.cone is None
         )
 
     def get_query_conditions(self) -> tuple[str, list[Any]]:
         """Build query conditions based on the current selection.
 
+        Each kind of criteria matches any of its selected values.  The query is compiled
+        once per selection state, so the many searches made by a single command all use
+        exactly the same SQL (and so the same prepared statement).
+
         Returns:
             A tuple of SQL (WHERE clause string, list of parameters)
         """
-        conditions = {}
-
-        # Note: This returns a simplified conditions dict.
-        # The actual query building will be enhanced later to support
-        # complex queries with date ranges, multiple targets, etc.
-
-        if self.targets:
-            # For now, just use the first target
-            # TODO: Support multiple targets in queries
-            conditions["OBJECT"] = self.targets[0] if len(self.targets) == 1 else None
-
-        if self.filters:
-            # For now, just use the first filter
-            # TODO: Support multiple filters in queries
-            conditions["FILTER"] = self.filters[0] if len(self.filters) == 1 else None
-
-        if self.telescopes:
-            # For now, just use the first telescope
-            # TODO: Support multiple telescopes in queries
-            conditions["TELESCOP"] = (
-                self.telescopes[0] if len(self.telescopes) == 1 else None
-            )
-
-        # Add date range conditions
-        if self.date_start:
-            conditions["date_start"] = self.date_start
-        if self.date_end:
-            conditions["date_end"] = self.date_end
+        state = self._state()
+        if self._compiled is None or self._compiled[0] != state:
+            (
+                targets,
+                filters,
+                image_types,
+                telescopes,
+                date_start,
+                date_end,
+                cone,
+            ) = state
+            conditions = {
+                "OBJECT": targets,
+                "FILTER": filters,
+                "IMAGETYP": image_types,
+                "TELESCOP": telescopes,
+                "date_start": date_start,
+                "date_end": date_end,
+                "cone": cone,
+            }
+            self._compiled = (state, where_tuple(conditions))
 
-        return where_tuple(conditions)
+        query, params = self._compiled[1]
+        return query, list(params)  # callers may add their own parameters
 
     def summary(self) -> dict[str, Any]:
         """Get a summary of the current selection state.
@@ -295,6 +481,12 @@ class Selection:
         if self.targets:
             summary["criteria"].append(f"Targets: {', '.join(self.targets)}")
 
+        if self.cone:
+            ra, dec, radius = self.cone
+            summary["criteria"].append(
+                f"Position: within {radius:g}° of {format_position(ra, dec)}"
+            )
+
         if self.telescopes:
             summary["criteria"].append(f"Telescopes: {', '.join(self.telescopes)}")
 
@@ -0,0 +1,125 @@
+"""Sky coordinates of frames, for finding targets by position (see 'sb select target').
+
+Positions are stored as unit vectors (x, y, z) on the celestial sphere rather than as
+RA/Dec, so a cone around a point is simply a box in 3D (no special cases at RA = 0 or
+the poles) which an R-tree can search directly.
+"""
+
+from __future__ import annotations
+
+import math
+import re
+from typing import Any
+
+# Radius (in degrees) of 'sb select target' cone searches if none is given
+DEFAULT_RADIUS_DEG = 1.0
+
+# FITS keywords holding the pointing of a frame: RA/DEC are decimal degrees,
+# OBJCTRA/OBJCTDEC are sexagesimal strings (hours for RA), i.e. "00 42 44.3"
+RA_KEY = "RA"
+DEC_KEY = "DEC"
+OBJCTRA_KEY = "OBJCTRA"
+OBJCTDEC_KEY = "OBJCTDEC"
+POSITION_KEYS = (RA_KEY, DEC_KEY, OBJCTRA_KEY, OBJCTDEC_KEY)
+
+Vector = tuple[float, float, float]
+
+_SEXAGESIMAL = re.compile(
+    r"^\s*([+-]?)\s*(\d+(?:\.\d*)?)(?:[\s:hd°]+(\d+(?:\.\d*)?))?"
+    r"(?:[\s:m']+(\d+(?:\.\d*)?))?[\s\"s]*$"
+)
+
+
+def _parse_angle(value: Any, hours: bool) -> float | None:
+    """Parse an angle which is either a number or a sexagesimal string.
+
+    Numbers (and strings without separators) are taken as degrees.  Sexagesimal
+    strings are hours (if hours is set) or degrees, minutes and seconds.
+    """
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, str):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+
+    match = _SEXAGESIMAL.match(value)
+    if not match:
+        return None
+    sign, whole, minutes, seconds = match.groups()
+    angle = float(whole) + float(minutes or 0) / 60 + float(seconds or 0) / 3600
+    if hours:
+        angle *= 15
+    return -angle if sign == "-" else angle
+
+
+def parse_ra(value: Any) -> float | None:
+    """Parse a right ascension (decimal degrees, or "HH MM SS" hours) to degrees."""
+    ra = _parse_angle(value, hours=True)
+    return ra % 360 if ra is not None and math.isfinite(ra) else None
+
+
+def parse_dec(value: Any) -> float | None:
+    """Parse a declination (decimal degrees, or "±DD MM SS") to degrees."""
+    dec = _parse_angle(value, hours=False)
+    return dec if dec is not None and -90 <= dec <= 90 else None
+
+
+def image_position(header: dict[str, Any]) -> tuple[float, float] | None:
+    """Return the (RA, Dec) in degrees a frame was pointed at, if its header says.
+
+    The decimal RA/DEC keywords are preferred over the text OBJCTRA/OBJCTDEC ones.
+    """
+    for ra_key, dec_key in ((RA_KEY, DEC_KEY), (OBJCTRA_KEY, OBJCTDEC_KEY)):
+        ra = parse_ra(header.get(ra_key))
+        dec = parse_dec(header.get(dec_key))
+        if ra is not None and dec is not None:
+            return ra, dec
+    return None
+
+
+def unit_vector(ra: float, dec: float) -> Vector:
+    """Convert RA/Dec (degrees) to a unit vector."""
+    ra_rad = math.radians(ra)
+    dec_rad = math.radians(dec)
+    cos_dec = math.cos(dec_rad)
+    return (cos_dec * math.cos(ra_rad), cos_dec * math.sin(ra_rad), math.sin(dec_rad))
+
+
+def vector_position(v: Vector) -> tuple[float, float]:
+    """Convert a (not necessarily unit) vector back to RA/Dec (degrees)."""
+    x, y, z = v
+    ra = math.degrees(math.atan2(y, x)) % 360
+    dec = math.degrees(math.atan2(z, math.hypot(x, y)))
+    return ra, dec
+
+
+def cone_bounds(ra: float, dec: float, radius: float) -> tuple[Vector, float, float]:
+    """Return what is needed to search for the unit vectors in a cone.
+
+    Unit vectors within radius degrees of (ra, dec) are all within the chord length
+    2 sin(radius / 2) of its unit vector in every coordinate (so inside a box an R-tree
+    can find), and exactly those with a dot product of at least cos(radius) with it
+    are in the cone.
+
+    Returns:
+        (centre unit vector, chord length, cos(radius))
+    """
+    radius = math.radians(min(max(radius, 0.0), 180.0))
+    return unit_vector(ra, dec), 2 * math.sin(radius / 2), math.cos(radius)
+
+
+def format_position(ra: float, dec: float) -> str:
+    """Format RA/Dec (degrees) the usual way, i.e. '00h42m44s +41°16'09"'."""
+    total = round(ra / 15 * 3600) % (24 * 3600)
+    h, rest = divmod(total, 3600)
+    m, s = divmod(rest, 60)
+    sign = "-" if dec < 0 else "+"
+    total = round(abs(dec) * 3600)
+    d, rest = divmod(total, 3600)
+    dm, ds = divmod(rest, 60)
+    return f"{h:02d}h{m:02d}m{s:02d}s {sign}{d:02d}°{dm:02d}'{ds:02d}\""
@@ -0,0 +1,127 @@
+"""
+Measures where the time goes when sb starts (see 'sb --profile-startup'), so cold
+starts can be kept within STARTUP_BUDGET_MS.
+"""
+
+from __future__ import annotations
+
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from rich.table import Table
+
+import starbash
+from starbash import console
+
+# Target for a cold start: importing the CLI plus initializing Starbash
+STARTUP_BUDGET_MS = 300.0
+
+# How many of the slowest imported packages are listed
+SLOW_IMPORTS_SHOWN = 10
+
+
+def parse_importtime(output: str, module: str) -> tuple[float, dict[str, float]]:
+    """
+    Parse the output of 'python -X importtime' (which importing module produced).
+
+    Only module and the imports it caused are counted (not python's own startup).
+
+    Returns:
+        (total ms to import module, {top level package: ms spent importing it})
+    """
+    # (ms for the module itself, cumulative ms, name indented by nesting depth)
+    rows = []
+    for line in output.splitlines():
+        fields = line.removeprefix("import time:").split("|")
+        if len(fields) == 3 and fields[0].strip().isdigit():
+            rows.append((int(fields[0]) / 1000, int(fields[1]) / 1000, fields[2]))
+
+    # Modules are listed after everything they imported, indented one level deeper
+    for end in range(len(rows) - 1, -1, -1):
+        if rows[end][2].strip() == module:
+            break
+    else:
+        return 0.0, {}
+    depth = len(rows[end][2]) - len(rows[end][2].lstrip())
+    start = end
+    while start > 0:
+        name = rows[start - 1][2]
+        if len(name) - len(name.lstrip()) <= depth:
+            break
+        start -= 1
+
+    packages: dict[str, float] = {}
+    for own, _, name in rows[start : end + 1]:
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0.0) + own
+    return rows[end][1], packages
+
+
+def profile_imports(module: str = "starbash.main") -> tuple[float, dict[str, float]]:
+    """
+    Import a module in a fresh python (so nothing is imported yet) and time it.
+
+    Returns:
+        See parse_importtime().
+    """
+    # Make sure the child imports this same copy of starbash
+    src_dir = str(Path(starbash.__file__).parent.parent)
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        p for p in (src_dir, env.get("PYTHONPATH")) if p
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return parse_importtime(result.stderr, module)
+
+
+def profile_init() -> dict[str, float]:
+    """Time the steps of initializing Starbash (as a read-only command would), in ms."""
+    from starbash.app import Starbash
+
+    with Starbash("startup.profile", read_only=True) as sb:
+        return {name: secs * 1000 for name, secs in sb.startup_times.items()}
+
+
+def report_startup() -> None:
+    """Print how long starting sb takes, and what the time is spent on."""
+    import_total, packages = profile_imports()
+    slowest = sorted(packages.items(), key=lambda item: item[1], reverse=True)
+
+    table = Table(title="Import time (cold)")
+    table.add_column("Package", style="cyan")
+    table.add_column("ms", justify="right")
+    for package, ms in slowest[:SLOW_IMPORTS_SHOWN]:
+        table.add_row(package, f"{ms:.1f}")
+    if len(slowest) > SLOW_IMPORTS_SHOWN:
+        rest = sum(ms for _, ms in slowest[SLOW_IMPORTS_SHOWN:])
+        table.add_row(f"({len(slowest) - SLOW_IMPORTS_SHOWN} others)", f"{rest:.1f}")
+    table.add_row("Total", f"{import_total:.1f}", style="bold")
+    console.print(table)
+
+    start = time.perf_counter()
+    steps = profile_init()
+    init_total = (time.perf_counter() - start) * 1000
+
+    table = Table(title="Init time")
+    table.add_column("Step", style="cyan")
+    table.add_column("ms", justify="right")
+    for step, ms in steps.items():
+        table.add_row(step, f"{ms:.1f}")
+    table.add_row("Total", f"{init_total:.1f}", style="bold")
+    console.print(table)
+
+    total = import_total + init_total
+    style = "green" if total <= STARTUP_BUDGET_MS else "red"
+    console.print(
+        f"[{style}]Cold start: {total:.0f} ms "
+        f"(budget {STARTUP_BUDGET_MS:.0f} ms)[/{style}]"
+    )
@@ -7,8 +7,6 @@ import re
 
 import logging
 
-import RestrictedPython
-
 logger = logging.getLogger(__name__)
 
 
@@ -56,6 +54,9 @@ def make_safe_globals(context: dict = {}) -> dict:
     # FIXME - this is still unsafe, policies need to be added to limit import/getattr etc...
     # see https://restrictedpython.readthedocs.io/en/latest/usage/policy.html#implementing-a-policy
 
+    # RestrictedPython is only imported when a script runs (it slows down sb startup)
+    import RestrictedPython
+
     builtins = RestrictedPython.safe_builtins.copy()
 
     def write_test(obj):
@@ -240,6 +241,8 @@ class PythonTool(Tool):
 
             logger.info(f"Executing python script in {cwd} using RestrictedPython")
             try:
+                import RestrictedPython
+
                 byte_code = RestrictedPython.compile_restricted(
                     commands, filename="<python script>", mode="exec"
                 )
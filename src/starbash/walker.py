@@ -0,0 +1,103 @@
+"""Streaming discovery of the image files in a repo (see Starbash.reindex_repo)."""
+
+from __future__ import annotations
+
+import fnmatch
+import logging
+import os
+from pathlib import Path
+from typing import Iterator, Sequence
+
+# Files we index when a repo doesn't list its own include patterns
+DEFAULT_INCLUDE = ("*.fit*",)
+
+# Directories which never contain raw frames (our own processing output)
+SKIPPED_DIRS = ("process",)
+
+
+def is_skipped_dir(rel_path: str, exclude: Sequence[str] = ()) -> bool:
+    """True if the walk should not descend into this directory (relative to root)."""
+    name = rel_path.rsplit("/", 1)[-1]
+    return (
+        name.startswith(".")
+        or name in SKIPPED_DIRS
+        or bool(exclude and _matches(rel_path, name, exclude))
+    )
+
+
+def is_wanted_file(
+    rel_path: str, include: Sequence[str] = DEFAULT_INCLUDE, exclude: Sequence[str] = ()
+) -> bool:
+    """True if a file (relative to the root) should be indexed.
+
+    The directories containing the file are not checked (see is_skipped_dir).
+    """
+    name = rel_path.rsplit("/", 1)[-1]
+    return _matches(rel_path, name, include) and not (
+        exclude and _matches(rel_path, name, exclude)
+    )
+
+
+def _matches(rel_path: str, name: str, patterns: Sequence[str]) -> bool:
+    """True if a path (relative to the repo root, '/' separated) matches any pattern.
+
+    Patterns without a '/' are matched against the file/directory name, others against
+    the whole relative path.
+    """
+    for pattern in patterns:
+        if fnmatch.fnmatch(rel_path if "/" in pattern else name, pattern):
+            return True
+    return False
+
+
+def walk_files(
+    root: Path,
+    include: Sequence[str] = DEFAULT_INCLUDE,
+    exclude: Sequence[str] = (),
+) -> Iterator[tuple[str, os.stat_result]]:
+    """Yield (path, stat) for each matching file under root, as they are discovered.
+
+    Unlike Path.rglob() this never builds the full list of files, so indexing can start
+    right away on huge (or slow network mounted) repos.  Entries are visited in name
+    order (descending into directories as they come), so files are yielded in the
+    order of their path components, i.e. sorted by Path(path).relative_to(root).parts.
+    Hidden directories, 'process' directories and symlinks to directories are skipped.
+
+    Args:
+        root: The directory to walk.
+        include: Glob patterns of the files to yield.
+        exclude: Glob patterns of files or directories to skip.
+    """
+    # The directories being walked (outermost first) with their remaining entries
+    stack: list[tuple[str, Iterator[os.DirEntry[str]]]] = []
+
+    def enter(dir: str, rel_dir: str) -> None:
+        try:
+            with os.scandir(dir) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError as e:
+            logging.warning("Failed to read directory %s: %s", dir, e)
+            return
+        stack.append((rel_dir, iter(entries)))
+
+    enter(str(root), "")
+    while stack:
+        rel_dir, entries = stack[-1]
+        entry = next(entries, None)
+        if entry is None:
+            stack.pop()
+            continue
+
+        rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                if not is_skipped_dir(rel_path, exclude):
+                    enter(entry.path, rel_path)
+                continue
+            if not is_wanted_file(rel_path, include, exclude):
+                continue
+            st = entry.stat()
+        except OSError as e:
+            logging.warning("Failed to stat %s: %s", entry.path, e)
+            continue
+        yield entry.path, st
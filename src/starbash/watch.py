@@ -0,0 +1,258 @@
+"""Watching repos for new image files (see 'sb repo watch').
+
+Changes are picked up with inotify where available (Linux), otherwise by periodically
+walking the repos.  Files are only reported once they have stopped changing, so frames
+which are still being written by the capture software are never indexed half written.
+"""
+
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Iterator, Protocol, Sequence
+
+from starbash.database import FileSignature, file_signature
+from starbash.walker import DEFAULT_INCLUDE, is_skipped_dir, is_wanted_file, walk_files
+
+# Seconds a file must be unchanged (size and mtime) before it is considered written
+DEFAULT_SETTLE_SECONDS = 2.0
+
+# Seconds between walks of the repos when inotify isn't available
+DEFAULT_POLL_SECONDS = 5.0
+
+FileStat = tuple[str, os.stat_result]
+
+
+@dataclass
+class WatchRoot:
+    """A directory tree to watch, with the repo's include/exclude globs."""
+
+    path: Path
+    include: Sequence[str] = DEFAULT_INCLUDE
+    exclude: Sequence[str] = ()
+
+    def walk(self) -> Iterator[FileStat]:
+        return walk_files(self.path, self.include, self.exclude)
+
+
+class Watcher(Protocol):
+    def poll(self, timeout: float) -> list[FileStat]:
+        """Wait up to timeout seconds, returning files which might be new or changed."""
+        ...
+
+    def close(self) -> None: ...
+
+
+class PollingWatcher:
+    """Finds new/changed files by walking the roots every interval seconds."""
+
+    def __init__(
+        self, roots: Sequence[WatchRoot], interval: float = DEFAULT_POLL_SECONDS
+    ):
+        self.roots = roots
+        self.interval = interval
+        self._signatures = self._scan()
+        self._next_scan = time.monotonic() + interval
+
+    def _scan(self) -> dict[str, tuple[FileSignature, os.stat_result]]:
+        return {
+            f: (file_signature(st), st) for root in self.roots for f, st in root.walk()
+        }
+
+    def poll(self, timeout: float) -> list[FileStat]:
+        delay = self._next_scan - time.monotonic()
+        if delay > timeout:
+            time.sleep(timeout)
+            return []
+        time.sleep(max(delay, 0))
+        self._next_scan = time.monotonic() + self.interval
+
+        old = self._signatures
+        self._signatures = self._scan()
+        return [
+            (f, st)
+            for f, (sig, st) in self._signatures.items()
+            if f not in old or old[f][0] != sig
+        ]
+
+    def close(self) -> None:
+        pass
+
+
+# From <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len (followed by the name)
+_WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_ONLYDIR
+
+
+class InotifyWatcher:
+    """Finds new/changed files with Linux inotify (one watch per directory of the roots).
+
+    Raises:
+        OSError: If inotify isn't available.
+    """
+
+    def __init__(self, roots: Sequence[WatchRoot]):
+        libc_name = ctypes.util.find_library("c")
+        if not libc_name:
+            raise OSError("libc not found")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self._libc, "inotify_init1"):
+            raise OSError("inotify is not supported on this platform")
+
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_init1 failed: {os.strerror(errno)}")
+
+        self.roots = roots
+        # watch descriptor -> (root, directory, directory path relative to the root)
+        self._watches: dict[int, tuple[WatchRoot, str, str]] = {}
+        for root in roots:
+            self._watch_tree(root, str(root.path), "")
+
+    def _watch_tree(self, root: WatchRoot, dir: str, rel_dir: str) -> None:
+        """Watch dir and (recursively) all its subdirectories which aren't skipped."""
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(dir), _WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            logging.warning("Failed to watch %s: %s", dir, os.strerror(errno))
+            return
+        self._watches[wd] = (root, dir, rel_dir)
+
+        try:
+            with os.scandir(dir) as it:
+                subdirs = [e for e in it if e.is_dir(follow_symlinks=False)]
+        except OSError as e:
+            logging.warning("Failed to read directory %s: %s", dir, e)
+            return
+        for entry in subdirs:
+            rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            if not is_skipped_dir(rel_path, root.exclude):
+                self._watch_tree(root, entry.path, rel_path)
+
+    def poll(self, timeout: float) -> list[FileStat]:
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            buf = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        changed: dict[str, os.stat_result] = {}
+        offset = 0
+        while offset < len(buf):
+            wd, mask, _cookie, name_len = _EVENT.unpack_from(buf, offset)
+            offset += _EVENT.size
+            name = os.fsdecode(buf[offset : offset + name_len].rstrip(b"\0"))
+            offset += name_len
+
+            if mask & IN_Q_OVERFLOW:
+                # We missed events, so fall back to checking everything
+                logging.warning("Filesystem watch overflowed, rescanning all repos")
+                changed.update(f for root in self.roots for f in root.walk())
+                continue
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)  # the directory was deleted
+                continue
+            watch = self._watches.get(wd)
+            if watch is None or not name:
+                continue
+
+            root, dir, rel_dir = watch
+            path = os.path.join(dir, name)
+            rel_path = f"{rel_dir}/{name}" if rel_dir else name
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and not is_skipped_dir(
+                    rel_path, root.exclude
+                ):
+                    # Files may have been added before the watch was in place
+                    self._watch_tree(root, path, rel_path)
+                    changed.update(walk_files(Path(path), root.include, root.exclude))
+            elif is_wanted_file(rel_path, root.include, root.exclude):
+                try:
+                    changed[path] = os.stat(path)
+                except OSError:
+                    pass  # already gone again
+        return list(changed.items())
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+def create_watcher(
+    roots: Sequence[WatchRoot],
+    poll: bool = False,
+    interval: float = DEFAULT_POLL_SECONDS,
+) -> Watcher:
+    """Return an inotify based watcher if possible, otherwise a polling one."""
+    if not poll:
+        try:
+            return InotifyWatcher(roots)
+        except OSError as e:
+            logging.info("inotify not available (%s), polling for changes instead", e)
+    return PollingWatcher(roots, interval)
+
+
+@dataclass
+class Debouncer:
+    """Holds back changed files until they have stopped changing for settle seconds."""
+
+    settle: float = DEFAULT_SETTLE_SECONDS
+    # path -> (signature when last seen changing, time it was seen)
+    pending: dict[str, tuple[FileSignature, float]] = field(default_factory=dict)
+
+    def changed(self, files: Sequence[FileStat], now: float) -> None:
+        for f, st in files:
+            self.pending[f] = (file_signature(st), now)
+
+    def ready(self, now: float) -> list[FileStat]:
+        """Return (and forget) the files which have been stable for long enough."""
+        done = []
+        for f, (sig, since) in list(self.pending.items()):
+            try:
+                st = os.stat(f)
+            except OSError:
+                del self.pending[f]  # deleted (or renamed) before it settled
+                continue
+            if file_signature(st) != sig:
+                self.pending[f] = (file_signature(st), now)  # still being written
+            elif now - since >= self.settle:
+                del self.pending[f]
+                done.append((f, st))
+        return done
+
+
+def run_watch(
+    watcher: Watcher,
+    on_files: Callable[[list[FileStat]], None],
+    settle: float = DEFAULT_SETTLE_SECONDS,
+    stop: threading.Event | None = None,
+) -> None:
+    """Pass settled new/changed files to on_files until stop is set (or Ctrl-C)."""
+    debouncer = Debouncer(settle)
+    tick = max(settle / 4, 0.05)
+    while stop is None or not stop.is_set():
+        debouncer.changed(watcher.poll(tick), time.monotonic())
+        files = debouncer.ready(time.monotonic())
+        if files:
+            on_files(files)
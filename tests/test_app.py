@@ -2,6 +2,9 @@
 
 import json
 import os
+import shutil
+import threading
+from functools import partial
 from pathlib import Path
 from unittest.mock import Mock, MagicMock, patch, call
 import pytest
@@ -10,6 +13,7 @@ import typer
 from starbash.app import Starbash, create_user, setup_logging, copy_images_to_dir
 from starbash.database import Database
 from starbash.selection import Selection
+from starbash.watch import create_watcher
 from starbash import paths
 
 
@@ -656,6 +660,154 @@ class TestGetSessionImages:
             assert images == []
 
 
+class TestGuessSessions:
+    """Tests for the guess_sessions method."""
+
+    def _add(self, app, name, imagetyp, date, temp=None, telescop="Test"):
+        header = {
+            "path": f"/repo/{name}.fit",
+            Database.DATE_OBS_KEY: date,
+            Database.FILTER_KEY: "Ha",
+            Database.IMAGETYP_KEY: imagetyp,
+            Database.OBJECT_KEY: "M31",
+            Database.TELESCOP_KEY: telescop,
+            Database.EXPTIME_KEY: 60.0,
+        }
+        if temp is not None:
+            header[Database.CCD_TEMP_KEY] = temp
+        image_id = app.db.upsert_image(header)
+        app._add_session(header["path"], image_id, header)
+        return image_id
+
+    def test_guess_sessions_ranking(self, setup_test_environment, mock_analytics):
+        """Candidates are ranked by CCD-TEMP and then date, using one query."""
+        with Starbash() as app:
+            self._add(app, "light", "Light", "2023-10-15T20:00:00", temp=-10)
+            self._add(app, "dark_far", "Dark", "2023-09-01T20:00:00", temp=-10)
+            self._add(app, "dark_warm", "Dark", "2023-10-15T21:00:00", temp=-5)
+            self._add(app, "dark_near", "Dark", "2023-10-14T20:00:00", temp=-10.0)
+            self._add(app, "dark_notemp", "Dark", "2023-10-10T20:00:00")
+            self._add(app, "dark_other", "Dark", "2023-10-15T20:00:00", -10, "Other")
+            # A candidate whose reference image has gone missing is skipped
+            missing = self._add(app, "dark_gone", "Dark", "2023-08-01T20:00:00")
+            app.db.remove_image("/repo/dark_gone.fit")
+
+            ref = app.db.search_session(("WHERE imagetyp = ?", ["Light"]))[0]
+            with patch.object(
+                app.db, "search_image", wraps=app.db.search_image
+            ) as search_image:
+                guessed = app.guess_sessions(ref, "Dark")
+            paths = [app.get_session_image(s)["path"] for s in guessed]
+
+        # Asserted outside the with block (Starbash.__exit__ reports and swallows errors)
+        # Only the reference image of ref was looked up separately
+        assert search_image.call_count == 1
+        assert paths == [
+            "/repo/dark_near.fit",
+            "/repo/dark_far.fit",
+            "/repo/dark_warm.fit",
+            "/repo/dark_notemp.fit",
+        ]
+        assert all(s["image_doc_id"] != missing for s in guessed)
+
+    def test_guess_sessions_batch_matches_guess_sessions(
+        self, setup_test_environment, mock_analytics
+    ):
+        """The batch version ranks each reference session like guess_sessions."""
+        with Starbash() as app:
+            self._add(app, "light1", "Light", "2023-10-15T20:00:00", temp=-10)
+            self._add(app, "light2", "Light", "2023-09-01T20:00:00", temp=-5)
+            self._add(app, "light3", "Light", "2023-10-01T20:00:00", -10, "Other")
+            self._add(app, "flat1", "Flat", "2023-10-15T21:00:00", temp=-7)
+            self._add(app, "flat2", "Flat", "2023-09-02T21:00:00", temp=-5)
+            self._add(app, "flat3", "Flat", "2023-10-01T21:00:00", -8, "Other")
+            self._add(app, "flat4", "Flat", "2023-09-20T21:00:00")
+
+            lights = app.db.search_session(("WHERE imagetyp = ?", ["Light"]))
+            expected = [app.guess_sessions(ref, "Flat") for ref in lights]
+            guessed = app.guess_sessions_batch(lights, "Flat")
+
+            # One reference at a time gives the same rankings
+            with patch.object(Starbash, "CALIBRATION_CHUNK_SIZE", 1), patch.object(
+                app.db, "search_session_images", wraps=app.db.search_session_images
+            ) as search_session_images:
+                chunked = app.guess_sessions_batch(lights, "Flat")
+
+        assert len(expected) == 3
+        assert [len(e) for e in expected] == [3, 3, 1]
+        assert guessed == expected
+        assert chunked == expected
+        # Candidates are only fetched for the references' telescopes and filters
+        # (after the query for the references themselves)
+        candidate_queries = search_session_images.call_args_list[1:]
+        assert len(candidate_queries) == 2
+        for call in candidate_queries:
+            sql, params = call.args[0]
+            assert "TELESCOP = ?" in sql and "FILTER = ?" in sql
+            assert "Ha" in params
+
+    def test_calibration_matches_updated_incrementally(
+        self, setup_test_environment, mock_analytics
+    ):
+        """Stored calibration rankings follow new and removed sessions."""
+        with Starbash() as app:
+            self._add(app, "light1", "Light", "2023-10-15T20:00:00", temp=-10)
+            self._add(app, "light2", "Light", "2023-09-01T20:00:00", temp=-5)
+            self._add(app, "dark1", "DARK", "2023-10-01T21:00:00", temp=-5)
+            self._add(app, "dark2", "DARK", "2023-09-02T21:00:00", temp=-8)
+            app._update_calibration_matches()
+
+            lights = app.db.search_session(("WHERE imagetyp = ?", ["Light"]))
+            stored = [app.db.get_calibration_matches(l["id"], "DARK") for l in lights]
+            expected = [app.guess_sessions(l, "DARK") for l in lights]
+            no_bias = app.db.get_calibration_matches(lights[0]["id"], "BIAS")
+
+            # A new, better candidate for light1 re-ranks the existing light sessions
+            self._add(app, "dark3", "DARK", "2023-10-15T21:00:00", temp=-10)
+            app._update_calibration_matches()
+            after_add = [app.calibration_candidates(l, "DARK") for l in lights]
+            expected_after_add = [app.guess_sessions(l, "DARK") for l in lights]
+
+            # Deleted candidates drop out of the stored rankings
+            app._remove_image("/repo/dark3.fit")
+            after_remove = app.db.get_calibration_matches(lights[0]["id"], "DARK")
+
+        assert [len(s) for s in stored] == [2, 2]
+        assert stored == expected
+        assert no_bias == []
+        assert after_add == expected_after_add
+        assert after_add[0][0]["start"] == "2023-10-15T21:00:00"
+        assert after_remove == stored[0]
+
+    def test_calibration_matches_backfilled_after_delete(
+        self, setup_test_environment, mock_analytics
+    ):
+        """A light whose stored candidate is deleted gets its next best one instead."""
+        with patch.object(Starbash, "MAX_CALIBRATION_MATCHES", 2), Starbash() as app:
+            self._add(app, "light", "Light", "2023-10-15T20:00:00", temp=-10)
+            self._add(app, "dark1", "DARK", "2023-10-15T21:00:00", temp=-10)
+            self._add(app, "dark2", "DARK", "2023-10-01T21:00:00", temp=-10)
+            self._add(app, "dark3", "DARK", "2023-09-01T21:00:00", temp=-10)
+            app._update_calibration_matches()
+            light = app.db.search_session(("WHERE imagetyp = ?", ["Light"]))[0]
+            before = app.db.get_calibration_matches(light["id"], "DARK")
+
+            app._remove_image("/repo/dark1.fit")
+            app._update_calibration_matches()
+            after = app.db.get_calibration_matches(light["id"], "DARK")
+            expected = app.guess_sessions(light, "DARK")
+
+        assert [s["start"] for s in before] == [
+            "2023-10-15T21:00:00",
+            "2023-10-01T21:00:00",
+        ]
+        assert [s["start"] for s in after] == [
+            "2023-10-01T21:00:00",
+            "2023-09-01T21:00:00",
+        ]
+        assert after == expected
+
+
 class TestRemoveRepoRef:
     """Tests for the remove_repo_ref method."""
 
@@ -809,6 +961,556 @@ class TestReindexRepo:
 
             assert "Failed to read FITS header" in caplog.text
 
+    def test_reindex_repo_parallel_matches_serial(
+        self, setup_test_environment, mock_analytics
+    ):
+        """Test that reindexing with a worker pool gives the same DB as the serial path."""
+        mock_analytics["exception"].return_value = False  # don't hide failures
+        from astropy.io import fits as astropy_fits
+
+        tmp_path = setup_test_environment["tmp_path"]
+        test_repo = tmp_path / "test_repo"
+        test_repo.mkdir()
+        (test_repo / "starbash.toml").write_text("[repo]\nkind = 'images'\n")
+
+        for i in range(6):
+            hdu = astropy_fits.PrimaryHDU()
+            hdu.header["DATE-OBS"] = f"2023-10-1{i // 3}T20:3{i}:00"
+            hdu.header["IMAGETYP"] = "Light"
+            hdu.header["FILTER"] = "Ha"
+            hdu.header["OBJECT"] = "M31"
+            hdu.header["EXPTIME"] = 60.0
+            astropy_fits.HDUList([hdu]).writeto(test_repo / f"light_{i}.fit")
+        (test_repo / "bad.fit").write_text("This is not a FITS file")
+
+        def snapshot(db: Database):
+            return (db.all_images(), db.search_session())
+
+        with Starbash() as app:
+            repo = app.repo_manager.add_repo(f"file://{test_repo}")
+
+            app.reindex_repo(repo, jobs=1)
+            serial = snapshot(app.db)
+
+            app.db.close()
+            app.db = Database(base_dir=tmp_path)
+            app.reindex_repo(repo, jobs=2)
+            parallel = snapshot(app.db)
+
+        assert len(serial[0]) == 6
+        assert len(serial[1]) == 2
+        assert parallel == serial
+
+    def test_reindex_repo_skips_unchanged_files(
+        self, setup_test_environment, mock_analytics
+    ):
+        """Test that a warm reindex only rereads files whose signature changed."""
+        mock_analytics["exception"].return_value = False  # don't hide failures
+        from astropy.io import fits as astropy_fits
+        import starbash.app as app_module
+
+        test_repo = setup_test_environment["tmp_path"] / "test_repo"
+        test_repo.mkdir()
+
+        def write(name: str, filter: str):
+            hdu = astropy_fits.PrimaryHDU()
+            hdu.header["DATE-OBS"] = "2023-10-15T20:30:00"
+            hdu.header["IMAGETYP"] = "Light"
+            hdu.header["FILTER"] = filter
+            astropy_fits.HDUList([hdu]).writeto(test_repo / name, overwrite=True)
+
+        for i in range(3):
+            write(f"light_{i}.fit", "Ha")
+
+        read: list[str] = []
+        real_read_headers = app_module.read_headers
+
+        def spy_read_headers(paths, **kwargs):
+            paths = list(paths)
+            read.extend(paths)
+            return real_read_headers(paths, **kwargs)
+
+        with Starbash() as app:
+            repo = app.repo_manager.add_repo(f"file://{test_repo}")
+            with patch.object(app_module, "read_headers", spy_read_headers):
+                app.reindex_repo(repo)
+                assert len(read) == 3
+
+                # Nothing changed - nothing should be opened
+                read.clear()
+                app.reindex_repo(repo)
+                assert read == []
+
+                # Modify one file in place (make sure the mtime moves on)
+                changed = test_repo / "light_1.fit"
+                write("light_1.fit", "OIII")
+                st = changed.stat()
+                os.utime(changed, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+                app.reindex_repo(repo)
+                assert read == [str(changed)]
+
+                # --force rereads everything
+                read.clear()
+                app.reindex_repo(repo, force=True)
+                assert len(read) == 3
+
+            image = app.db.get_image(str(changed))
+            assert image is not None
+            assert image["FILTER"] == "OIII"
+
+    def test_reindex_repo_prunes_and_detects_moves(
+        self, setup_test_environment, mock_analytics
+    ):
+        """Test that deleted files are dropped and moved files are renamed in place."""
+        mock_analytics["exception"].return_value = False  # don't hide failures
+        from astropy.io import fits as astropy_fits
+        import starbash.app as app_module
+
+        test_repo = setup_test_environment["tmp_path"] / "test_repo"
+        night = test_repo / "night1"
+        night.mkdir(parents=True)
+        for i in range(3):
+            hdu = astropy_fits.PrimaryHDU()
+            hdu.header["DATE-OBS"] = f"2023-10-15T20:3{i}:00"
+            hdu.header["IMAGETYP"] = "Light"
+            hdu.header["FILTER"] = "Ha"
+            hdu.header["EXPTIME"] = 60.0
+            astropy_fits.HDUList([hdu]).writeto(night / f"light_{i}.fit")
+
+        with Starbash() as app:
+            repo = app.repo_manager.add_repo(f"file://{test_repo}")
+            app.reindex_repo(repo)
+            sessions = app.db.search_session()
+            assert len(sessions) == 1
+            assert sessions[0]["num_images"] == 3
+            assert sessions[0]["exptime_total"] == 180.0
+
+            # Delete the first frame (which is also the session reference image)
+            (night / "light_0.fit").unlink()
+            app.reindex_repo(repo)
+            assert app.db.get_image(str(night / "light_0.fit")) is None
+            sessions = app.db.search_session()
+            assert len(sessions) == 1
+            assert sessions[0]["num_images"] == 2
+            assert sessions[0]["exptime_total"] == 120.0
+            assert sessions[0]["start"] == "2023-10-15T20:31:00"
+            assert app.get_session_image(sessions[0])["path"] == str(
+                night / "light_1.fit"
+            )
+
+            # Move the directory - the files should be renamed, not reread
+            moved = test_repo / "renamed"
+            night.rename(moved)
+            read: list[str] = []
+            real_read_headers = app_module.read_headers
+
+            def spy_read_headers(paths, **kwargs):
+                paths = list(paths)
+                read.extend(paths)
+                return real_read_headers(paths, **kwargs)
+
+            with patch.object(app_module, "read_headers", spy_read_headers):
+                app.reindex_repo(repo)
+                assert read == []
+            assert len(app.db.all_images()) == 2
+            assert app.db.get_image(str(moved / "light_1.fit")) is not None
+            assert app.db.search_session()[0]["num_images"] == 2
+
+            # Deleting everything removes the session too
+            for f in moved.iterdir():
+                f.unlink()
+            app.reindex_repo(repo)
+            assert app.db.all_images() == []
+            assert app.db.search_session() == []
+
+    def test_reindex_repo_sessions_by_exposure(
+        self, setup_test_environment, mock_analytics
+    ):
+        """Frames are split into sessions by exposure length, once per batch."""
+        mock_analytics["exception"].return_value = False  # don't hide failures
+        from astropy.io import fits as astropy_fits
+
+        test_repo = setup_test_environment["tmp_path"] / "test_repo"
+        test_repo.mkdir()
+        for i, exptime in enumerate([60.0, 60.0, 300.0]):
+            hdu = astropy_fits.PrimaryHDU()
+            hdu.header["DATE-OBS"] = f"2023-10-15T20:3{i}:00"
+            hdu.header["IMAGETYP"] = "Light"
+            hdu.header["FILTER"] = "Ha"
+            hdu.header["EXPTIME"] = exptime
+            astropy_fits.HDUList([hdu]).writeto(test_repo / f"light_{i}.fit")
+
+        with Starbash() as app:
+            repo = app.repo_manager.add_repo(f"file://{test_repo}")
+            with patch.object(
+                app.db, "update_sessions", wraps=app.db.update_sessions
+            ) as update_sessions:
+                app.reindex_repo(repo)
+            assert update_sessions.call_count == 1
+
+            sessions = app.db.search_session(("ORDER BY exptime", []))
+            assert [(s["exptime"], s["num_images"], s["end"]) for s in sessions] == [
+                (60.0, 2, "2023-10-15T20:32:00"),
+                (300.0, 1, "2023-10-15T20:37:00"),
+            ]
+            images = app.get_session_images(sessions[1])
+            assert [i["path"] for i in images] == [str(test_repo / "light_2.fit")]
+
+    def test_reindex_repo_changed_session_keys(
+        self, setup_test_environment, mock_analytics
+    ):
+        """A file rewritten with other session keys leaves its old session too."""
+        mock_analytics["exception"].return_value = False  # don't hide failures
+        from astropy.io import fits as astropy_fits
+
+        test_repo = setup_test_environment["tmp_path"] / "test_repo"
+        test_repo.mkdir()
+
+        def write(i: int, filter: str):
+            hdu = astropy_fits.PrimaryHDU()
+            hdu.header["DATE-OBS"] = f"2023-10-15T20:3{i}:00"
+            hdu.header["IMAGETYP"] = "Light"
+            hdu.header["FILTER"] = filter
+            hdu.header["EXPTIME"] = 60.0
+            path = test_repo / f"light_{i}.fit"
+            astropy_fits.HDUList([hdu]).writeto(path, overwrite=True)
+            return path
+
+        def sessions(db: Database):
+            return sorted(
+                (s["filter"], s["num_images"], s["start"], s["end"])
+                for s in db.search_session()
+            )
+
+        paths = [write(i, "Ha") for i in range(3)]
+        with Starbash() as app:
+            repo = app.repo_manager.add_repo(f"file://{test_repo}")
+            app.reindex_repo(repo)
+            assert sessions(app.db) == [
+                ("Ha", 3, "2023-10-15T20:30:00", "2023-10-15T20:33:00")
+            ]
+
+            # Rewrite the last frame with another filter (moving the mtime on)
+            write(2, "OIII")
+            st = paths[2].stat()
+            os.utime(paths[2], ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+            app.reindex_repo(repo)
+            incremental = sessions(app.db)
+            assert incremental == [
+                ("Ha", 2, "2023-10-15T20:30:00", "2023-10-15T20:32:00"),
+                ("OIII", 1, "2023-10-15T20:32:00", "2023-10-15T20:33:00"),
+            ]
+
+            app.db.update_sessions()
+            assert sessions(app.db) == incremental
+
+    def test_reindex_repo_session_failure_rolls_back(
+        self, setup_test_environment, mock_analytics
+    ):
+        """If sessions can't be updated, the batch of images isn't stored either."""
+        mock_analytics["exception"].return_value = False  # don't hide failures
+        from astropy.io import fits as astropy_fits
+
+        test_repo = setup_test_environment["tmp_path"] / "test_repo"
+        test_repo.mkdir()
+        hdu = astropy_fits.PrimaryHDU()
+        hdu.header["DATE-OBS"] = "2023-10-15T20:30:00"
+        hdu.header["IMAGETYP"] = "Light"
+        astropy_fits.HDUList([hdu]).writeto(test_repo / "light.fit")
+
+        with Starbash() as app:
+            repo = app.repo_manager.add_repo(f"file://{test_repo}")
+            with patch.object(
+                app.db, "update_sessions", side_effect=RuntimeError("boom")
+            ):
+                with pytest.raises(RuntimeError, match="boom"):
+                    app.reindex_repo(repo)
+            assert app.db.all_images() == []
+
+            # Nothing was left half done, so the next reindex stores everything
+            app.reindex_repo(repo)
+            assert len(app.db.all_images()) == 1
+            assert len(app.db.search_session()) == 1
+
+    def test_reindex_repo_include_exclude(self, setup_test_environment, mock_analytics):
+        """Test that the repo's index.include/exclude globs pick the files indexed."""
+        mock_analytics["exception"].return_value = False  # don't hide failures
+        from astropy.io import fits as astropy_fits
+
+        test_repo = setup_test_environment["tmp_path"] / "test_repo"
+        names = ["a.fits", "b.fts", "rejected/c.fts", ".cache/d.fts", "process/e.fts"]
+        for name in names:
+            f = test_repo / name
+            f.parent.mkdir(parents=True, exist_ok=True)
+            hdu = astropy_fits.PrimaryHDU()
+            hdu.header["DATE-OBS"] = "2023-10-15T20:30:00"
+            hdu.header["IMAGETYP"] = "Light"
+            astropy_fits.HDUList([hdu]).writeto(f)
+        (test_repo / "starbash.toml").write_text(
+            '[repo]\nkind = "images"\n\n'
+            '[index]\ninclude = ["*.fits", "*.fts"]\nexclude = ["rejected"]\n'
+        )
+
+        with Starbash() as app:
+            repo = app.repo_manager.add_repo(f"file://{test_repo}")
+            app.reindex_repo(repo)
+            paths = sorted(i["path"] for i in app.db.all_images())
+
+        assert paths == [str(test_repo / "a.fits"), str(test_repo / "b.fts")]
+
+    @pytest.mark.parametrize("force", [False, True])
+    def test_reindex_repo_resume(self, setup_test_environment, mock_analytics, force):
+        """Test that an interrupted reindex resumes from its checkpoint."""
+        mock_analytics["exception"].return_value = False  # don't hide failures
+        from astropy.io import fits as astropy_fits
+        import starbash.app as app_module
+
+        test_repo = setup_test_environment["tmp_path"] / "test_repo"
+        for night in range(2):
+            (test_repo / f"night{night}").mkdir(parents=True)
+            for i in range(5):
+                hdu = astropy_fits.PrimaryHDU()
+                hdu.header["DATE-OBS"] = f"2023-10-1{night}T20:3{i}:00"
+                hdu.header["IMAGETYP"] = "Light"
+                hdu.header["FILTER"] = "Ha"
+                hdu.header["EXPTIME"] = 60.0
+                astropy_fits.HDUList([hdu]).writeto(
+                    test_repo / f"night{night}" / f"light_{i}.fit"
+                )
+
+        def db_state(app):
+            return (
+                app.db.all_images(),
+                app.db.search_session(),
+                app.db.get_signatures(str(test_repo)),
+            )
+
+        real_read_headers = app_module.read_headers
+        read: list[str] = []
+
+        def interrupted_read_headers(paths, **kwargs):
+            for n, result in enumerate(real_read_headers(paths, **kwargs)):
+                if n == 7:
+                    raise KeyboardInterrupt()
+                yield result
+
+        def spy_read_headers(paths, **kwargs):
+            for result in real_read_headers(paths, **kwargs):
+                read.append(result[0])
+                yield result
+
+        with Starbash() as app:
+            repo = app.repo_manager.add_repo(f"file://{test_repo}")
+            if force:
+                app.reindex_repo(repo)
+            with patch.object(app_module, "read_headers", interrupted_read_headers):
+                with pytest.raises(KeyboardInterrupt):
+                    app.reindex_repo(repo, force=force, batch_size=3)
+
+            # Only whole batches were committed
+            last = str(test_repo / "night1" / "light_0.fit")
+            assert app.db.get_reindex_checkpoint(repo.url) == (last, 6)
+            if not force:
+                assert len(app.db.all_images()) == 6
+
+            with patch.object(app_module, "read_headers", spy_read_headers):
+                app.reindex_repo(repo, force=force, batch_size=3, resume=True)
+            assert app.db.get_reindex_checkpoint(repo.url) is None
+            assert app.db.is_reindex_complete(repo.url)
+            resumed = db_state(app)
+
+        # Files committed before the interruption were not read again
+        assert read == [
+            str(test_repo / "night1" / f"light_{i}.fit") for i in range(1, 5)
+        ]
+
+        # Same result as an uninterrupted run (in a fresh database)
+        paths.set_test_directories(
+            setup_test_environment["config_dir"],
+            setup_test_environment["tmp_path"] / "data2",
+        )
+        with Starbash() as app:
+            repo = app.repo_manager.add_repo(f"file://{test_repo}")
+            if force:
+                app.reindex_repo(repo)
+            app.reindex_repo(repo, force=force, batch_size=3)
+            uninterrupted = db_state(app)
+
+        assert resumed == uninterrupted
+
+    def test_reindex_repos_force_resume_skips_completed_repos(
+        self, setup_test_environment, mock_analytics
+    ):
+        """Resuming a --force reindex of all repos doesn't redo the finished ones."""
+        mock_analytics["exception"].return_value = False  # don't hide failures
+        from astropy.io import fits as astropy_fits
+        import starbash.app as app_module
+
+        tmp_path = setup_test_environment["tmp_path"]
+        repo_dirs = [tmp_path / "repo_a", tmp_path / "repo_b"]
+        for n, repo_dir in enumerate(repo_dirs):
+            repo_dir.mkdir()
+            for i in range(3):
+                hdu = astropy_fits.PrimaryHDU()
+                hdu.header["DATE-OBS"] = f"2023-10-1{n}T20:3{i}:00"
+                hdu.header["IMAGETYP"] = "Light"
+                astropy_fits.HDUList([hdu]).writeto(repo_dir / f"light_{i}.fit")
+
+        real_read_headers = app_module.read_headers
+        read: list[str] = []
+
+        def interrupted_read_headers(paths, **kwargs):
+            for result in real_read_headers(paths, **kwargs):
+                if result[0].startswith(str(repo_dirs[1])):
+                    raise KeyboardInterrupt()
+                yield result
+
+        def spy_read_headers(paths, **kwargs):
+            for result in real_read_headers(paths, **kwargs):
+                read.append(result[0])
+                yield result
+
+        with Starbash() as app:
+            for repo_dir in repo_dirs:
+                app.repo_manager.add_repo(f"file://{repo_dir}")
+            app.reindex_repos()
+            with patch.object(app_module, "read_headers", interrupted_read_headers):
+                with pytest.raises(KeyboardInterrupt):
+                    app.reindex_repos(force=True)
+            with patch.object(app_module, "read_headers", spy_read_headers):
+                app.reindex_repos(force=True, resume=True)
+            num_images = len(app.db.all_images())
+
+        # repo_a was finished, only repo_b (which wasn't) is still forced
+        assert sorted(read) == [str(repo_dirs[1] / f"light_{i}.fit") for i in range(3)]
+        assert num_images == 6
+
+    def test_reindex_repo_resume_ignores_foreign_checkpoint(
+        self, setup_test_environment, mock_analytics, caplog
+    ):
+        """A checkpoint outside the repo (i.e. it moved) is dropped, not fatal."""
+        mock_analytics["exception"].return_value = False  # don't hide failures
+        from astropy.io import fits as astropy_fits
+
+        test_repo = setup_test_environment["tmp_path"] / "test_repo"
+        test_repo.mkdir()
+        hdu = astropy_fits.PrimaryHDU()
+        hdu.header["DATE-OBS"] = "2023-10-15T20:30:00"
+        hdu.header["IMAGETYP"] = "Light"
+        astropy_fits.HDUList([hdu]).writeto(test_repo / "light.fit")
+
+        with Starbash() as app:
+            repo = app.repo_manager.add_repo(f"file://{test_repo}")
+            app.db.set_reindex_checkpoint(repo.url, "/old/place/light.fit", 1)
+            app.reindex_repo(repo, resume=True)
+            num_images = len(app.db.all_images())
+            complete = app.db.is_reindex_complete(repo.url)
+
+        assert "Ignoring the reindex checkpoint" in caplog.text
+        assert num_images == 1
+        assert complete
+
+    def _write_dedupe_repos(self, tmp_path, dedupe):
+        """A NAS repo of 3 lights, and a laptop repo with copies of 2 (plus 1 more)."""
+        from astropy.io import fits as astropy_fits
+        import numpy as np
+
+        nas = tmp_path / "nas"
+        laptop = tmp_path / "laptop"
+        for repo in (nas, laptop):
+            (repo / "night1").mkdir(parents=True)
+            config = "[repo]\nkind = 'images'\n"
+            if dedupe:
+                config += "\n[config]\ndedupe = true\n"
+            (repo / "starbash.toml").write_text(config)
+        for i in range(4):
+            hdu = astropy_fits.PrimaryHDU(np.full((16, 16), i, dtype=np.uint16))
+            hdu.header["DATE-OBS"] = f"2023-10-15T20:3{i}:00"
+            hdu.header["IMAGETYP"] = "Light"
+            hdu.header["FILTER"] = "Ha"
+            hdu.header["EXPTIME"] = 60.0
+            f = (nas if i < 3 else laptop) / "night1" / f"light_{i}.fit"
+            astropy_fits.HDUList([hdu]).writeto(f)
+        for i in range(2):
+            shutil.copy2(nas / "night1" / f"light_{i}.fit", laptop / "night1")
+        return nas, laptop
+
+    def test_reindex_repo_dedupe(self, setup_test_environment, mock_analytics):
+        """Test that copies of a frame in several repos are only indexed once."""
+        mock_analytics["exception"].return_value = False  # don't hide failures
+        import starbash.app as app_module
+
+        nas, laptop = self._write_dedupe_repos(
+            setup_test_environment["tmp_path"], dedupe=True
+        )
+        with Starbash() as app:
+            nas_repo = app.repo_manager.add_repo(f"file://{nas}")
+            laptop_repo = app.repo_manager.add_repo(f"file://{laptop}")
+            app.reindex_repo(nas_repo)
+            app.reindex_repo(laptop_repo)
+
+            assert len(app.db.all_images()) == 4
+            [session] = app.db.search_session()
+            assert session["num_images"] == 4
+            assert session["exptime_total"] == 240.0
+            assert app.db.get_aliases(str(nas / "night1" / "light_0.fit")) == [
+                str(laptop / "night1" / "light_0.fit")
+            ]
+
+            # Unchanged duplicates aren't read again
+            read: list[str] = []
+            real_read_headers = app_module.read_headers
+
+            def spy_read_headers(paths, **kwargs):
+                paths = list(paths)
+                read.extend(paths)
+                return real_read_headers(paths, **kwargs)
+
+            with patch.object(app_module, "read_headers", spy_read_headers):
+                app.reindex_repo(laptop_repo)
+            assert read == []
+
+            # Deleting the original makes the copy the image's file
+            (nas / "night1" / "light_0.fit").unlink()
+            app.reindex_repo(nas_repo)
+            assert app.db.get_image(str(laptop / "night1" / "light_0.fit")) is not None
+            assert app.db.search_session()[0]["num_images"] == 4
+
+            # Deleting a copy just forgets it
+            (laptop / "night1" / "light_1.fit").unlink()
+            app.reindex_repo(laptop_repo)
+            assert app.db.get_aliases(str(nas / "night1" / "light_1.fit")) == []
+            assert len(app.db.all_images()) == 4
+            assert app.db.search_session()[0]["num_images"] == 4
+
+    def test_reindex_repo_dedupe_existing(self, setup_test_environment, mock_analytics):
+        """Test that enabling dedupe and force reindexing merges existing copies."""
+        mock_analytics["exception"].return_value = False  # don't hide failures
+
+        nas, laptop = self._write_dedupe_repos(
+            setup_test_environment["tmp_path"], dedupe=False
+        )
+        with Starbash() as app:
+            repos = [app.repo_manager.add_repo(f"file://{r}") for r in (nas, laptop)]
+            for repo in repos:
+                app.reindex_repo(repo)
+            assert len(app.db.all_images()) == 6
+            assert app.db.search_session()[0]["num_images"] == 6
+
+            app.user_repo.set("config.dedupe", True)
+            for repo in repos:
+                app.reindex_repo(repo, force=True)
+
+            paths = sorted(i["path"] for i in app.db.all_images())
+            [session] = app.db.search_session()
+
+        assert paths == [
+            str(laptop / "night1" / "light_3.fit"),
+            *(str(nas / "night1" / f"light_{i}.fit") for i in range(3)),
+        ]
+        assert session["num_images"] == 4
+        assert session["exptime_total"] == 240.0
+
 
 class TestReindexRepos:
     """Tests for the reindex_repos method."""
@@ -835,6 +1537,61 @@ class TestReindexRepos:
                     assert call_args[1]["force"] is True
 
 
+class TestWatchRepos:
+    """Tests for the watch_repos method."""
+
+    @pytest.mark.parametrize("poll", [False, True])
+    def test_watch_indexes_new_files(
+        self, setup_test_environment, mock_analytics, poll
+    ):
+        """New frames are indexed once written, through the same path as reindex."""
+        mock_analytics["exception"].return_value = False
+        from astropy.io import fits as astropy_fits
+
+        test_repo = setup_test_environment["tmp_path"] / "test_repo"
+        test_repo.mkdir()
+        (test_repo / "starbash.toml").write_text("[repo]\nkind = 'images'\n")
+        fits_file = test_repo / "night1" / "light_001.fit"
+
+        with Starbash() as app:
+            app.repo_manager.add_repo(f"file://{test_repo}")
+            stop = threading.Event()
+            indexed = []
+            index_files = app.index_files
+
+            def spy(files, *args, **kwargs):
+                index_files(files, *args, **kwargs)
+                indexed.extend(f for f, _ in files)
+                stop.set()
+
+            def write_frame():
+                fits_file.parent.mkdir()
+                hdu = astropy_fits.PrimaryHDU()
+                hdu.header["DATE-OBS"] = "2023-10-15T20:30:00"
+                hdu.header["IMAGETYP"] = "Light"
+                hdu.header["FILTER"] = "Ha"
+                astropy_fits.HDUList([hdu]).writeto(fits_file)
+
+            timer = threading.Timer(0.2, write_frame)
+            timeout = threading.Timer(10, stop.set)
+            fast_watcher = partial(create_watcher, interval=0.1)
+            with patch("starbash.app.create_watcher", fast_watcher), patch.object(
+                app, "index_files", side_effect=spy
+            ):
+                timer.start()
+                timeout.start()
+                try:
+                    app.watch_repos(settle=0.2, poll=poll, stop=stop)
+                finally:
+                    timeout.cancel()
+
+            image = app.db.get_image(str(fits_file))
+
+        assert indexed == [str(fits_file)]
+        assert image is not None
+        assert image["FILTER"] == "Ha"
+
+
 class TestProcessing:
     """Tests for processing-related methods."""
 
@@ -0,0 +1,114 @@
+"""Tests for calibration candidate scoring."""
+
+import math
+import random
+import time
+
+import numpy as np
+import pytest
+
+from starbash.calibration import (
+    rank_candidates,
+    score_candidate,
+    score_candidates,
+    to_epoch,
+    to_temperature,
+)
+
+
+def _random_inputs(rng: random.Random, n: int) -> tuple[list[float], list[float]]:
+    temps = [round(rng.uniform(-20, 20), rng.choice([0, 1])) for _ in range(n)]
+    epochs = [rng.uniform(1.6e9, 1.7e9) for _ in range(n)]
+    # Some sessions lack CCD-TEMP or a parsable DATE-OBS
+    for i in rng.sample(range(n), n // 10):
+        temps[i] = math.nan
+    for i in rng.sample(range(n), n // 10):
+        epochs[i] = math.nan
+    return temps, epochs
+
+
+def test_conversions():
+    assert to_temperature(-10) == -10.0
+    assert to_temperature("-9.5") == -9.5
+    assert math.isnan(to_temperature(None))
+    assert math.isnan(to_temperature("cold"))
+
+    assert to_epoch("1970-01-02T00:00:00") == 86400.0
+    assert to_epoch("1970-01-02T01:00:00+01:00") == 86400.0
+    assert math.isnan(to_epoch(None))
+    assert math.isnan(to_epoch("yesterday"))
+
+
+def test_score_candidate():
+    day = 86400.0
+    # Perfect match in temperature and time
+    assert score_candidate(-10.0, day, -10.0, day) == 1100.0
+    # 1°C away, a week later
+    assert score_candidate(-10.0, 0.0, -9.0, 7 * day) == pytest.approx(
+        1000 / 2.718 + 100 / 2.718
+    )
+    # Missing values don't contribute
+    assert score_candidate(math.nan, 0.0, -9.0, 0.0) == 100.0
+    assert score_candidate(-10.0, math.nan, -10.0, 0.0) == 1000.0
+
+
+def test_score_candidates_matches_scalar():
+    rng = random.Random(42)
+    ref_temps, ref_epochs = _random_inputs(rng, 50)
+    temps, epochs = _random_inputs(rng, 200)
+
+    scores = score_candidates(
+        np.array(ref_temps), np.array(ref_epochs), np.array(temps), np.array(epochs)
+    )
+    assert scores.shape == (50, 200)
+
+    batch_ranks = rank_candidates(scores)
+    for r in range(50):
+        scalar = [
+            score_candidate(ref_temps[r], ref_epochs[r], temps[c], epochs[c])
+            for c in range(200)
+        ]
+        np.testing.assert_allclose(scores[r], scalar, rtol=1e-15)
+
+        # Same as sorting the scalar scores the way guess_sessions does
+        scalar_rank = sorted(range(200), key=lambda c: scalar[c], reverse=True)
+        assert batch_ranks[r] == scalar_rank
+
+
+def test_rank_candidates_acceptable():
+    scores = np.array([[1.0, 3.0, 2.0, 3.0], [4.0, 3.0, 2.0, 1.0]])
+    acceptable = np.array([[True, True, True, True], [False, True, False, True]])
+    # ties keep candidate order
+    assert rank_candidates(scores, acceptable) == [[1, 3, 2, 0], [1, 3]]
+
+
+@pytest.mark.slow
+def test_benchmark_score_candidates():
+    """Compare the batch scorer to scoring every pair with the scalar scorer."""
+    rng = random.Random(0)
+    ref_temps, ref_epochs = _random_inputs(rng, 200)
+    temps, epochs = _random_inputs(rng, 2000)
+
+    start = time.perf_counter()
+    for r in range(len(ref_temps)):
+        scalar = [
+            score_candidate(ref_temps[r], ref_epochs[r], t, e)
+            for t, e in zip(temps, epochs)
+        ]
+        sorted(range(len(scalar)), key=lambda c: scalar[c], reverse=True)
+    scalar_secs = time.perf_counter() - start
+
+    start = time.perf_counter()
+    rank_candidates(
+        score_candidates(
+            np.array(ref_temps), np.array(ref_epochs), np.array(temps), np.array(epochs)
+        )
+    )
+    batch_secs = time.perf_counter() - start
+
+    pairs = len(ref_temps) * len(temps)
+    print(
+        f"\nscalar: {pairs / scalar_secs:.0f} pairs/s, "
+        f"batch: {pairs / batch_secs:.0f} pairs/s"
+    )
+    assert batch_secs < scalar_secs
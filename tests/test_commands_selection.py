@@ -112,6 +112,38 @@ class TestSelectionTargetCommand:
         show_result = runner.invoke(app, [])
         assert "M42" in show_result.stdout
 
+    def test_target_command_position(self, setup_test_environment, mock_analytics):
+        """Test that 'selection target RA DEC' selects sessions near a position."""
+        result = runner.invoke(
+            app, ["target", "00 42 44", "+41 16 09", "--radius", "0.5"]
+        )
+        assert result.exit_code == 0
+        assert "within 0.5° of 00h42m44s +41°16'09\"" in result.stdout
+
+        show_result = runner.invoke(app, [])
+        assert "Position" in show_result.stdout
+
+        # A plain target name goes back to matching by name
+        runner.invoke(app, ["target", "M31"])
+        show_result = runner.invoke(app, [])
+        assert "Position" not in show_result.stdout
+
+    def test_target_command_bad_position(self, setup_test_environment, mock_analytics):
+        """Test that an unparseable position is an error."""
+        mock_analytics["exception"].return_value = False
+        result = runner.invoke(app, ["target", "10.68", "north"])
+        assert result.exit_code == 1
+        assert "Can't parse position" in result.stdout
+
+    def test_target_command_radius_unknown_target(
+        self, setup_test_environment, mock_analytics
+    ):
+        """Test that a radius around a target with no known position is an error."""
+        mock_analytics["exception"].return_value = False
+        result = runner.invoke(app, ["target", "M31", "--radius", "2"])
+        assert result.exit_code == 1
+        assert "No images of 'M31' have a position" in result.stdout
+
     def test_target_command_missing_argument(
         self, setup_test_environment, mock_analytics
     ):
@@ -120,6 +152,42 @@ class TestSelectionTargetCommand:
         assert result.exit_code != 0
 
 
+class TestSelectionAliasCommand:
+    """Tests for the 'selection alias' command."""
+
+    def test_alias_add_list_remove(self, setup_test_environment, mock_analytics):
+        """Test that aliases can be added, listed and removed."""
+        result = runner.invoke(app, ["alias"])
+        assert result.exit_code == 0
+        assert "No target aliases" in result.stdout
+
+        result = runner.invoke(app, ["alias", "Andromeda", "M 31"])
+        assert result.exit_code == 0
+        assert "'Andromeda' is now another name of M31" in result.stdout
+
+        result = runner.invoke(app, ["alias"])
+        assert "ANDROMEDA" in result.stdout
+        assert "M31" in result.stdout
+
+        result = runner.invoke(app, ["alias", "andromeda", "--remove"])
+        assert result.exit_code == 0
+        assert "no longer an alias" in result.stdout
+
+    def test_alias_errors(self, setup_test_environment, mock_analytics):
+        """Test bad aliases are refused."""
+        mock_analytics["exception"].return_value = False
+        result = runner.invoke(app, ["alias", "M_31", "m31"])
+        assert result.exit_code == 1
+        assert "already named 'M31'" in result.stdout
+
+        result = runner.invoke(app, ["alias", "Andromeda"])
+        assert result.exit_code == 1
+
+        result = runner.invoke(app, ["alias", "Andromeda", "--remove"])
+        assert result.exit_code == 1
+        assert "not an alias" in result.stdout
+
+
 class TestSelectionTelescopeCommand:
     """Tests for the 'selection telescope' command."""
 
@@ -323,6 +391,37 @@ class TestSelectionIntegration:
         assert show_result.exit_code == 0
 
 
+class TestSelectionSaveLoadCommands:
+    """Tests for the 'selection save' and 'selection load' commands."""
+
+    def test_save_and_load(self, setup_test_environment, mock_analytics):
+        """Test that a saved selection can be switched back to."""
+        runner.invoke(app, ["target", "M31"])
+        runner.invoke(app, ["date", "after", "2023-01-01"])
+        result = runner.invoke(app, ["save", "M31 all seasons"])
+        assert result.exit_code == 0
+        assert "Saved selection 'M31 all seasons' (0 sessions)" in result.stdout
+
+        runner.invoke(app, ["any"])
+        runner.invoke(app, ["telescope", "Vespera"])
+
+        result = runner.invoke(app, ["load", "M31 all seasons"])
+        assert result.exit_code == 0
+        assert "Loaded selection 'M31 all seasons'" in result.stdout
+        show_result = runner.invoke(app, [])
+        assert "M31" in show_result.stdout
+        assert "2023-01-01" in show_result.stdout
+        assert "Vespera" not in show_result.stdout
+
+    def test_load_unknown(self, setup_test_environment, mock_analytics):
+        """Test that loading an unknown name fails, listing the saved ones."""
+        runner.invoke(app, ["save", "everything"])
+        result = runner.invoke(app, ["load", "nothing"])
+        assert result.exit_code == 1
+        assert "No saved selection named 'nothing'" in result.stdout
+        assert "everything" in result.stdout
+
+
 class TestSelectionHelp:
     """Tests for help commands."""
 
@@ -1,6 +1,13 @@
+import math
+import random
+import sqlite3
+import time
 from pathlib import Path
 
-from starbash.database import Database
+import pytest
+
+from starbash.database import Database, normalize_target_name, target_key_expr
+from starbash.selection import where_tuple
 
 
 def test_database_images_table(tmp_path: Path):
@@ -20,3 +27,722 @@ def test_database_images_table(tmp_path: Path):
 
         # Ensure the file was written to disk under the provided base dir
         assert (tmp_path / "db.sqlite3").exists()
+
+
+def test_database_signatures(tmp_path: Path):
+    with Database(base_dir=tmp_path) as db:
+        a = db.upsert_image({"path": "/repo/a.fit", "FILTER": "Ha"})
+        db.upsert_image({"path": "/repo/b.fit", "FILTER": "Ha"})
+        db.upsert_image({"path": "/repo2/c.fit", "FILTER": "Ha"})
+        db.upsert_signature(a, (100, 123456789, 42))
+
+        # only paths under the directory are returned, unsigned images map to None
+        assert db.get_signatures("/repo") == {
+            "/repo/a.fit": (100, 123456789, 42),
+            "/repo/b.fit": None,
+        }
+
+        db.upsert_signature(a, (200, 987654321, 42))
+        assert db.get_signatures("/repo/")["/repo/a.fit"] == (200, 987654321, 42)
+
+        # or for specific files, unknown files are left out
+        assert db.get_file_signatures(["/repo/a.fit", "/repo2/c.fit", "/x.fit"]) == {
+            "/repo/a.fit": (200, 987654321, 42),
+            "/repo2/c.fit": None,
+        }
+
+
+def test_database_session_totals_accumulate(tmp_path: Path):
+    with Database(base_dir=tmp_path) as db:
+        for i in range(3):
+            new = {
+                Database.START_KEY: f"2023-10-15T20:3{i}:00",
+                Database.END_KEY: f"2023-10-15T20:3{i}:00",
+                Database.FILTER_KEY: "Ha",
+                Database.IMAGETYP_KEY: "Light",
+                Database.OBJECT_KEY: "M31",
+                Database.TELESCOP_KEY: "Test",
+                Database.NUM_IMAGES_KEY: 1,
+                Database.EXPTIME_TOTAL_KEY: 60.0,
+                Database.IMAGE_DOC_KEY: i + 1,
+            }
+            db.upsert_session(new, existing=db.get_session(new))
+
+        sessions = db.search_session()
+        assert len(sessions) == 1
+        assert sessions[0]["num_images"] == 3
+        assert sessions[0]["exptime_total"] == 180.0
+        assert sessions[0]["end"] == "2023-10-15T20:32:00"
+
+
+def test_database_remove_and_rename_image(tmp_path: Path):
+    with Database(base_dir=tmp_path) as db:
+        image_id = db.upsert_image({"path": "/repo/a.fit", "FILTER": "Ha"})
+        db.upsert_signature(image_id, (1, 2, 3))
+        assert db.find_images_by_signature((1, 2, 3)) == ["/repo/a.fit"]
+
+        db.rename_image("/repo/a.fit", "/repo/b.fit")
+        assert db.find_images_by_signature((1, 2, 3)) == ["/repo/b.fit"]
+
+        removed = db.remove_image("/repo/b.fit")
+        assert removed is not None and removed["id"] == image_id
+        assert db.remove_image("/repo/b.fit") is None
+        # the signature goes with it
+        assert db.find_images_by_signature((1, 2, 3)) == []
+
+
+def test_database_upsert_images_batches(tmp_path: Path):
+    with Database(base_dir=tmp_path) as db:
+        records = [{"path": f"/repo/{i}.fit", "FILTER": "Ha"} for i in range(5)]
+        records.insert(2, {"FILTER": "no path"})  # skipped
+        records.append({"path": "/repo/bad.fit", "BAD": object()})  # skipped
+
+        batches = list(db.upsert_images(records, batch_size=2))
+        assert [len(b) for b in batches] == [2, 2, 1]
+
+        pairs = [pair for batch in batches for pair in batch]
+        assert [r["path"] for r, _ in pairs] == [f"/repo/{i}.fit" for i in range(5)]
+        for record, image_id in pairs:
+            assert db.get_image(record["path"])["id"] == image_id  # type: ignore
+
+        # Updating existing records returns their original ids
+        again = list(db.upsert_images([{"path": "/repo/3.fit", "FILTER": "OIII"}]))
+        assert again[0][0][1] == pairs[3][1]
+        assert db.get_image("/repo/3.fit")["FILTER"] == "OIII"  # type: ignore
+
+
+def test_database_transaction_rollback(tmp_path: Path):
+    with Database(base_dir=tmp_path) as db:
+        with pytest.raises(RuntimeError):
+            with db.transaction():
+                db.upsert_image({"path": "/repo/a.fit"})
+                with db.transaction():  # nested joins the outer transaction
+                    db.upsert_image({"path": "/repo/b.fit"})
+                raise RuntimeError("boom")
+        assert db.all_images() == []
+
+        with db.transaction():
+            db.upsert_image({"path": "/repo/a.fit"})
+        assert len(db.all_images()) == 1
+
+
+@pytest.mark.slow
+def test_benchmark_upsert_images(tmp_path: Path):
+    """Compare per-image commits with batched writes (run with: pytest -m slow -s)."""
+    n = 2000
+
+    def records(prefix: str):
+        return (
+            {
+                "path": f"/{prefix}/light_{i:05}.fit",
+                "DATE-OBS": f"2025-09-17T03:{i // 60 % 60:02}:{i % 60:02}",
+                "FILTER": "Ha",
+                "EXPTIME": 120.0,
+            }
+            for i in range(n)
+        )
+
+    with Database(base_dir=tmp_path) as db:
+        start = time.perf_counter()
+        for record in records("single"):
+            db.upsert_image(record)
+        single_rate = n / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for _ in db.upsert_images(records("bulk")):
+            pass
+        bulk_rate = n / (time.perf_counter() - start)
+
+    print(
+        f"\nupsert_image: {single_rate:.0f} images/s, upsert_images: {bulk_rate:.0f} images/s "
+        f"({bulk_rate / single_rate:.1f}x)"
+    )
+    assert bulk_rate > single_rate
+
+
+def test_database_uses_wal(tmp_path: Path):
+    with Database(base_dir=tmp_path) as db:
+        mode = db._db.execute("PRAGMA journal_mode").fetchone()[0]
+        assert mode == "wal"
+        assert db._db.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+
+
+def test_database_read_only_concurrent_with_writer(tmp_path: Path):
+    with Database(base_dir=tmp_path) as writer:
+        writer.upsert_image({"path": "/repo/a.fit"})
+
+        with writer.transaction():
+            # An uncommitted write holds the write lock...
+            writer.upsert_image({"path": "/repo/b.fit"})
+
+            # ...but readers are not blocked, and only see committed data
+            with Database(base_dir=tmp_path, read_only=True) as reader:
+                assert [i["path"] for i in reader.all_images()] == ["/repo/a.fit"]
+
+                with pytest.raises(sqlite3.OperationalError):
+                    reader.upsert_image({"path": "/repo/c.fit"})
+
+        assert len(writer.all_images()) == 2
+
+
+def test_database_read_only_creates_missing_db(tmp_path: Path):
+    with Database(base_dir=tmp_path, read_only=True) as db:
+        assert not db.read_only  # nothing to read yet, so it had to create the DB
+        assert db.all_images() == []
+
+
+def test_database_search_image_in_sql(tmp_path: Path):
+    with Database(base_dir=tmp_path) as db:
+        for name, filter, exptime, day in [
+            ("a", "Ha", 60.0, 15),
+            ("b", "OIII", 60.0, 16),
+            ("c", None, 120.0, 17),
+        ]:
+            record = {
+                "path": f"/r/{name}.fit",
+                "EXPTIME": exptime,
+                "DATE-OBS": f"2023-10-{day}T20:00:00",
+            }
+            if filter:
+                record["FILTER"] = filter
+            db.upsert_image(record)
+
+        def paths(conditions):
+            return [i["path"] for i in db.search_image(conditions)]
+
+        assert paths({"FILTER": "Ha"}) == ["/r/a.fit"]
+        assert paths({"FILTER": None}) == ["/r/c.fit"]
+        assert paths({"EXPTIME": 60.0}) == ["/r/a.fit", "/r/b.fit"]
+        assert paths({"EXPTIME": 60.0, "date_start": "2023-10-16"}) == ["/r/b.fit"]
+        assert paths({"DATE-OBS": "2023-10-17T20:00:00"}) == ["/r/c.fit"]
+        assert paths({"id": 2}) == ["/r/b.fit"]
+        assert paths({"FILTER": "Ha", "path": "/r/b.fit"}) == []
+
+        # Hot keys are served from an expression index rather than a table scan
+        plan = db._db.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM images WHERE "
+            + db._image_key_expr("FILTER")
+            + " = ?",
+            ("Ha",),
+        ).fetchall()
+        assert "idx_images_filter" in " ".join(row[3] for row in plan)
+
+        with pytest.raises(ValueError):
+            db.search_image({"BAD'KEY": 1})
+
+
+def test_database_migrates_legacy_schema(tmp_path: Path):
+    # A database as created by versions of starbash which predate schema versioning
+    conn = sqlite3.connect(tmp_path / "db.sqlite3")
+    conn.execute(
+        """CREATE TABLE images (id INTEGER PRIMARY KEY AUTOINCREMENT,
+        path TEXT UNIQUE NOT NULL, date_obs TEXT, date TEXT, metadata TEXT NOT NULL)"""
+    )
+    conn.execute(
+        "INSERT INTO images (path, metadata) VALUES (?, ?)",
+        ("/r/a.fit", '{"FILTER": "Ha", "CCD-TEMP": -10, "XBINNING": 2}'),
+    )
+    conn.commit()
+    conn.close()
+
+    # Read-only connections can still query the old schema (via the JSON)
+    with Database(base_dir=tmp_path, read_only=True) as db:
+        assert [i["path"] for i in db.search_image({"FILTER": "Ha"})] == ["/r/a.fit"]
+
+    with Database(base_dir=tmp_path) as db:
+        version = db._db.execute("PRAGMA user_version").fetchone()[0]
+        assert version == len(Database._MIGRATIONS)
+
+        # Promoted columns were added and backfilled from the JSON, with their types
+        row = db._db.execute(
+            "SELECT filter, ccd_temp, typeof(ccd_temp), xbinning FROM images"
+        ).fetchone()
+        assert tuple(row) == ("Ha", -10.0, "real", 2)
+
+        # and new writes keep them up to date
+        db.upsert_image({"path": "/r/a.fit", "FILTER": "OIII", "CCD-TEMP": -5.5})
+        row = db._db.execute("SELECT filter, ccd_temp, xbinning FROM images").fetchone()
+        assert tuple(row) == ("OIII", -5.5, None)
+        assert db.search_image({"CCD-TEMP": -5.5})[0]["FILTER"] == "OIII"
+
+
+def test_database_configurable_promoted_keys(tmp_path: Path):
+    def columns(db: Database) -> set[str]:
+        return {row["name"] for row in db._db.execute("PRAGMA table_info(images)")}
+
+    with Database(base_dir=tmp_path, promoted_keys=["FILTER", "FOCPOS"]) as db:
+        db.upsert_image({"path": "/r/a.fit", "FILTER": "Ha", "FOCPOS": 1234})
+        assert {"filter", "focpos"} <= columns(db)
+        assert "ccd_temp" not in columns(db)
+
+    with Database(base_dir=tmp_path, promoted_keys=["FILTER", "CCD-TEMP"]) as db:
+        assert "focpos" not in columns(db)
+        assert {"filter", "ccd_temp"} <= columns(db)
+        # Unpromoted keys are still searchable via the JSON
+        assert db.search_image({"FOCPOS": 1234})[0]["path"] == "/r/a.fit"
+
+    with pytest.raises(ValueError):
+        Database(base_dir=tmp_path, promoted_keys=["BAD'KEY"])
+
+
+def test_database_calibration_matches(tmp_path: Path):
+    def session(imagetyp: str, start: str) -> dict:
+        return {
+            Database.START_KEY: start,
+            Database.END_KEY: start,
+            Database.FILTER_KEY: "Ha",
+            Database.IMAGETYP_KEY: imagetyp,
+            Database.OBJECT_KEY: "M31",
+            Database.TELESCOP_KEY: "Test",
+            Database.NUM_IMAGES_KEY: 1,
+            Database.EXPTIME_TOTAL_KEY: 60.0,
+        }
+
+    with Database(base_dir=tmp_path) as db:
+        light = db.upsert_session(session("LIGHT", "2023-10-15T20:00:00"))
+        dark1 = db.upsert_session(session("DARK", "2023-10-16T20:00:00"))
+        dark2 = db.upsert_session(session("DARK", "2023-10-17T20:00:00"))
+
+        db.set_calibration_matches(light, "DARK", [dark2, dark1])
+        assert [s["id"] for s in db.get_calibration_matches(light, "DARK")] == [
+            dark2,
+            dark1,
+        ]
+
+        # Replacing, and deleting either side of a match
+        db.set_calibration_matches(light, "DARK", [dark1, dark2])
+        db.delete_session(dark1)
+        assert [s["id"] for s in db.get_calibration_matches(light, "DARK")] == [dark2]
+        db.delete_session(light)
+        assert db.len_table(Database.CALIBRATION_MATCHES_TABLE) == 0
+
+
+def test_database_reindex_checkpoint(tmp_path: Path):
+    with Database(base_dir=tmp_path) as db:
+        assert db.get_reindex_checkpoint("file:///repo") is None
+        db.set_reindex_checkpoint("file:///repo", "/repo/a/1.fit", 10)
+        db.set_reindex_checkpoint("file:///repo", "/repo/b/2.fit", 20)
+
+        # Checkpoints written in a transaction which fails are rolled back with it
+        with pytest.raises(KeyboardInterrupt):
+            with db.transaction():
+                db.set_reindex_checkpoint("file:///repo", "/repo/c/3.fit", 30)
+                raise KeyboardInterrupt()
+
+    with Database(base_dir=tmp_path) as db:
+        assert db.get_reindex_checkpoint("file:///repo") == ("/repo/b/2.fit", 20)
+        db.clear_reindex_checkpoint("file:///repo")
+        assert db.get_reindex_checkpoint("file:///repo") is None
+
+        # Completed reindexes are remembered (until a new run clears them all)
+        assert not db.is_reindex_complete("file:///repo")
+        db.set_reindex_complete("file:///repo", 20)
+        db.set_reindex_checkpoint("file:///other", "/other/1.fit", 5)
+        assert db.is_reindex_complete("file:///repo")
+        assert db.get_reindex_checkpoint("file:///repo") is None
+        db.clear_reindex_checkpoint()
+        assert not db.is_reindex_complete("file:///repo")
+        assert db.get_reindex_checkpoint("file:///other") is None
+
+
+def test_database_aliases(tmp_path: Path):
+    with Database(base_dir=tmp_path) as db:
+        a = db.upsert_image({"path": "/nas/a.fit"})
+        b = db.upsert_image({"path": "/nas/b.fit"})
+        db.set_content_hash(a, "hash-a")
+        db.set_content_hash(b, "hash-b")
+        assert db.find_image_by_hash("hash-a") == (a, "/nas/a.fit")
+        assert db.find_image_by_hash("hash-c") is None
+
+        # A hash moves to the image it was last seen on
+        db.set_content_hash(b, "hash-a")
+        assert db.find_image_by_hash("hash-a") == (b, "/nas/b.fit")
+        db.set_content_hash(a, "hash-a")
+
+        db.add_alias("/laptop/a.fit", a, (100, 1, 2))
+        db.add_alias("/export/a.fit", a, (100, 3, 4))
+        assert db.get_aliases("/nas/a.fit") == ["/export/a.fit", "/laptop/a.fit"]
+        assert db.get_signatures("/laptop", aliases=True) == {
+            "/laptop/a.fit": (100, 1, 2)
+        }
+        assert db.get_file_signatures(["/export/a.fit"], aliases=True) == {
+            "/export/a.fit": (100, 3, 4)
+        }
+        assert db.get_signatures("/laptop") == {}
+
+        # The alias takes over the image (and its signature)
+        db.promote_alias("/laptop/a.fit")
+        assert db.get_image("/nas/a.fit") is None
+        assert db.get_image("/laptop/a.fit")["id"] == a  # type: ignore
+        assert db.get_signatures("/laptop") == {"/laptop/a.fit": (100, 1, 2)}
+        assert db.get_aliases("/laptop/a.fit") == ["/export/a.fit"]
+        with pytest.raises(ValueError):
+            db.promote_alias("/laptop/a.fit")
+
+        assert db.remove_alias("/export/a.fit")
+        assert not db.remove_alias("/export/a.fit")
+
+        # Aliases (and hashes) go with their image
+        db.set_content_hash(b, "hash-b")
+        db.add_alias("/laptop/b.fit", b, (100, 5, 6))
+        db.remove_image("/nas/b.fit")
+        assert db.len_table(Database.ALIASES_TABLE) == 0
+        assert db.find_image_by_hash("hash-b") is None
+
+
+def _frame(db: Database, name: str, date: str, exptime=60.0, **header) -> int:
+    record = {
+        "path": f"/repo/{name}.fit",
+        "DATE-OBS": date,
+        "IMAGETYP": "Light",
+        "FILTER": "Ha",
+        "OBJECT": "M31",
+        "EXPTIME": exptime,
+        **header,
+    }
+    return db.upsert_image(record)
+
+
+def test_database_update_sessions(tmp_path: Path):
+    with Database(base_dir=tmp_path) as db:
+        a = _frame(db, "a", "2023-10-15T20:00:00")
+        _frame(db, "b", "2023-10-15T21:00:00")
+        _frame(db, "c", "2023-10-15T21:00:00", exptime=300.0)
+        _frame(db, "d", "2023-10-16T06:00:00")  # more than 8h after b
+        _frame(db, "no_type", "2023-10-15T20:00:00", IMAGETYP=None)
+        assert len(db.update_sessions()) == 3
+
+        sessions = db.search_session(("ORDER BY start, exptime", []))
+        assert [
+            (s["start"], s["end"], s["exptime"], s["num_images"], s["telescop"])
+            for s in sessions
+        ] == [
+            # A session ends when its last exposure does
+            ("2023-10-15T20:00:00", "2023-10-15T21:01:00", 60.0, 2, "unspecified"),
+            ("2023-10-15T21:00:00", "2023-10-15T21:05:00", 300.0, 1, "unspecified"),
+            ("2023-10-16T06:00:00", "2023-10-16T06:01:00", 60.0, 1, "unspecified"),
+        ]
+        first, _, last = (s["id"] for s in sessions)
+
+        # A frame bridging the gap merges the sessions (into the older one)
+        _frame(db, "e", "2023-10-16T01:00:00")
+        bridge = db.get_image("/repo/e.fit")
+        assert db.update_sessions([bridge]) == set()  # type: ignore
+        merged = db.get_session_by_id(first)
+        assert merged["num_images"] == 4  # type: ignore
+        assert merged["end"] == "2023-10-16T06:01:00"  # type: ignore
+        assert merged["image_doc_id"] == a  # type: ignore
+        assert db.get_session_by_id(last) is None
+
+        # and removing it splits them again, removing the first frame moves the
+        # reference image
+        removed = [db.remove_image("/repo/e.fit"), db.remove_image("/repo/a.fit")]
+        changed = db.update_sessions(removed)  # type: ignore
+        assert first in changed and len(changed) == 2
+        start = db.get_session_by_id(first)["start"]  # type: ignore
+        assert start == "2023-10-15T21:00:00"
+        assert len(db.search_session()) == 3
+
+        # Sessions without any frames left are deleted
+        removed = [db.remove_image(f"/repo/{name}.fit") for name in "bcd"]
+        db.update_sessions(removed)  # type: ignore
+        assert db.search_session() == []
+
+
+def test_database_migrates_sessions(tmp_path: Path):
+    # Sessions as stored before exposure length was part of a session
+    with Database(base_dir=tmp_path) as db:
+        a = _frame(db, "a", "2023-10-15T20:00:00")
+        _frame(db, "b", "2023-10-15T21:00:00", exptime=300.0)
+        db.upsert_session(
+            {
+                "start": "2023-10-15T20:00:00",
+                "end": "2023-10-15T21:00:00",
+                "FILTER": "Ha",
+                "IMAGETYP": "Light",
+                "OBJECT": "M31",
+                "num-images": 2,
+                "exptime-total": 360.0,
+                "image-doc-id": a,
+            }
+        )
+        # (undoing the later migrations)
+        triggers = db._db.execute("SELECT name FROM sqlite_master WHERE type='trigger'")
+        for (name,) in triggers.fetchall():
+            db._db.execute(f"DROP TRIGGER {name}")
+        for table in (
+            "row_counts",
+            "session_stats",
+            "saved_selection_sessions",
+            "saved_selections",
+            "session_changes",
+            "image_positions",
+            "target_aliases",
+        ):
+            db._db.execute(f"DROP TABLE {table}")
+        db._db.execute("DROP INDEX idx_sessions_lookup")
+        db._db.execute("DROP INDEX idx_sessions_object")
+        db._db.execute("ALTER TABLE sessions DROP COLUMN exptime")
+        db._db.execute("PRAGMA user_version = 5")
+        db._db.commit()
+
+    with Database(base_dir=tmp_path) as db:
+        sessions = db.search_session(("ORDER BY exptime", []))
+        assert [(s["id"], s["exptime"], s["num_images"]) for s in sessions] == [
+            (1, 60.0, 1),  # keeps its id (and reference image)
+            (2, 300.0, 1),
+        ]
+        assert db.get_session_totals()["num_images"] == 2
+
+
+def test_database_session_stats(tmp_path: Path):
+    with Database(base_dir=tmp_path) as db:
+        _frame(db, "a", "2023-10-15T20:00:00")
+        _frame(db, "b", "2023-10-15T20:10:00", OBJECT="M42")
+        _frame(db, "c", "2023-10-16T20:00:00", exptime=300.0, TELESCOP="Seestar")
+        db.update_sessions()
+
+        assert db.len_table(Database.IMAGES_TABLE) == 3
+        assert db.len_table(Database.SESSIONS_TABLE) == 3
+        assert db.get_session_stats("object") == {
+            "M31": {"num_sessions": 2, "num_images": 2, "exptime_total": 360.0},
+            "M42": {"num_sessions": 1, "num_images": 1, "exptime_total": 60.0},
+        }
+        assert db.get_session_totals() == {
+            "num_sessions": 3,
+            "num_images": 3,
+            "exptime_total": 420.0,
+        }
+
+        # The rollups follow sessions being extended, changed and removed
+        _frame(db, "d", "2023-10-15T20:20:00", OBJECT="M42")
+        db.update_sessions()
+        db._db.execute("UPDATE sessions SET object = 'M 42' WHERE object = 'M42'")
+        db.update_sessions([db.remove_image("/repo/c.fit")])  # type: ignore
+        stats = db.get_session_stats("telescop")
+        assert stats == {
+            "unspecified": {"num_sessions": 2, "num_images": 3, "exptime_total": 180.0}
+        }
+        assert set(db.get_session_stats("object")) == {"M31", "M 42"}
+        assert db.len_table(Database.IMAGES_TABLE) == 3
+        assert db.len_table(Database.SESSIONS_TABLE) == 2
+
+        # and match grouping the sessions directly
+        where = ("WHERE start >= ?", ["2023-10-15T20:05:00"])
+        assert db.get_session_stats("filter", where) == {
+            "Ha": {"num_sessions": 1, "num_images": 2, "exptime_total": 120.0}
+        }
+        with pytest.raises(ValueError):
+            db.get_session_stats("imagetyp")
+
+
+def test_database_cone_search(tmp_path: Path):
+    with Database(base_dir=tmp_path) as db:
+        # The same field, named (and pointed) a little differently
+        a = _frame(
+            db, "a", "2023-10-15T20:00:00", OBJCTRA="00 42 44", OBJCTDEC="+41 16 09"
+        )
+        b = _frame(
+            db, "b", "2023-10-16T20:00:00", OBJECT="Andromeda", RA=10.9, DEC=41.5
+        )
+        c = _frame(db, "c", "2023-10-17T20:00:00", OBJECT="M42", RA=83.8, DEC=-5.4)
+        _frame(db, "d", "2023-10-18T20:00:00", OBJECT="Unknown")
+        # and across RA = 0
+        [[(_, e), (_, f)]] = db.upsert_images(
+            [
+                {"path": "/repo/e.fit", "RA": 359.9, "DEC": 0.0},
+                {"path": "/repo/f.fit", "RA": 0.1, "DEC": 0.0},
+            ]
+        )
+        db.update_sessions()
+
+        assert sorted(db.search_images_near(10.68, 41.27, 1.0)) == [a, b]
+        assert db.search_images_near(10.68, 41.27, 0.1) == [a]
+        assert db.search_images_near(83.8, -5.4, 0.01) == [c]
+        assert sorted(db.search_images_near(0.0, 0.0, 0.2)) == [e, f]
+        assert db.search_images_near(180.0, 0.0, 10.0) == []
+
+        ra, dec = db.get_target_position("M31")  # type: ignore
+        assert ra == pytest.approx(10.683, abs=0.01)
+        assert dec == pytest.approx(41.269, abs=0.01)
+        assert db.get_target_position("Unknown") is None
+
+        sql, params = Database.cone_condition(ra, dec, 1.0, column="image_doc_id")
+        sessions = db.search_session((f"WHERE {sql} ORDER BY start", params))
+        assert [s["object"] for s in sessions] == ["M31", "ANDROMEDA"]
+
+        # Positions follow images being changed and removed
+        _frame(db, "b", "2023-10-16T20:00:00", OBJECT="Andromeda")
+        assert db.search_images_near(10.68, 41.27, 1.0) == [a]
+        db.remove_image("/repo/a.fit")
+        assert db.search_images_near(10.68, 41.27, 1.0) == []
+
+        # Images indexed before positions were (found again by the migration)
+        db._db.execute("DROP TRIGGER image_positions_delete")
+        db._db.execute("DROP TABLE image_positions")
+        db._db.execute("DROP TABLE target_aliases")  # (and the later migrations)
+        db._db.execute("DROP INDEX idx_sessions_object")
+        db._db.execute("PRAGMA user_version = 8")
+        db._db.commit()
+
+    with Database(base_dir=tmp_path) as db:
+        assert db.search_images_near(83.8, -5.4, 0.01) == [c]
+        assert len(db.search_images_near(0.0, 0.0, 0.2)) == 2
+
+
+@pytest.mark.slow
+def test_benchmark_cone_search(tmp_path: Path):
+    """Time cone searches among many frames (run with: pytest -m slow -s)."""
+    n = 200_000
+    rng = random.Random(42)
+    records = (
+        {
+            "path": f"/sky/light_{i:07}.fit",
+            "RA": rng.uniform(0, 360),
+            "DEC": math.degrees(math.asin(rng.uniform(-1, 1))),
+        }
+        for i in range(n)
+    )
+
+    with Database(base_dir=tmp_path) as db:
+        for _ in db.upsert_images(records):
+            pass
+
+        searches = 1000
+        found = 0
+        start = time.perf_counter()
+        for _ in range(searches):
+            found += len(db.search_images_near(rng.uniform(0, 360), 0.0, 1.0))
+        elapsed = (time.perf_counter() - start) / searches
+
+    print(
+        f"\ncone search (1°) among {n} frames: {elapsed * 1e6:.0f} µs "
+        f"({found / searches:.1f} frames found on average)"
+    )
+    assert elapsed < 0.001
+
+
+def test_normalize_target_name(tmp_path: Path):
+    assert normalize_target_name("M 27") == "M27"
+    assert normalize_target_name("m_27") == "M27"
+    assert normalize_target_name("Sh2-129") == "SH2-129"
+    with Database(base_dir=tmp_path) as db:
+        # The SQL version gives exactly the same names (even for non ASCII ones)
+        for name in ["M 27", "ngc_7000", "Cœur de Lion", ""]:
+            sql = db._db.execute(f"SELECT {target_key_expr('?')}", (name,))
+            assert sql.fetchone()[0] == normalize_target_name(name)
+
+
+def test_database_target_aliases(tmp_path: Path):
+    with Database(base_dir=tmp_path) as db:
+        # Differently written names are the same target
+        _frame(db, "a", "2023-10-15T20:00:00", OBJECT="M 27")
+        _frame(db, "b", "2023-10-15T21:00:00", OBJECT="m27")
+        _frame(db, "c", "2023-10-15T22:00:00", OBJECT="Dumbbell")
+        db.update_sessions()
+        sessions = db.search_session(("ORDER BY object", []))
+        assert [(s["object"], s["num_images"]) for s in sessions] == [
+            ("DUMBBELL", 1),
+            ("M27", 2),
+        ]
+        ids = {s["id"] for s in sessions}
+
+        # An alias merges the sessions (one of which is kept)
+        db.add_target_alias("Dumbbell", "M 27")
+        sessions = db.search_session()
+        assert [(s["object"], s["num_images"]) for s in sessions] == [("M27", 3)]
+        merged = sessions[0]["id"]
+        assert merged in ids
+        assert db.get_session_stats("object") == {
+            "M27": {"num_sessions": 1, "num_images": 3, "exptime_total": 180.0}
+        }
+        assert len(db.search_image({"target": "M27"})) == 3
+        session = db.get_session(
+            {
+                "start": "2023-10-15T20:00:00",
+                "IMAGETYP": "Light",
+                "FILTER": "Ha",
+                "OBJECT": "dumbbell",
+                "TELESCOP": "unspecified",
+                "EXPTIME": 60.0,  # type: ignore
+            }
+        )
+        assert session is not None and session["id"] == merged
+
+        # New frames with the alias join the target's sessions
+        _frame(db, "d", "2023-10-15T23:00:00", OBJECT="DUMBBELL")
+        db.update_sessions([db.get_image("/repo/d.fit")])  # type: ignore
+        assert [s["num_images"] for s in db.search_session()] == [4]
+
+        # Aliases of aliases are aliases of the target
+        db.add_target_alias("Dumbbell Nebula", "dumbbell")
+        assert db.get_target_aliases() == {"DUMBBELL": "M27", "DUMBBELLNEBULA": "M27"}
+        with pytest.raises(ValueError):
+            db.add_target_alias("m_27", "M27")
+
+        # and removing an alias splits the sessions again
+        db.remove_target_alias("Dumbbell")
+        sessions = db.search_session(("ORDER BY object", []))
+        assert [(s["object"], s["num_images"]) for s in sessions] == [
+            ("DUMBBELL", 2),
+            ("M27", 2),
+        ]
+        assert db.remove_target_alias("M27") == set()
+
+
+def test_database_saved_selection(tmp_path: Path):
+    with Database(base_dir=tmp_path) as db:
+        _frame(db, "a", "2023-10-15T20:00:00")
+        _frame(db, "b", "2023-10-16T20:00:00", OBJECT="M42")
+        db.update_sessions()
+        m31 = ("WHERE object = ?", ["M31"])
+        assert [s["object"] for s in db.search_saved_selection("m31", m31)] == ["M31"]
+        assert db.search_saved_selection("m31", m31) == db.search_session(m31)
+
+        # Ingest only checks the changed sessions against the cached selections
+        _frame(db, "c", "2023-10-17T20:00:00")
+        _frame(db, "d", "2023-10-16T20:10:00")  # now also M31
+        db.update_sessions(
+            [db.get_image("/repo/c.fit"), db.get_image("/repo/d.fit")]  # type: ignore
+        )
+        db.update_sessions([db.remove_image("/repo/a.fit")])  # type: ignore
+        db._db.execute("UPDATE sessions SET object = 'M31' WHERE object = 'M42'")
+        assert db.len_table(Database.SESSION_CHANGES_TABLE) > 0
+
+        sessions = db.search_saved_selection("m31", m31)
+        assert sessions == db.search_session(m31)
+        assert len(sessions) == 3
+        # (and the log is emptied once every saved selection has caught up)
+        assert db.len_table(Database.SESSION_CHANGES_TABLE) == 0
+
+        # Changed conditions rebuild the cache
+        m42 = ("WHERE object = ?", ["M42"])
+        assert db.search_saved_selection("m31", m42) == []
+
+    # Read-only connections fall back to searching while the cache is out of date
+    with Database(base_dir=tmp_path) as db:
+        _frame(db, "e", "2023-10-20T20:00:00", OBJECT="M42")
+        db.update_sessions()
+    with Database(base_dir=tmp_path, read_only=True) as db:
+        sessions = db.search_saved_selection("m31", m42)
+        assert [s["start"][:10] for s in sessions] == ["2023-10-16", "2023-10-20"]
+
+
+def test_database_saved_selection_follows_aliases(tmp_path: Path):
+    with Database(base_dir=tmp_path) as db:
+        _frame(db, "a", "2023-10-15T20:00:00")
+        _frame(db, "b", "2023-10-16T20:00:00", OBJECT="Andromeda")
+        db.update_sessions()
+        andromeda = where_tuple({Database.OBJECT_KEY: ["Andromeda"]})
+        assert len(db.search_saved_selection("mine", andromeda)) == 1
+
+        # Andromeda now also matches the M31 session
+        db.add_target_alias("Andromeda", "M31")
+        sessions = db.search_saved_selection("mine", andromeda)
+        assert sessions == db.search_session(andromeda)
+        assert len(sessions) == 2
+
+        db.remove_target_alias("Andromeda")
+        sessions = db.search_saved_selection("mine", andromeda)
+        assert sessions == db.search_session(andromeda)
+        assert [s["object"] for s in sessions] == ["ANDROMEDA"]
@@ -0,0 +1,202 @@
+"""Tests for the FITS header reading helpers."""
+
+import gzip
+import shutil
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from starbash.fitsheader import (
+    HASH_SAMPLE_SIZE,
+    MalformedHeader,
+    content_hash,
+    read_header,
+    read_header_astropy,
+    read_headers,
+    scan_header,
+)
+
+SAMPLE_HEADERS = Path(__file__).parent.parent / "doc" / "fits"
+
+
+def write_fits(path: Path, **cards) -> Path:
+    hdu = fits.PrimaryHDU()
+    for k, v in cards.items():
+        hdu.header[k.replace("_", "-")] = v
+    fits.HDUList([hdu]).writeto(path)
+    return path
+
+
+def sample_header(name: str) -> fits.Header:
+    """Load one of the header dumps from doc/fits (skipping the leading # comment line)."""
+    lines = (SAMPLE_HEADERS / name).read_text().splitlines()
+    cards = [line for line in lines if not line.startswith("#") and line.strip()]
+    return fits.Header.fromstring("\n".join(cards), sep="\n")
+
+
+def test_read_header_returns_plain_dict(tmp_path: Path):
+    f = write_fits(
+        tmp_path / "a.fit", FILTER="Ha", EXPTIME=120.0, DATE_OBS="2023-10-15"
+    )
+    header = read_header(str(f))
+    assert type(header) is dict
+    assert header["FILTER"] == "Ha"
+    assert header["EXPTIME"] == 120.0
+    assert header["DATE-OBS"] == "2023-10-15"
+
+
+def test_read_headers_reports_errors_in_order(tmp_path: Path):
+    good = write_fits(tmp_path / "good.fit", FILTER="OIII")
+    bad = tmp_path / "bad.fit"
+    bad.write_text("This is not a FITS file")
+
+    results = list(read_headers([str(bad), str(good)]))
+    assert [r[0] for r in results] == [str(bad), str(good)]
+    assert results[0][1] is None and results[0][2]
+    assert results[1][1]["FILTER"] == "OIII" and results[1][2] is None  # type: ignore
+
+
+def test_read_headers_pool_matches_serial(tmp_path: Path):
+    files = [
+        str(write_fits(tmp_path / f"f{i}.fit", FILTER=f"F{i}", EXPTIME=float(i)))
+        for i in range(10)
+    ]
+    assert list(read_headers(files, jobs=3)) == list(read_headers(files, jobs=1))
+
+
+@pytest.mark.parametrize(
+    "name",
+    [p.name for p in sorted(SAMPLE_HEADERS.glob("*.txt"))],
+)
+def test_scan_header_matches_astropy_on_samples(tmp_path: Path, name: str):
+    f = tmp_path / "sample.fit"
+    fits.PrimaryHDU(header=sample_header(name)).writeto(f)
+    assert scan_header(str(f)) == read_header_astropy(str(f))
+
+
+def test_scan_header_unusual_cards(tmp_path: Path):
+    h = fits.Header()
+    h["QUOTED"] = "it's  "
+    h["LONG"] = "x" * 150
+    h["HIERARCH ESO DET X"] = 5
+    h["UNDEF"] = None
+    h["BIG"] = 1.5e10
+    h["NEG"] = -3.25
+    h["FLAG"] = False
+    h.add_comment("hello world")
+    h.add_history("some history")
+    f = tmp_path / "unusual.fit"
+    fits.PrimaryHDU(header=h).writeto(f)
+
+    scanned = scan_header(str(f))
+    assert scanned == read_header_astropy(str(f))
+    assert scanned["QUOTED"] == "it's"
+    assert scanned["LONG"] == "x" * 150
+    assert scanned["ESO DET X"] == 5
+
+
+def test_scan_header_keep_filter(tmp_path: Path):
+    f = write_fits(tmp_path / "a.fit", FILTER="Ha", EXPTIME=120.0, OBJECT="M31")
+    assert scan_header(str(f), keep={"FILTER", "OBJECT"}) == {
+        "FILTER": "Ha",
+        "OBJECT": "M31",
+    }
+
+
+def test_read_header_falls_back_to_astropy(tmp_path: Path):
+    # complex values are not handled by the scanner
+    f = write_fits(tmp_path / "complex.fit", CPLX=complex(1, 2), FILTER="Ha")
+    with pytest.raises(MalformedHeader):
+        scan_header(str(f))
+    assert read_header(str(f))["CPLX"] == complex(1, 2)
+
+    # nor are compressed files
+    gz = tmp_path / "a.fits.gz"
+    gz.write_bytes(
+        gzip.compress((write_fits(tmp_path / "b.fit", FILTER="Ha")).read_bytes())
+    )
+    assert read_header(str(gz))["FILTER"] == "Ha"
+
+
+@pytest.mark.slow
+def test_benchmark_scan_vs_astropy(tmp_path: Path):
+    """Compare header reading speed on a synthetic corpus (run with: pytest -m slow -s)."""
+    header = sample_header("nina-typ-light.txt")
+    corpus = []
+    for i in range(500):
+        header["DATE-OBS"] = f"2025-09-17T03:{i // 60:02}:{i % 60:02}"
+        f = tmp_path / f"light_{i:04}.fits"
+        fits.PrimaryHDU(header=header).writeto(f)
+        corpus.append(str(f))
+
+    whitelist = {"FILTER", "IMAGETYP", "DATE-OBS", "EXPTIME", "OBJECT", "TELESCOP"}
+
+    def run(reader) -> float:
+        start = time.perf_counter()
+        for f in corpus:
+            reader(f, whitelist)
+        return len(corpus) / (time.perf_counter() - start)
+
+    astropy_rate = run(read_header_astropy)
+    scan_rate = run(scan_header)
+    print(
+        f"\nastropy: {astropy_rate:.0f} files/s, scanner: {scan_rate:.0f} files/s "
+        f"({scan_rate / astropy_rate:.1f}x)"
+    )
+    assert scan_rate > astropy_rate
+
+
+def test_read_headers_pool_streams_input(tmp_path: Path):
+    """The worker pool only reads ahead a bounded window of a (lazy) path iterator."""
+    consumed = 0
+
+    def paths():
+        nonlocal consumed
+        for i in range(2000):
+            consumed += 1
+            yield str(tmp_path / f"missing_{i}.fit")
+
+    results = read_headers(paths(), jobs=2)
+    first = next(results)
+    assert first[0] == str(tmp_path / "missing_0.fit")
+    assert consumed < 1000
+    assert len(list(results)) == 1999
+
+
+def test_content_hash(tmp_path: Path):
+    data = np.arange(512 * 1024, dtype=np.uint16)  # 1MB, more than the samples
+    fits.PrimaryHDU(data).writeto(tmp_path / "a.fit")
+    shutil.copy(tmp_path / "a.fit", tmp_path / "copy.fit")
+    assert content_hash(str(tmp_path / "a.fit")) == content_hash(
+        str(tmp_path / "copy.fit")
+    )
+
+    # Different headers, or data in a sampled slice, change the hash
+    hdu = fits.PrimaryHDU(data)
+    hdu.header["DATE-OBS"] = "2023-10-15T20:30:00"
+    hdu.writeto(tmp_path / "b.fit")
+    data[-1] += 1  # the last slice is always sampled
+    fits.PrimaryHDU(data).writeto(tmp_path / "c.fit")
+    hashes = {content_hash(str(tmp_path / f"{n}.fit")) for n in "abc"}
+    assert len(hashes) == 3
+
+    # Small files are hashed entirely
+    fits.PrimaryHDU(np.zeros(HASH_SAMPLE_SIZE // 4, dtype=np.uint8)).writeto(
+        tmp_path / "small.fit"
+    )
+    before = content_hash(str(tmp_path / "small.fit"))
+    with open(tmp_path / "small.fit", "r+b") as f:
+        f.seek(2880 + 100)
+        f.write(b"\x01")
+    assert content_hash(str(tmp_path / "small.fit")) != before
+
+
+def test_read_headers_hash_content(tmp_path: Path):
+    f = str(write_fits(tmp_path / "a.fit", FILTER="Ha"))
+    [(_, header, _, no_hash)] = read_headers([f])
+    assert no_hash is None
+    [(_, header, _, digest)] = read_headers([f], hash_content=True)
+    assert header["FILTER"] == "Ha" and digest == content_hash(f)
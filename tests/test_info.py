@@ -216,6 +216,21 @@ def test_info_filter_command_with_data(populated_database):
     assert "Filter" in output or "filter" in output
 
 
+def test_info_target_command_with_selection(populated_database):
+    """Test 'starbash info target' counts and totals only the selected sessions."""
+    result = runner.invoke(app, ["info", "target"])
+    assert result.exit_code == 0
+    assert "(3 / 3 selected)" in result.stdout
+    assert "1h 5m" in result.stdout  # M31: 20 + 45 minutes
+
+    result = runner.invoke(app, ["select", "telescope", "Seestar S50"])
+    assert result.exit_code == 0
+    result = runner.invoke(app, ["info", "target"])
+    assert result.exit_code == 0
+    assert "(2 / 3 selected)" in result.stdout
+    assert "M31" not in result.stdout
+
+
 def test_info_help(setup_test_environment):
     """Test 'starbash info --help' works."""
     result = runner.invoke(app, ["info", "--help"])
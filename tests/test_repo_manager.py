@@ -1,7 +1,7 @@
 from pathlib import Path
 import pytest
 import tomlkit
-from repo import RepoManager
+from repo import ConfigCache, RepoManager
 
 
 def test_repo_manager_initialization(monkeypatch, tmp_path: Path):
@@ -103,3 +103,126 @@ def test_repo_manager_get_with_real_repos(tmp_path: Path):
     assert repo_manager.get("user.name") == "default-user"
     assert repo_manager.get("user.email") == "user@example.com"
     assert repo_manager.get("non.existent.key", "default") == "default"
+
+
+def test_repo_manager_merged_is_cached(tmp_path: Path):
+    """
+    Tests that the merged config is built once, and rebuilt after repos are added or
+    changed.
+    """
+    paths = []
+    for name, config in [
+        ("recipes", '[[stages]]\nname = "stack"\n\n[config]\ndedupe = false\n'),
+        ("prefs", '[[stages]]\nname = "light"\n\n[config]\nfits-whitelist = ["A"]\n'),
+    ]:
+        path = tmp_path / name
+        path.mkdir()
+        (path / "starbash.toml").write_text(config)
+        paths.append(path)
+
+    repo_manager = RepoManager()
+    recipes = repo_manager.add_repo(f"file://{paths[0]}")
+    assert repo_manager.get("config.dedupe") is False
+    merged = repo_manager.merged
+    assert repo_manager.merged is merged
+
+    prefs = repo_manager.add_repo(f"file://{paths[1]}")
+    assert repo_manager.merged is not merged
+    assert repo_manager.get("config.fits-whitelist") == ["A"]
+    stages = repo_manager.get_all("stages")
+    assert [s[0]["name"] for s in stages] == ["stack", "light"]
+    assert stages[1][0].source is prefs  # type: ignore
+
+    prefs.set("config.dedupe", True)
+    assert repo_manager.get("config.dedupe") is True
+    recipes.set("config.fits-whitelist", ["B"])
+    assert repo_manager.get("config.fits-whitelist") == ["A"]  # later repos win
+    assert repo_manager.get("config.missing", "default") == "default"
+
+
+def test_repo_manager_config_cache(tmp_path: Path, monkeypatch):
+    """
+    Tests that unchanged repo configs are loaded from the cache without being parsed,
+    and parsed again once the file changes.
+    """
+    path = tmp_path / "prefs"
+    path.mkdir()
+    (path / "starbash.toml").write_text(
+        '[user]\nname = "astro"\n\n[[stages]]\nname = "light"\n'
+    )
+    cache_path = tmp_path / "cache" / "configs.pickle"
+
+    first = RepoManager(cache_path=cache_path)
+    first.add_repo(f"file://{path}")
+    assert cache_path.exists()
+
+    # A fresh manager (like the next run of sb) needn't parse the config
+    parsed = []
+    real_parse = tomlkit.parse
+    monkeypatch.setattr(tomlkit, "parse", lambda s: parsed.append(s) or real_parse(s))
+    second = RepoManager(cache_path=cache_path)
+    prefs = second.add_repo(f"file://{path}")
+    assert not parsed
+    assert second.get("user.name") == "astro"
+    stages = second.get_all("stages")
+    assert stages[0][0]["name"] == "light"
+    assert stages[0][0].source is prefs  # type: ignore
+
+    # Changing the config parses the document, and writing it updates the cache
+    prefs.set("user.name", "other")
+    prefs.write_config()
+    assert len(parsed) == 1
+    assert second.get("user.name") == "other"
+    third = RepoManager(cache_path=cache_path)
+    assert third.add_repo(f"file://{path}").get("user.name") == "other"
+    assert len(parsed) == 1
+
+    # As does editing the file behind starbash's back
+    (path / "starbash.toml").write_text('[user]\nname = "edited by hand"\n')
+    fourth = RepoManager(cache_path=cache_path)
+    assert fourth.add_repo(f"file://{path}").get("user.name") == "edited by hand"
+    assert len(parsed) == 2
+
+
+def test_config_cache_ignores_bad_files(tmp_path: Path):
+    """A corrupt cache file is ignored (and replaced)."""
+    cache_path = tmp_path / "configs.pickle"
+    cache_path.write_bytes(b"not a pickle")
+    cache = ConfigCache(cache_path)
+    assert cache.get("file:///x", (1, 2)) is None
+    cache.put("file:///x", (1, 2), {"a": {"b": 1}})
+    assert ConfigCache(cache_path).get("file:///x", (1, 2)) == {"a": {"b": 1}}
+    assert ConfigCache(cache_path).get("file:///x", (1, 3)) is None
+
+
+def test_repo_unset_and_remove_repo_ref(tmp_path: Path):
+    """Removing config values is seen by the manager's merged config at once."""
+    ref_dir = tmp_path / "raws"
+    ref_dir.mkdir()
+    (ref_dir / "starbash.toml").write_text('[repo]\nkind = "raws"\n')
+    prefs_dir = tmp_path / "prefs"
+    prefs_dir.mkdir()
+    (prefs_dir / "starbash.toml").write_text(
+        '[selection]\ncone = [10.0, 41.0, 1.0]\ndate_start = "2023-01-01"\n\n'
+        f'[[repo-ref]]\ndir = "{ref_dir.as_posix()}"\n'
+    )
+
+    repo_manager = RepoManager()
+    prefs = repo_manager.add_repo(f"file://{prefs_dir}")
+    assert repo_manager.get("selection.cone") == [10.0, 41.0, 1.0]
+
+    assert prefs.unset("selection.cone")
+    assert not prefs.unset("selection.cone")
+    assert not prefs.unset("missing.key")
+    assert repo_manager.get("selection.cone") is None
+    assert repo_manager.get("selection.date_start") == "2023-01-01"
+
+    assert len(repo_manager.get_all("repo-ref")[0]) == 1
+    assert not prefs.remove_repo_ref("file:///not/a/ref")
+    assert prefs.remove_repo_ref(f"file://{ref_dir.as_posix()}")
+    assert repo_manager.get_all("repo-ref") == [[]]
+
+    prefs.write_config()
+    text = (prefs_dir / "starbash.toml").read_text()
+    assert "cone" not in text and "raws" not in text
+    assert 'date_start = "2023-01-01"' in text
@@ -5,9 +5,13 @@ from pathlib import Path
 import pytest
 import tomlkit
 
+from starbash.database import Database
 from starbash.selection import Selection
 from repo import Repo, RepoManager, repo_suffix
 
+# The SQL a selected target name is matched with (any of its names match)
+TARGET = Database.canonical_target_expr("?")
+
 
 @pytest.fixture
 def temp_repo_dir(tmp_path):
@@ -174,6 +178,151 @@ class TestSelectionSave:
             os.chmod(repo_path, old_mode)
 
 
+class TestSelectionTransaction:
+    """Tests for Selection.transaction method."""
+
+    def test_transaction_saves_once(self, selection, user_repo, monkeypatch):
+        """Test that changes made in a transaction are written in a single save."""
+        writes = []
+        real_write_config = user_repo.write_config
+        monkeypatch.setattr(
+            user_repo, "write_config", lambda: writes.append(real_write_config())
+        )
+
+        with selection.transaction():
+            selection.add_target("M31")
+            with selection.transaction():
+                selection.add_filter("Ha")
+                selection.add_filter("OIII")
+            selection.set_date_range("2023-01-01", None)
+            assert writes == []
+        assert len(writes) == 1
+
+        config_path = user_repo.get_path() / repo_suffix
+        saved = tomlkit.parse(config_path.read_text())["selection"]
+        assert saved["targets"] == ["M31"]
+        assert saved["filters"] == ["Ha", "OIII"]
+        assert saved["date_start"] == "2023-01-01"
+
+        # Nothing changed, nothing written
+        with selection.transaction():
+            selection.add_target("M31")
+        assert len(writes) == 1
+
+    def test_transaction_rolls_back(self, selection, user_repo):
+        """Test that a failed transaction restores the selection without saving."""
+        selection.add_target("M31")
+        config_path = user_repo.get_path() / repo_suffix
+        before = config_path.read_text()
+
+        with pytest.raises(RuntimeError):
+            with selection.transaction():
+                selection.add_target("M42")
+                selection.telescopes.append("Vespera")
+                selection.set_date_range(None, "2023-12-31")
+                raise RuntimeError("oops")
+
+        assert selection.targets == ["M31"]
+        assert selection.telescopes == []
+        assert selection.date_end is None
+        assert config_path.read_text() == before
+
+    def test_write_config_is_atomic(self, selection, user_repo, monkeypatch):
+        """Test that a failed write leaves the old config (and no temp files)."""
+        selection.add_target("M31")
+        repo_path = user_repo.get_path()
+        before = (repo_path / repo_suffix).read_text()
+
+        def fail(*args):
+            raise OSError("disk full")
+
+        monkeypatch.setattr("os.fsync", fail)
+        with pytest.raises(OSError):
+            user_repo.write_config()
+        assert (repo_path / repo_suffix).read_text() == before
+        assert [p.name for p in repo_path.iterdir()] == [repo_suffix]
+
+
+class TestSelectionSaved:
+    """Tests for saving and loading named selections."""
+
+    def test_save_as_and_load(self, selection, user_repo):
+        """Test that saved selections persist in the user repo and can be loaded."""
+        selection.targets = ["M31"]
+        selection.date_start = "2023-01-01"
+        selection.save_as("M31 all seasons")
+        assert selection.saved_name() == "M31 all seasons"
+
+        selection.clear()
+        selection.telescopes = ["Seestar"]
+        selection.save_as("Seestar.only")
+        assert selection.saved_names() == ["M31 all seasons", "Seestar.only"]
+
+        # Reloaded from disk, like the next command would
+        reloaded = Selection(user_repo)
+        reloaded.load("M31 all seasons")
+        assert reloaded.targets == ["M31"]
+        assert reloaded.telescopes == []
+        assert reloaded.date_start == "2023-01-01"
+        assert reloaded.saved_name() == "M31 all seasons"
+
+        reloaded.add_filter("Ha")
+        assert reloaded.saved_name() is None
+
+        with pytest.raises(ValueError):
+            reloaded.load("M42")
+
+
+class TestSelectionCone:
+    """Tests for selecting sessions by position on the sky."""
+
+    def test_set_cone_persists(self, selection, user_repo):
+        """Test the cone is saved, summarized, saved as part of named selections."""
+        selection.set_cone(10.68, 41.27, 2.0)
+        assert not selection.is_empty()
+        assert "Position: within 2° of 00h42m43s +41°16'12\"" in (
+            selection.summary()["criteria"]
+        )
+        selection.save_as("Andromeda")
+
+        reloaded = Selection(user_repo)
+        assert reloaded.cone == [10.68, 41.27, 2.0]
+        reloaded.set_cone(None)
+        assert reloaded.is_empty()
+        assert Selection(user_repo).cone is None
+
+        reloaded.load("Andromeda")
+        assert reloaded.cone == [10.68, 41.27, 2.0]
+        reloaded.clear()
+        assert Selection(user_repo).cone is None
+
+    def test_cone_matches_sessions(self, selection, tmp_path):
+        """Test the cone selects sessions whatever their targets are named."""
+        with Database(base_dir=tmp_path) as db:
+            for i, (target, ra, dec) in enumerate(
+                [("M 31", 10.68, 41.27), ("Andromeda", 10.9, 41.5), ("M42", 83.8, -5.4)]
+            ):
+                db.upsert_image(
+                    {
+                        "path": f"/repo/{i}.fit",
+                        "DATE-OBS": f"2023-10-1{i}T20:00:00",
+                        "IMAGETYP": "Light",
+                        "OBJECT": target,
+                        "RA": ra,
+                        "DEC": dec,
+                    }
+                )
+            db.update_sessions()
+
+            selection.set_cone(10.68, 41.27, 1.0)
+            sessions = db.search_session(selection.get_query_conditions())
+            assert sorted(s["object"] for s in sessions) == ["ANDROMEDA", "M31"]
+
+            selection.set_cone(10.68, 41.27, 0.1)
+            sessions = db.search_session(selection.get_query_conditions())
+            assert [s["object"] for s in sessions] == ["M31"]
+
+
 class TestSelectionClear:
     """Tests for Selection.clear method."""
 
@@ -474,16 +623,15 @@ class TestSelectionGetQueryConditions:
         """Test query conditions with a single target."""
         selection.targets = ["M31"]
         where_clause, params = selection.get_query_conditions()
-        assert "OBJECT = ?" in where_clause
+        assert f"OBJECT = {TARGET}" in where_clause
         assert "M31" in params
 
     def test_get_query_conditions_with_multiple_targets(self, selection):
-        """Test query conditions with multiple targets (uses first)."""
+        """Test query conditions with multiple targets (matches any of them)."""
         selection.targets = ["M31", "M42"]
         where_clause, params = selection.get_query_conditions()
-        # Currently returns empty for multiple targets
-        assert where_clause == ""
-        assert params == []
+        assert f"OBJECT IN ({TARGET}, {TARGET})" in where_clause
+        assert params == ["M31", "M42"]
 
     def test_get_query_conditions_with_single_filter(self, selection):
         """Test query conditions with a single filter."""
@@ -493,12 +641,11 @@ class TestSelectionGetQueryConditions:
         assert "Ha" in params
 
     def test_get_query_conditions_with_multiple_filters(self, selection):
-        """Test query conditions with multiple filters (uses first)."""
+        """Test query conditions with multiple filters (matches any of them)."""
         selection.filters = ["Ha", "OIII"]
         where_clause, params = selection.get_query_conditions()
-        # Currently returns empty for multiple filters
-        assert where_clause == ""
-        assert params == []
+        assert "FILTER IN (?, ?)" in where_clause
+        assert params == ["Ha", "OIII"]
 
     def test_get_query_conditions_with_single_telescope(self, selection):
         """Test query conditions with a single telescope."""
@@ -508,12 +655,54 @@ class TestSelectionGetQueryConditions:
         assert "Vespera" in params
 
     def test_get_query_conditions_with_multiple_telescopes(self, selection):
-        """Test query conditions with multiple telescopes (uses first)."""
+        """Test query conditions with multiple telescopes (matches any of them)."""
         selection.telescopes = ["Vespera", "EdgeHD 8"]
         where_clause, params = selection.get_query_conditions()
-        # Currently returns empty for multiple telescopes
-        assert where_clause == ""
-        assert params == []
+        assert "TELESCOP IN (?, ?)" in where_clause
+        assert params == ["Vespera", "EdgeHD 8"]
+
+    def test_get_query_conditions_with_image_types(self, selection):
+        """Test query conditions with image types."""
+        selection.image_types = ["Light", "Flat"]
+        where_clause, params = selection.get_query_conditions()
+        assert "IMAGETYP IN (?, ?)" in where_clause
+        assert params == ["Light", "Flat"]
+
+    def test_get_query_conditions_cached(self, selection):
+        """Test the query is only rebuilt when the selection changes."""
+        selection.targets = ["M31", "M42"]
+        where_clause, params = selection.get_query_conditions()
+        params.append("changed by the caller")
+        again, params = selection.get_query_conditions()
+        assert again is where_clause
+        assert params == ["M31", "M42"]
+
+        selection.targets.append("M33")
+        where_clause, params = selection.get_query_conditions()
+        assert f"OBJECT IN ({TARGET}, {TARGET}, {TARGET})" in where_clause
+        assert params == ["M31", "M42", "M33"]
+
+    def test_get_query_conditions_matches_sessions(self, selection, tmp_path):
+        """Test the query selects the sessions with any of the selected values."""
+        selection.targets = ["M31", "m 42"]
+        selection.filters = ["Ha"]
+        with Database(base_dir=tmp_path) as db:
+            for i, (target, filter) in enumerate(
+                [("M31", "Ha"), ("M42", "Ha"), ("M42", "OIII"), ("M33", "Ha")]
+            ):
+                db.upsert_session(
+                    {
+                        "start": f"2023-10-1{i}T20:00:00",
+                        "end": f"2023-10-1{i}T21:00:00",
+                        "FILTER": filter,
+                        "IMAGETYP": "Light",
+                        "OBJECT": target,
+                        "num-images": 1,
+                        "exptime-total": 60.0,
+                    }
+                )
+            sessions = db.search_session(selection.get_query_conditions())
+            assert [s["object"] for s in sessions] == ["M31", "M42"]
 
     def test_get_query_conditions_with_date_start(self, selection):
         """Test query conditions with date_start."""
@@ -551,7 +740,7 @@ class TestSelectionGetQueryConditions:
 
         assert "start >= ?" in where_clause
         assert "start <= ?" in where_clause
-        assert "OBJECT = ?" in where_clause
+        assert f"OBJECT = {TARGET}" in where_clause
         assert "FILTER = ?" in where_clause
         assert "TELESCOP = ?" in where_clause
         assert "2023-01-01" in params
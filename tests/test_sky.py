@@ -0,0 +1,73 @@
+"""Unit tests for the sky coordinates module."""
+
+import pytest
+
+from starbash.sky import (
+    cone_bounds,
+    format_position,
+    image_position,
+    parse_dec,
+    parse_ra,
+    unit_vector,
+    vector_position,
+)
+
+
+def test_parse_ra():
+    assert parse_ra("00 42 44.3") == pytest.approx(10.6846, abs=1e-4)
+    assert parse_ra("05:35:17") == pytest.approx(83.8208, abs=1e-4)
+    assert parse_ra("5h35m17s") == pytest.approx(83.8208, abs=1e-4)
+    assert parse_ra(10.68) == 10.68
+    assert parse_ra("10.68") == 10.68
+    assert parse_ra(-10.0) == 350.0
+    assert parse_ra("north") is None
+    assert parse_ra(None) is None
+    assert parse_ra(True) is None
+
+
+def test_parse_dec():
+    assert parse_dec("+41 16 09") == pytest.approx(41.2692, abs=1e-4)
+    assert parse_dec("-05 23 28") == pytest.approx(-5.3911, abs=1e-4)
+    assert parse_dec("-00 30 00") == -0.5
+    assert parse_dec(-5.4) == -5.4
+    assert parse_dec(91.0) is None
+    assert parse_dec("") is None
+
+
+def test_image_position():
+    # The decimal keywords win over the text ones
+    header = {"RA": 10.9, "DEC": 41.5, "OBJCTRA": "00 42 44", "OBJCTDEC": "+41 16 09"}
+    assert image_position(header) == (10.9, 41.5)
+    del header["DEC"]
+    ra, dec = image_position(header)  # type: ignore
+    assert ra == pytest.approx(10.6833, abs=1e-4)
+    assert dec == pytest.approx(41.2692, abs=1e-4)
+    assert image_position({"OBJECT": "M31"}) is None
+
+
+def test_unit_vectors_round_trip():
+    for ra, dec in [(0.0, 0.0), (10.68, 41.27), (359.9, -89.0), (180.0, 45.0)]:
+        x, y, z = unit_vector(ra, dec)
+        assert x * x + y * y + z * z == pytest.approx(1.0)
+        assert vector_position((x * 2, y * 2, z * 2)) == (
+            pytest.approx(ra),
+            pytest.approx(dec),
+        )
+
+
+def test_cone_bounds():
+    centre, chord, min_dot = cone_bounds(0.0, 0.0, 60.0)
+    assert centre == pytest.approx((1.0, 0.0, 0.0))
+    assert chord == pytest.approx(1.0)
+    assert min_dot == pytest.approx(0.5)
+
+    # A point just inside the cone is inside the box, and passes the exact check
+    inside = unit_vector(359.0, 59.0)
+    assert all(abs(a - b) <= chord for a, b in zip(inside, centre))
+    assert sum(a * b for a, b in zip(inside, centre)) >= min_dot
+
+
+def test_format_position():
+    assert format_position(10.6846, 41.2692) == "00h42m44s +41°16'09\""
+    assert format_position(83.8208, -5.3911) == "05h35m17s -05°23'28\""
+    assert format_position(359.9999, 0.0) == "00h00m00s +00°00'00\""
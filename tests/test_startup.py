@@ -0,0 +1,69 @@
+"""Tests for startup profiling (sb --profile-startup) and keeping startup light."""
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from typer.testing import CliRunner
+
+import starbash
+from starbash import paths
+from starbash.main import app
+from starbash.startup import parse_importtime
+
+runner = CliRunner(env={"NO_COLOR": "1"})
+
+IMPORTTIME_OUTPUT = """\
+import time: self [us] | cumulative | imported package
+import time:       100 |        100 | encodings
+import time:      2000 |       2000 |       rich.style
+import time:      1000 |       3000 |     rich.console
+import time:       500 |       3500 |   starbash
+import time:      4000 |       4000 |       tomlkit.api
+import time:       300 |       4300 |     tomlkit
+import time:      1000 |       5300 |   starbash.app
+import time:       200 |       9000 | starbash.main
+import time:       700 |        700 | atexit
+"""
+
+
+def test_parse_importtime():
+    total, packages = parse_importtime(IMPORTTIME_OUTPUT, "starbash.main")
+    assert total == 9.0
+    # python's own imports (and ones after the module) aren't counted
+    assert packages == {"rich": 3.0, "starbash": 1.7, "tomlkit": 4.3}
+
+    assert parse_importtime(IMPORTTIME_OUTPUT, "missing") == (0.0, {})
+
+
+def test_cli_import_skips_heavy_modules():
+    """Importing the CLI (i.e. for tab completion) doesn't load the slow packages."""
+    heavy = ["astropy", "numpy", "sentry_sdk", "RestrictedPython"]
+    script = (
+        "import sys, starbash.main; "
+        f"print(' '.join(m for m in {heavy!r} if m in sys.modules))"
+    )
+    src_dir = str(Path(starbash.__file__).parent.parent)
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        env=dict(os.environ, PYTHONPATH=src_dir),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip() == ""
+
+
+def test_profile_startup_command(tmp_path):
+    paths.set_test_directories(tmp_path / "config", tmp_path / "data")
+    try:
+        result = runner.invoke(app, ["--profile-startup"])
+    finally:
+        paths.set_test_directories(None, None)
+    assert result.exit_code == 0
+    assert "Import time" in result.stdout
+    assert "starbash" in result.stdout
+    assert "Init time" in result.stdout
+    assert "database" in result.stdout
+    assert "Cold start:" in result.stdout
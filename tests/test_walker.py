@@ -0,0 +1,78 @@
+"""Tests for the streaming repo walker."""
+
+import os
+from pathlib import Path
+
+from starbash.walker import walk_files
+
+
+def _touch(root: Path, *names: str) -> None:
+    for name in names:
+        p = root / name
+        p.parent.mkdir(parents=True, exist_ok=True)
+        p.write_bytes(b"")
+
+
+def _walk(root: Path, **kwargs) -> list[str]:
+    return [Path(p).relative_to(root).as_posix() for p, _ in walk_files(root, **kwargs)]
+
+
+def test_walk_files_order_and_skips(tmp_path: Path):
+    _touch(
+        tmp_path,
+        "b.fits",
+        "a/z.fit",
+        "a/c/x.fit",
+        "a/notes.txt",
+        ".hidden/h.fit",
+        "process/out.fit",
+        "night/process/out.fit",
+        "night/light.FIT",
+    )
+    os.symlink(tmp_path / "a", tmp_path / "link")
+
+    files = _walk(tmp_path)
+    # In path component order, like sorted(Path.parts)
+    assert files == ["a/c/x.fit", "a/z.fit", "b.fits"]
+    assert files == sorted(files, key=lambda f: Path(f).parts)
+
+
+def test_walk_files_yields_stat(tmp_path: Path):
+    (tmp_path / "a.fit").write_bytes(b"x" * 10)
+    [(path, st)] = list(walk_files(tmp_path))
+    assert path == str(tmp_path / "a.fit")
+    assert st.st_size == 10
+
+
+def test_walk_files_include_exclude(tmp_path: Path):
+    _touch(
+        tmp_path,
+        "lights/a.fit",
+        "lights/a.xisf",
+        "flats/f.fit",
+        "old/lights/b.fit",
+        "lights/rejected_c.fit",
+    )
+    assert _walk(tmp_path, include=["*.xisf"]) == ["lights/a.xisf"]
+    assert _walk(tmp_path, include=["lights/*.fit"]) == [
+        "lights/a.fit",
+        "lights/rejected_c.fit",
+    ]
+    assert _walk(tmp_path, exclude=["old", "rejected_*"]) == [
+        "flats/f.fit",
+        "lights/a.fit",
+    ]
+    assert _walk(tmp_path, exclude=["*/lights"]) == [
+        "flats/f.fit",
+        "lights/a.fit",
+        "lights/rejected_c.fit",
+    ]
+
+
+def test_walk_files_is_lazy(tmp_path: Path):
+    _touch(tmp_path, "a.fit", "b/c.fit")
+    it = walk_files(tmp_path)
+    assert next(it)[0] == str(tmp_path / "a.fit")
+    # Directories are only read as the walk reaches them
+    (tmp_path / "b" / "d.fit").write_bytes(b"")
+    assert [Path(p).name for p, _ in it] == ["c.fit", "d.fit"]
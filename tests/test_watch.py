@@ -0,0 +1,90 @@
+"""Tests for watching repos for new files."""
+
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from starbash.watch import (
+    Debouncer,
+    InotifyWatcher,
+    PollingWatcher,
+    WatchRoot,
+    create_watcher,
+)
+
+
+def _poll_until(watcher, want: set[str], timeout: float = 5.0) -> set[str]:
+    found: set[str] = set()
+    deadline = time.monotonic() + timeout
+    while not want <= found and time.monotonic() < deadline:
+        found.update(f for f, _ in watcher.poll(0.1))
+    return found
+
+
+def test_debouncer_waits_for_file_to_settle(tmp_path: Path):
+    f = tmp_path / "a.fit"
+    f.write_bytes(b"x")
+    debouncer = Debouncer(settle=2.0)
+
+    debouncer.changed([(str(f), f.stat())], now=100.0)
+    assert debouncer.ready(now=101.0) == []
+
+    # Still being written - the clock restarts
+    with open(f, "ab") as out:
+        out.write(b"more")
+    assert debouncer.ready(now=102.5) == []
+    assert debouncer.ready(now=104.0) == []
+    [(path, st)] = debouncer.ready(now=104.5)
+    assert path == str(f) and st.st_size == 5
+    assert debouncer.pending == {}
+
+    # Files which vanish before settling are dropped
+    debouncer.changed([(str(f), f.stat())], now=200.0)
+    f.unlink()
+    assert debouncer.ready(now=300.0) == []
+    assert debouncer.pending == {}
+
+
+def test_polling_watcher(tmp_path: Path):
+    (tmp_path / "old.fit").write_bytes(b"")
+    watcher = PollingWatcher([WatchRoot(tmp_path)], interval=0)
+    assert watcher.poll(0.01) == []
+
+    (tmp_path / "night").mkdir()
+    (tmp_path / "night" / "new.fit").write_bytes(b"")
+    (tmp_path / "night" / "notes.txt").write_bytes(b"")
+    assert [f for f, _ in watcher.poll(0.01)] == [str(tmp_path / "night" / "new.fit")]
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="Linux only")
+def test_inotify_watcher(tmp_path: Path):
+    (tmp_path / ".hidden").mkdir()
+    watcher = InotifyWatcher([WatchRoot(tmp_path, exclude=["rejected_*"])])
+    try:
+        assert watcher.poll(0.01) == []
+
+        # New files in new (nested) directories are seen
+        night = tmp_path / "night" / "lights"
+        night.mkdir(parents=True)
+        (night / "a.fit").write_bytes(b"")
+        later = night / "b.fit"
+        found = _poll_until(watcher, {str(night / "a.fit")})
+        later.write_bytes(b"")
+        found |= _poll_until(watcher, {str(later)})
+        assert found == {str(night / "a.fit"), str(later)}
+
+        # Unwanted files are not reported
+        (tmp_path / ".hidden" / "c.fit").write_bytes(b"")
+        (tmp_path / "rejected_d.fit").write_bytes(b"")
+        (tmp_path / "notes.txt").write_bytes(b"")
+        assert _poll_until(watcher, {"never"}, timeout=0.3) == set()
+    finally:
+        watcher.close()
+
+
+def test_create_watcher_poll(tmp_path: Path):
+    watcher = create_watcher([WatchRoot(tmp_path)], poll=True)
+    assert isinstance(watcher, PollingWatcher)
+    watcher.close()